@@ -0,0 +1,234 @@
+import os
+import sys
+import math
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+import embedding_store
+ANN_BACKEND = os.getenv("ANN_BACKEND", "exact").lower()
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "20000"))
+ANN_REFINE = int(os.getenv("ANN_REFINE", "4"))
+def _env_int(name, default):
+    v = os.getenv(name)
+    return int(v) if v else default
+def _as_query(q):
+    import numpy as np
+    q = np.asarray(q, dtype=np.float32)
+    if q.ndim == 1:
+        q = q[None, :]
+    norms = np.linalg.norm(q, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(q / norms)
+def exact_search(embs, q, k):
+    import numpy as np
+    q = _as_query(q)
+    k = min(int(k), embs.shape[0])
+    if k <= 0:
+        return np.zeros((q.shape[0], 0), dtype=np.float32), np.zeros((q.shape[0], 0), dtype=np.int64)
+    sims = q @ np.asarray(embs).T
+    if k < sims.shape[1]:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(sims.shape[1]), (sims.shape[0], 1))
+    part_sims = np.take_along_axis(sims, part, axis=1)
+    order = np.argsort(-part_sims, axis=1, kind="stable")
+    idxs = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(sims, idxs, axis=1), idxs.astype(np.int64)
+class ExactIndex:
+    name = "exact"
+    def __init__(self, embs, **params):
+        self.embs = embs
+    def build(self):
+        return self
+    def search(self, q, k):
+        return exact_search(self.embs, q, k)
+    def save(self, path):
+        return
+    def load(self, path):
+        return self
+class _ANNBase:
+    name = None
+    ext = None
+    def __init__(self, embs, refine=None, **params):
+        self.embs = embs
+        self.refine = max(1, int(refine if refine is not None else ANN_REFINE))
+        self.params = params
+        self.index = None
+    def _raw_search(self, q, k):
+        raise NotImplementedError
+    def search(self, q, k):
+        import numpy as np
+        q = _as_query(q)
+        n = self.embs.shape[0]
+        k = min(int(k), n)
+        if k <= 0:
+            return np.zeros((q.shape[0], 0), dtype=np.float32), np.zeros((q.shape[0], 0), dtype=np.int64)
+        cand = self._raw_search(q, min(n, k * self.refine))
+        out_s = np.full((q.shape[0], k), -1.0, dtype=np.float32)
+        out_i = np.full((q.shape[0], k), -1, dtype=np.int64)
+        for row in range(q.shape[0]):
+            ids = cand[row]
+            ids = ids[ids >= 0]
+            if ids.size == 0:
+                continue
+            ids = np.unique(ids)
+            exact = np.asarray(self.embs[ids]) @ q[row]
+            order = np.argsort(-exact, kind="stable")[:k]
+            out_s[row, :order.size] = exact[order]
+            out_i[row, :order.size] = ids[order]
+        return out_s, out_i
+class HNSWIndex(_ANNBase):
+    name = "hnsw"
+    ext = "hnsw"
+    def __init__(self, embs, M=None, ef_construction=None, ef_search=None, **params):
+        super().__init__(embs, **params)
+        self.M = M or _env_int("HNSW_M", 32)
+        self.ef_construction = ef_construction or _env_int("HNSW_EF_CONSTRUCTION", 200)
+        self.ef_search = ef_search or _env_int("HNSW_EF_SEARCH", 64)
+        self._lock = threading.Lock()
+    def _new(self):
+        import hnswlib
+        return hnswlib.Index(space="ip", dim=int(self.embs.shape[1]))
+    def build(self):
+        import numpy as np
+        self.index = self._new()
+        n = int(self.embs.shape[0])
+        self.index.init_index(max_elements=n, ef_construction=self.ef_construction, M=self.M)
+        step = 100000
+        for start in range(0, n, step):
+            block = np.asarray(self.embs[start:start + step], dtype=np.float32)
+            self.index.add_items(block, np.arange(start, start + block.shape[0]))
+        self.index.set_ef(self.ef_search)
+        return self
+    def set_ef(self, ef_search):
+        with self._lock:
+            self.ef_search = int(ef_search)
+            if self.index is not None:
+                self.index.set_ef(self.ef_search)
+    def _raw_search(self, q, k):
+        import numpy as np
+        labels, _ = self.index.knn_query(q, k=k)
+        return np.asarray(labels, dtype=np.int64)
+    def save(self, path):
+        self.index.save_index(str(path))
+    def load(self, path):
+        self.index = self._new()
+        self.index.load_index(str(path), max_elements=int(self.embs.shape[0]))
+        self.index.set_ef(self.ef_search)
+        return self
+class IVFPQIndex(_ANNBase):
+    name = "ivfpq"
+    ext = "ivfpq"
+    def __init__(self, embs, nlist=None, nprobe=None, pq_m=None, pq_nbits=None, **params):
+        super().__init__(embs, **params)
+        n = int(embs.shape[0])
+        self.nlist = nlist or _env_int("IVF_NLIST", max(1, int(4 * math.sqrt(n))))
+        self.nprobe = nprobe or _env_int("IVF_NPROBE", 16)
+        self.pq_m = pq_m or _env_int("PQ_M", 48)
+        self.pq_nbits = pq_nbits or _env_int("PQ_NBITS", 8)
+    def build(self):
+        import numpy as np
+        import faiss
+        d = int(self.embs.shape[1])
+        n = int(self.embs.shape[0])
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, self.nlist, self.pq_m, self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        n_train = min(n, max(self.nlist * 64, 2 ** self.pq_nbits * 64))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(n, size=n_train, replace=False))
+        index.train(np.asarray(self.embs[sample], dtype=np.float32))
+        step = 100000
+        for start in range(0, n, step):
+            index.add(np.asarray(self.embs[start:start + step], dtype=np.float32))
+        self.index = index
+        self.set_nprobe(self.nprobe)
+        return self
+    def set_nprobe(self, nprobe):
+        self.nprobe = int(nprobe)
+        if self.index is not None:
+            self.index.nprobe = self.nprobe
+    def _raw_search(self, q, k):
+        import numpy as np
+        _, labels = self.index.search(q, k)
+        return np.asarray(labels, dtype=np.int64)
+    def save(self, path):
+        import faiss
+        faiss.write_index(self.index, str(path))
+    def load(self, path):
+        import faiss
+        self.index = faiss.read_index(str(path))
+        self.set_nprobe(self.nprobe)
+        return self
+BACKENDS = {"exact": ExactIndex, "hnsw": HNSWIndex, "ivfpq": IVFPQIndex}
+def index_path(key, backend):
+    cls = BACKENDS[backend]
+    return embedding_store.STORE_DIR.joinpath(f"hotpot_{key}.{cls.ext}")
+def load_or_build(embs, key=None, backend=None, save=True, min_rows=None, **params):
+    backend = (backend or ANN_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown ANN backend: {backend}")
+    min_rows = ANN_MIN_ROWS if min_rows is None else min_rows
+    if backend == "exact" or embs.shape[0] < min_rows:
+        return ExactIndex(embs)
+    idx = BACKENDS[backend](embs, **params)
+    key = key or embedding_store.store_key()
+    path = index_path(key, backend) if key else None
+    if path is not None and path.exists():
+        try:
+            return idx.load(path)
+        except Exception:
+            pass
+    idx.build()
+    if save and path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        idx.save(tmp)
+        os.replace(tmp, path)
+    return idx
+def recall_at_k(index, embs, queries, k=10):
+    _, exact = exact_search(embs, queries, k)
+    _, approx = index.search(queries, k)
+    hits = 0
+    for e_row, a_row in zip(exact, approx):
+        hits += len(set(e_row.tolist()) & set(a_row.tolist()))
+    return hits / float(max(1, exact.size))
+def sample_queries(embs, n=200, noise=0.05, seed=0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(embs.shape[0], size=min(n, embs.shape[0]), replace=False)
+    q = np.asarray(embs[np.sort(rows)], dtype=np.float32)
+    q = q + rng.normal(scale=noise, size=q.shape).astype(np.float32)
+    return _as_query(q)
+def main(argv=None):
+    import argparse
+    import time
+    ap = argparse.ArgumentParser(description="Build the ANN index over the fallback embedding store and report recall@k")
+    ap.add_argument("--backend", default=ANN_BACKEND if ANN_BACKEND != "exact" else "hnsw", choices=[b for b in BACKENDS if b != "exact"])
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--rebuild", action="store_true")
+    args = ap.parse_args(argv)
+    embs = embedding_store.load_embeddings()
+    if embs is None:
+        print("embedding store missing; run `python embedding_store.py` first", file=sys.stderr)
+        return 1
+    key = embedding_store.store_key()
+    path = index_path(key, args.backend)
+    if args.rebuild and path.exists():
+        path.unlink()
+    t0 = time.perf_counter()
+    idx = load_or_build(embs, key=key, backend=args.backend, min_rows=0)
+    print(f"{args.backend} index ready in {time.perf_counter() - t0:.2f}s: {path}")
+    queries = sample_queries(embs, n=args.queries)
+    t0 = time.perf_counter()
+    exact_search(embs, queries, args.k)
+    t_exact = (time.perf_counter() - t0) / len(queries)
+    t0 = time.perf_counter()
+    for q in queries:
+        idx.search(q, args.k)
+    t_ann = (time.perf_counter() - t0) / len(queries)
+    print(f"recall@{args.k}: {recall_at_k(idx, embs, queries, args.k):.4f}")
+    print(f"exact: {t_exact * 1000:.3f} ms/query (batched)  {args.backend}: {t_ann * 1000:.3f} ms/query")
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+load_dotenv()
+import tracing
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1").lower() not in ("0", "false", "no", "off")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+def normalize(question):
+    return " ".join(str(question).lower().split())
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return "-"
+def fingerprint():
+    import ingest
+    import retriever
+    from model_registry import model_key
+    parts = [_stamp(retriever.RETRIEVAL_PATH), _stamp(retriever.HOTPOT_PATH), _stamp(ingest._manifest_path(ingest.LIVE_DIR)),
+             retriever.RETRIEVAL_MODE, retriever.RETRIEVAL_SHARDS, model_key()]
+    return hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:16]
+def embed(question, model=None):
+    import numpy as np
+    if model is None:
+        from model_registry import get_model, is_loaded
+        if not is_loaded():
+            return None
+        model = get_model()
+    v = np.asarray(model.encode(question, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32).reshape(-1)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else None
+class AnswerCache:
+    def __init__(self, capacity=None, threshold=None, ttl_s=None, fingerprint_fn=None):
+        import numpy as np
+        self.capacity = int(capacity or ANSWER_CACHE_SIZE)
+        self.threshold = float(ANSWER_CACHE_THRESHOLD if threshold is None else threshold)
+        self.ttl_s = float(ANSWER_CACHE_TTL_S if ttl_s is None else ttl_s)
+        self.fingerprint_fn = fingerprint_fn or fingerprint
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._vecs = None
+        self._live = np.zeros(self.capacity, dtype=bool)
+        self._scope = [None] * self.capacity
+        self._slot_key = [None] * self.capacity
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._fingerprint = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        slot = entry["slot"]
+        if slot is not None:
+            self._live[slot] = False
+            self._scope[slot] = None
+            self._slot_key[slot] = None
+            self._free.append(slot)
+    def _check_fingerprint(self):
+        fp = self.fingerprint_fn()
+        if fp != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+                tracing.incr("answer_cache_invalidations")
+            for key in list(self._entries):
+                self._drop(key)
+            self._fingerprint = fp
+    def _expired(self, entry, now):
+        return self.ttl_s > 0 and now - entry["stored"] > self.ttl_s
+    def _hit(self, key, entry, kind, similarity):
+        self._entries.move_to_end(key)
+        entry["hits"] += 1
+        self.hits += 1
+        if kind == "semantic":
+            self.semantic_hits += 1
+        tracing.incr(f"answer_cache_{kind}_hits")
+        return entry["value"], {"hit": kind, "similarity": similarity, "question": entry["question"], "age_s": time.time() - entry["stored"]}
+    def lookup(self, question, scope=(), q_emb=None):
+        import numpy as np
+        scope = tuple(scope)
+        key = (normalize(question), scope)
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                return self._hit(key, entry, "exact", 1.0)
+            if q_emb is not None and self._vecs is not None and self._live.any():
+                from gnn_impl import entities
+                sims = self._vecs @ np.asarray(q_emb, dtype=np.float32).reshape(-1)
+                sims[~self._live] = -1.0
+                ents = entities(question)
+                for slot in np.argsort(-sims)[:8].tolist():
+                    if sims[slot] < self.threshold:
+                        break
+                    if self._scope[slot] != scope:
+                        continue
+                    cand_key = self._slot_key[slot]
+                    cand = self._entries[cand_key]
+                    if self._expired(cand, now):
+                        self._drop(cand_key)
+                        self.expirations += 1
+                        continue
+                    if entities(cand["question"]) != ents:
+                        continue
+                    return self._hit(cand_key, cand, "semantic", float(sims[slot]))
+            self.misses += 1
+        tracing.incr("answer_cache_misses")
+        return None, None
+    def store(self, question, value, scope=(), q_emb=None):
+        import numpy as np
+        scope = tuple(scope)
+        key = (normalize(question), scope)
+        with self._lock:
+            self._check_fingerprint()
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.capacity or (q_emb is not None and not self._free):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            slot = None
+            if q_emb is not None:
+                v = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+                if self._vecs is None or self._vecs.shape[1] != v.shape[0]:
+                    for k in [k for k, e in self._entries.items() if e["slot"] is not None]:
+                        self._drop(k)
+                    self._vecs = np.zeros((self.capacity, v.shape[0]), dtype=np.float32)
+                slot = self._free.pop()
+                self._vecs[slot] = v
+                self._live[slot] = True
+                self._scope[slot] = scope
+                self._slot_key[slot] = key
+            self._entries[key] = {"question": question, "value": value, "slot": slot, "stored": time.time(), "hits": 0}
+            self.stores += 1
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"enabled": ANSWER_CACHE_ENABLED, "size": len(self._entries), "capacity": self.capacity, "threshold": self.threshold, "ttl_s": self.ttl_s,
+                    "hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses, "hit_rate": self.hits / float(lookups) if lookups else 0.0,
+                    "stores": self.stores, "evictions": self.evictions, "expirations": self.expirations, "invalidations": self.invalidations,
+                    "fingerprint": self._fingerprint}
+_cache = None
+_cache_lock = threading.Lock()
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
+def lookup(question, scope=(), model=None):
+    if not ANSWER_CACHE_ENABLED:
+        return None, None, None
+    with tracing.stage("answer_cache_lookup") as st:
+        try:
+            q_emb = embed(question, model)
+        except Exception:
+            q_emb = None
+        value, info = get_cache().lookup(question, scope, q_emb)
+        st.set(hit=info["hit"] if info else None)
+    return value, info, q_emb
+def store(question, value, scope=(), q_emb=None, model=None):
+    if not ANSWER_CACHE_ENABLED:
+        return
+    if q_emb is None:
+        try:
+            q_emb = embed(question, model)
+        except Exception:
+            q_emb = None
+    get_cache().store(question, value, scope, q_emb)
+def cached_call(question, scope, compute, model=None, keep=None):
+    value, info, q_emb = lookup(question, scope, model)
+    if info is not None:
+        return value, info
+    value = compute()
+    if keep is None or keep(value):
+        store(question, value, scope, q_emb, model)
+    return value, None
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check the semantic answer cache: hit rate and latency on paraphrased questions")
+    ap.add_argument("questions", nargs="+", help="questions to run; repeats and paraphrases should hit")
+    ap.add_argument("--top-k", type=int, default=int(os.getenv("TOP_K", "5")))
+    args = ap.parse_args(argv)
+    from pipeline import SIM_THRESHOLD, final_status, is_conclusion, parse_claims_from_llm, score_verdicts, verify_with_annotations
+    from llm_client import ask_llm, is_failure
+    from model_registry import get_model
+    from retriever import retrieve
+    model = get_model()
+    def run(question):
+        retrieved = retrieve(question, top_k=args.top_k, model=model)
+        answer = ask_llm(question, retrieved)
+        parsed = [p for p in parse_claims_from_llm(answer) if not is_conclusion(p.get("claim", ""))]
+        verif = verify_with_annotations([p["claim"] for p in parsed], [p.get("annotated_idx") for p in parsed], retrieved, sim_threshold=SIM_THRESHOLD)
+        score = score_verdicts(verif)
+        return {"answer": answer, "score": score, "status": final_status(score), "llm_failed": is_failure(answer)}
+    for q in args.questions:
+        t0 = time.perf_counter()
+        out, info = cached_call(q, ("cli", args.top_k), lambda: run(q), model=model, keep=lambda out: not out["llm_failed"])
+        hit = f"{info['hit']} hit ({info['similarity']:.3f} vs {info['question']!r})" if info else "miss"
+        print(f"{(time.perf_counter() - t0) * 1000.0:8.1f} ms  {hit}  {out['status']}  {q}")
+    print(get_cache().stats())
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+load_dotenv()
+_DONE = object()
+QUESTION_KEYS = ("question", "query", "title")
+ID_KEYS = ("id", "_id", "qid", "request_id")
+def iter_questions(path, question_key=None):
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            keys = (question_key,) if question_key else QUESTION_KEYS
+            question = next((obj[k] for k in keys if isinstance(obj.get(k), str) and obj[k].strip()), None)
+            if question is None:
+                continue
+            qid = next((str(obj[k]) for k in ID_KEYS if obj.get(k) is not None), f"line_{n}")
+            yield {"id": qid, "question": question, "source": obj}
+LLM_FAILURE_PREFIXES = ("LLM error:", "LLM not configured")
+def _failed_row(row):
+    return bool(row.get("llm_failed") or row.get("verify_failed")) or str(row.get("answer", "")).startswith(LLM_FAILURE_PREFIXES)
+def _last_good_rows(path):
+    last = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            try:
+                row = json.loads(line)
+                qid = row["id"]
+            except Exception:
+                continue
+            if _failed_row(row):
+                last.pop(qid, None)
+            else:
+                last[qid] = n
+    return last
+def completed_ids(path):
+    if not os.path.exists(path):
+        return set()
+    return set(_last_good_rows(path))
+def compact_output(path):
+    if not os.path.exists(path):
+        return set()
+    last = _last_good_rows(path)
+    keep = set(last.values())
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(path, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for n, line in enumerate(src):
+            if n in keep:
+                dst.write(line if line.endswith("\n") else line + "\n")
+    os.replace(tmp, path)
+    return set(last)
+def _take_batch(q, max_items, max_wait):
+    first = q.get()
+    if first is _DONE:
+        return [], True
+    batch = [first]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_items:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = q.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+    return batch, False
+def _init_verify_worker(threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    try:
+        import verifier
+        verifier.warmup()
+    except Exception:
+        pass
+def _verify_batch(batch, sim_threshold):
+    from pipeline import verify_many_with_annotations
+    t0 = time.perf_counter()
+    out = verify_many_with_annotations(batch, sim_threshold=sim_threshold)
+    return out, time.perf_counter() - t0
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.counts = {}
+        self.busy = {}
+    def add(self, stage, n, seconds):
+        with self.lock:
+            self.counts[stage] = self.counts.get(stage, 0) + n
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            done = self.counts.get("written", 0)
+            return {
+                "elapsed_s": round(elapsed, 2),
+                "written": done,
+                "questions_per_s": round(done / elapsed, 3) if elapsed else 0.0,
+                "stage_counts": dict(self.counts),
+                "stage_busy_s": {k: round(v, 2) for k, v in self.busy.items()},
+            }
+class BatchRunner:
+    def __init__(self, input_path, output_path, top_k=5, rerank=True, question_key=None, queue_size=256,
+                 retrieve_threads=4, llm_batch=32, llm_concurrency=None, verify_batch=16, verify_workers=None,
+                 sim_threshold=None, report_every=10.0, resume=True):
+        from pipeline import SIM_THRESHOLD
+        self.input_path = input_path
+        self.output_path = output_path
+        self.top_k = int(top_k)
+        self.rerank = rerank
+        self.question_key = question_key
+        self.queue_size = queue_size
+        self.retrieve_threads = retrieve_threads
+        self.llm_batch = llm_batch
+        self.llm_concurrency = llm_concurrency
+        self.verify_batch = verify_batch
+        self.verify_workers = verify_workers if verify_workers is not None else max(1, (os.cpu_count() or 2) // 2)
+        self.sim_threshold = SIM_THRESHOLD if sim_threshold is None else sim_threshold
+        self.report_every = report_every
+        self.resume = resume
+        self.stats = Stats()
+        self.errors = []
+        self.error = None
+    def _stage(self, name, target, out_q, *args):
+        def run():
+            try:
+                target(*args, out_q)
+            except BaseException as e:
+                self.errors.append(f"{name}: {e!r}")
+                if self.error is None:
+                    self.error = e
+            finally:
+                out_q.put(_DONE)
+        t = threading.Thread(target=run, name=f"batch-{name}", daemon=True)
+        t.start()
+        return t
+    def _read(self, skip, out_q):
+        for item in iter_questions(self.input_path, self.question_key):
+            if item["id"] in skip:
+                continue
+            skip.add(item["id"])
+            out_q.put(item)
+    def _retrieve_one(self, item):
+        import tracing
+        with tracing.trace("batch", id=item["id"]) as trace:
+            self._retrieve_traced(item)
+        item["match"] = trace.attrs.get("match")
+        return item
+    def _retrieve_traced(self, item):
+        from retriever import retrieve, rerank_candidates
+        t0 = time.perf_counter()
+        try:
+            candidates = retrieve(item["question"], top_k=max(50, self.top_k))
+            if self.rerank:
+                try:
+                    candidates = rerank_candidates(item["question"], candidates, top_k=self.top_k)
+                except Exception:
+                    candidates = candidates[:self.top_k]
+            item["retrieved"] = candidates[:self.top_k]
+        except Exception as e:
+            item["retrieved"] = []
+            item["retrieve_error"] = str(e)
+        item["timings"] = {"retrieve_s": time.perf_counter() - t0}
+    def _retrieve(self, in_q, out_q):
+        with ThreadPoolExecutor(self.retrieve_threads) as pool:
+            while True:
+                batch, done = _take_batch(in_q, self.retrieve_threads * 4, 0.05)
+                if batch:
+                    t0 = time.perf_counter()
+                    for item in pool.map(self._retrieve_one, batch):
+                        out_q.put(item)
+                    self.stats.add("retrieve", len(batch), time.perf_counter() - t0)
+                if done:
+                    break
+    def _llm(self, in_q, out_q):
+        from llm_client import ask_llm_many, is_failure
+        from pipeline import is_conclusion, parse_claims_from_llm
+        while True:
+            batch, done = _take_batch(in_q, self.llm_batch, 0.2)
+            if batch:
+                t0 = time.perf_counter()
+                answers = ask_llm_many([(it["question"], it["retrieved"]) for it in batch], concurrency=self.llm_concurrency)
+                elapsed = time.perf_counter() - t0
+                for it, answer in zip(batch, answers):
+                    it["answer"] = answer
+                    it["llm_failed"] = is_failure(answer)
+                    parsed = [p for p in parse_claims_from_llm(answer) if not is_conclusion(p.get("claim", ""))]
+                    it["claims"] = [p["claim"] for p in parsed]
+                    it["annotated"] = [p.get("annotated_idx") for p in parsed]
+                    it["timings"]["llm_batch_s"] = elapsed
+                    out_q.put(it)
+                self.stats.add("llm", len(batch), elapsed)
+            if done:
+                break
+    def _verify(self, in_q, out_q):
+        threads = max(1, (os.cpu_count() or 2) // self.verify_workers)
+        slots = threading.Semaphore(self.verify_workers * 2)
+        pending = []
+        def finish(batch, fut):
+            try:
+                results, seconds = fut.result()
+            except Exception as e:
+                from pipeline import _empty_verdict
+                results, seconds = [[_empty_verdict(c, str(e)) for c in it["claims"]] for it in batch], 0.0
+                self.errors.append(f"verify: {e!r}")
+                for it in batch:
+                    it["verify_failed"] = True
+            for it, verif in zip(batch, results):
+                it["verif"] = verif
+                it["timings"]["verify_batch_s"] = seconds
+                out_q.put(it)
+            self.stats.add("verify", len(batch), seconds)
+            slots.release()
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.verify_workers, mp_context=ctx, initializer=_init_verify_worker, initargs=(threads,)) as pool:
+            while True:
+                batch, done = _take_batch(in_q, self.verify_batch, 0.1)
+                if batch:
+                    slots.acquire()
+                    payload = [(it["claims"], it["annotated"], it["retrieved"]) for it in batch]
+                    fut = pool.submit(_verify_batch, payload, self.sim_threshold)
+                    fut.add_done_callback(lambda f, b=batch: finish(b, f))
+                    pending.append(fut)
+                if done:
+                    break
+            for fut in pending:
+                try:
+                    fut.result()
+                except Exception:
+                    pass
+    def _write(self, in_q, out):
+        from pipeline import final_status, score_verdicts
+        last_report = time.monotonic()
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                break
+            score = score_verdicts(item["verif"])
+            record = {
+                "id": item["id"],
+                "question": item["question"],
+                "retrieved": item["retrieved"],
+                "match": item.get("match"),
+                "answer": item["answer"],
+                "verification": item["verif"],
+                "score": score,
+                "status": final_status(score),
+                "timings": item["timings"],
+            }
+            if item.get("retrieve_error"):
+                record["retrieve_error"] = item["retrieve_error"]
+            if item.get("llm_failed"):
+                record["llm_failed"] = True
+            if item.get("verify_failed"):
+                record["verify_failed"] = True
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            self.stats.add("written", 1, 0.0)
+            if self.report_every and time.monotonic() - last_report >= self.report_every:
+                last_report = time.monotonic()
+                print(json.dumps(self.stats.snapshot()), file=sys.stderr, flush=True)
+    def run(self):
+        skip = compact_output(self.output_path) if self.resume else set()
+        existing = len(skip)
+        mode = "a" if self.resume else "w"
+        qs = [queue.Queue(self.queue_size) for _ in range(4)]
+        with open(self.output_path, mode, encoding="utf-8") as out:
+            threads = [
+                self._stage("read", self._read, qs[0], skip),
+                self._stage("retrieve", self._retrieve, qs[1], qs[0]),
+                self._stage("llm", self._llm, qs[2], qs[1]),
+                self._stage("verify", self._verify, qs[3], qs[2]),
+            ]
+            self._write(qs[3], out)
+            if self.error is not None:
+                raise self.error
+            for t in threads:
+                t.join()
+        snap = self.stats.snapshot()
+        snap["skipped_existing"] = existing
+        from tracing import METRICS
+        snap["events"] = METRICS.snapshot()["events"]
+        if self.errors:
+            snap["errors"] = self.errors
+        return snap
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Run retrieve -> LLM -> claim parsing -> verification over a JSONL file of questions")
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--question-key", default=None, help=f"field holding the question (default: first of {', '.join(QUESTION_KEYS)})")
+    ap.add_argument("--top-k", type=int, default=int(os.getenv("TOP_K", "5")))
+    ap.add_argument("--no-rerank", action="store_true")
+    ap.add_argument("--retrieve-threads", type=int, default=4)
+    ap.add_argument("--llm-batch", type=int, default=32)
+    ap.add_argument("--llm-concurrency", type=int, default=None)
+    ap.add_argument("--verify-batch", type=int, default=16, help="questions per verification batch")
+    ap.add_argument("--verify-workers", type=int, default=None, help="verification processes (default: half the cores)")
+    ap.add_argument("--queue-size", type=int, default=256)
+    ap.add_argument("--report-every", type=float, default=10.0)
+    ap.add_argument("--no-resume", action="store_true", help="overwrite the output instead of skipping finished ids")
+    args = ap.parse_args(argv)
+    runner = BatchRunner(
+        args.input, args.output, top_k=args.top_k, rerank=not args.no_rerank, question_key=args.question_key,
+        queue_size=args.queue_size, retrieve_threads=args.retrieve_threads, llm_batch=args.llm_batch,
+        llm_concurrency=args.llm_concurrency, verify_batch=args.verify_batch, verify_workers=args.verify_workers,
+        report_every=args.report_every, resume=not args.no_resume,
+    )
+    summary = runner.run()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary.get("errors") else 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import sys
+import json
+import time
+import random
+import difflib
+import argparse
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fuzzy_index import FuzzyIndex
+WH = ["what", "which", "who", "when", "where", "how many", "in what year"]
+COMMON = ["the", "of", "is", "was", "a", "in", "director", "film", "city", "born", "band", "album", "river", "county", "author", "novel", "company", "founded", "located", "played", "team", "based", "american", "british", "state"]
+def _name(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+def make_keys(n, seed=0):
+    rng = random.Random(seed)
+    keys = set()
+    while len(keys) < n:
+        words = [rng.choice(WH)]
+        for _ in range(rng.randint(6, 14)):
+            words.append(_name(rng) if rng.random() < 0.3 else rng.choice(COMMON))
+        keys.add(" ".join(words) + "?")
+    return list(keys)
+def perturb(s, rng, edits):
+    chars = list(s)
+    for _ in range(edits):
+        op = rng.random()
+        pos = rng.randrange(len(chars))
+        if op < 0.4:
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        elif op < 0.7:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice("abcdefghijklmnopqrstuvwxyz "))
+    return "".join(chars)
+def make_queries(keys, n, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        base = rng.choice(keys)
+        if i % 4 == 3:
+            out.append(perturb(base, rng, len(base) // 2))
+        else:
+            out.append(perturb(base, rng, rng.randint(1, max(1, len(base) // 8))))
+    return out
+def run(size, n_queries, scan_budget, cutoff=0.7):
+    keys = make_keys(size)
+    queries = make_queries(keys, n_queries)
+    t0 = time.perf_counter()
+    idx = FuzzyIndex(keys)
+    build_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    indexed = [idx.get_close_match(q, cutoff=cutoff) for q in queries]
+    index_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    scanned = []
+    t0 = time.perf_counter()
+    for q in queries:
+        scanned.append((difflib.get_close_matches(q, keys, n=1, cutoff=cutoff) or [None])[0])
+        if len(scanned) >= 3 and time.perf_counter() - t0 > scan_budget:
+            break
+    scan_ms = (time.perf_counter() - t0) * 1000 / len(scanned)
+    agree = sum(1 for a, b in zip(scanned, indexed) if a == b)
+    return {
+        "keys": size,
+        "build_s": round(build_s, 3),
+        "index_ms_per_query": round(index_ms, 4),
+        "difflib_ms_per_query": round(scan_ms, 3),
+        "speedup": round(scan_ms / index_ms, 1) if index_ms else None,
+        "agreement": f"{agree}/{len(scanned)}",
+        "index_hit_rate": round(sum(1 for m in indexed if m is not None) / len(indexed), 3),
+    }
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark FuzzyIndex against difflib.get_close_matches")
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--scan-budget", type=float, default=60.0, help="seconds of difflib scanning per size (at least 3 queries)")
+    args = ap.parse_args(argv)
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        print(json.dumps(run(size, args.queries, args.scan_budget)), flush=True)
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
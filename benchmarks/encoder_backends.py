@@ -0,0 +1,124 @@
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import synth
+def make_requests(n, claims, snippets, rng):
+    requests = []
+    for _ in range(n):
+        retrieved = synth.make_snippets(snippets, rng)
+        out = []
+        for j in range(claims):
+            if j % 2 == 0:
+                sents = rng.choice(retrieved)["snippet"].split(". ")
+                out.append(synth.perturb(rng.choice(sents), rng, edits=rng.randint(0, 6)))
+            else:
+                out.append(synth.make_claims(1, rng)[0])
+        requests.append((out, retrieved))
+    return requests
+def throughput(model, texts, repeat, batch_size):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return len(texts) / best
+def single_latency(model, texts):
+    samples = []
+    for t in texts:
+        t0 = time.perf_counter()
+        model.encode(t, convert_to_numpy=True, normalize_embeddings=True)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {"p50_ms": samples[len(samples) // 2], "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))], "mean_ms": statistics.fmean(samples)}
+def verification_scores(model, requests, threshold):
+    import verifier
+    from evidence_cache import get_cache
+    cache = get_cache()
+    cache.clear()
+    cache.cache_dir = None
+    results = verifier.verify_claims_many(requests, sim_threshold=threshold, embedder=model)
+    return [r["prob_supported"] for res in results for r in res]
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compare encoder backends: verification-score parity and CPU throughput")
+    ap.add_argument("--backends", default="torch,torch-int8,onnx-int8", help="comma separated; the first one is the reference")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--texts", type=int, default=2000)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--claims", type=int, default=6)
+    ap.add_argument("--snippets", type=int, default=5)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--threshold", type=float, default=0.65)
+    ap.add_argument("--min-agreement", type=float, default=0.98, help="minimum fraction of claims with the same supported verdict")
+    ap.add_argument("--max-diff", type=float, default=0.05, help="maximum absolute difference in prob_supported")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args(argv)
+    import embedding_store
+    import quantized_encoder
+    if args.threads is not None:
+        quantized_encoder.ENCODER_THREADS = args.threads
+    name = args.model or embedding_store.MODEL_NAME
+    rng = random.Random(args.seed)
+    snippets = synth.make_snippets(args.texts // 2, rng)
+    texts = [s["snippet"] for s in snippets] + synth.make_claims(args.texts - len(snippets), rng)
+    queries = synth.make_claims(200, rng)
+    requests = make_requests(args.requests, args.claims, args.snippets, rng)
+    report = {"model": name, "threads": quantized_encoder.ENCODER_THREADS or None, "texts": len(texts), "claims": sum(len(c) for c, _ in requests), "backends": {}}
+    reference = None
+    failed = False
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        backend = quantized_encoder.normalize_backend(backend)
+        print(f"{backend}:", file=sys.stderr, flush=True)
+        try:
+            t0 = time.perf_counter()
+            model = quantized_encoder.load(name, backend)
+            load_s = time.perf_counter() - t0
+        except Exception as e:
+            report["backends"][backend] = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"  skipped ({type(e).__name__}: {e})", file=sys.stderr, flush=True)
+            continue
+        quantized_encoder.set_threads(args.threads)
+        model.encode(texts[:64], batch_size=args.batch_size, show_progress_bar=False)
+        r = {"load_seconds": load_s, "texts_per_s": throughput(model, texts, args.repeat, args.batch_size), "single": single_latency(model, queries)}
+        scores = verification_scores(model, requests, args.threshold)
+        embs = model.encode(texts[:500], convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        if hasattr(model, "stats"):
+            r["padding_ratio"] = model.stats()["padding_ratio"]
+        if reference is None:
+            reference = (backend, scores, embs, r["texts_per_s"])
+        else:
+            import numpy as np
+            diffs = [abs(a - b) for a, b in zip(scores, reference[1])]
+            agree = sum((a >= args.threshold) == (b >= args.threshold) for a, b in zip(scores, reference[1])) / float(len(scores) or 1)
+            r["parity"] = {
+                "reference": reference[0],
+                "max_abs_diff": max(diffs) if diffs else 0.0,
+                "mean_abs_diff": statistics.fmean(diffs) if diffs else 0.0,
+                "verdict_agreement": agree,
+                "embedding_cosine_min": float(np.min(np.sum(np.asarray(embs) * np.asarray(reference[2]), axis=1))),
+            }
+            r["speedup"] = r["texts_per_s"] / reference[3]
+            r["parity"]["ok"] = r["parity"]["verdict_agreement"] >= args.min_agreement and r["parity"]["max_abs_diff"] <= args.max_diff
+            failed = failed or not r["parity"]["ok"]
+        report["backends"][backend] = r
+        line = f"  {r['texts_per_s']:.0f} texts/s, single p50 {r['single']['p50_ms']:.2f} ms"
+        if "parity" in r:
+            p = r["parity"]
+            line += f", {r['speedup']:.2f}x, max diff {p['max_abs_diff']:.4f}, agreement {p['verdict_agreement']:.3f} ({'ok' if p['ok'] else 'FAIL'})"
+        print(line, file=sys.stderr, flush=True)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 1 if failed else 0
+if __name__ == "__main__":
+    sys.exit(main())
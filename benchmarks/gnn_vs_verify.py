@@ -0,0 +1,94 @@
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import synth
+def _latency(fn, cases):
+    samples = []
+    for c in cases:
+        t0 = time.perf_counter()
+        fn(c)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {"p50_ms": samples[len(samples) // 2], "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))], "mean_ms": statistics.fmean(samples)}
+def _throughput(fn, requests, batch):
+    t0 = time.perf_counter()
+    for i in range(0, len(requests), batch):
+        fn(requests[i:i + batch])
+    return sum(len(c) for c, _ in requests) / (time.perf_counter() - t0)
+def _scores(results, labels):
+    pred = [bool(r["supported"]) for res in results for r in res]
+    gold = [y >= 0.5 for ys in labels for y in ys]
+    tp = sum(p and g for p, g in zip(pred, gold))
+    fp = sum(p and not g for p, g in zip(pred, gold))
+    fn = sum(g and not p for p, g in zip(pred, gold))
+    precision = tp / float(tp + fp) if tp + fp else 0.0
+    recall = tp / float(tp + fn) if tp + fn else 0.0
+    return {"accuracy": sum(p == g for p, g in zip(pred, gold)) / float(len(gold) or 1), "precision": precision, "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0}
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the graph verifier against embedding-only verify_claims: accuracy and latency")
+    ap.add_argument("--retrieval", default=None, help="retrieval_results.json to draw evidence groups from (default: a synthetic corpus)")
+    ap.add_argument("--data-dir", default=str(ROOT.joinpath("data", "bench")))
+    ap.add_argument("--paragraphs", type=int, default=10000)
+    ap.add_argument("--weights", default=None, help="GNN checkpoint (default: models/gnn.pth if present)")
+    ap.add_argument("--train", type=int, default=0, help="train on this many examples from the held-in groups first")
+    ap.add_argument("--epochs", type=int, default=8)
+    ap.add_argument("--examples", type=int, default=500)
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--threshold", type=float, default=0.65)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args(argv)
+    import torch
+    import gnn_impl
+    import gnn_loader
+    from verifier import verify_claims_many
+    from model_registry import get_model
+    retrieval = args.retrieval
+    if retrieval is None:
+        _, retrieval = synth.make_corpus(Path(args.data_dir).joinpath(f"corpus_{args.paragraphs}"), args.paragraphs)
+    groups = gnn_impl.load_groups(retrieval)
+    random.Random(args.seed).shuffle(groups)
+    cut = int(len(groups) * 0.8)
+    requests, labels = gnn_impl.make_examples(groups[cut:], args.examples, random.Random(args.seed + 1))
+    model = gnn_impl.GNNWrapper()
+    weights = Path(args.weights) if args.weights else gnn_loader.MODEL_PATH
+    source = "untrained"
+    if args.train:
+        train_requests, train_labels = gnn_impl.make_examples(groups[:cut], args.train, random.Random(args.seed))
+        t0 = time.perf_counter()
+        gnn_impl.train(model, train_requests, train_labels, epochs=args.epochs, batch_size=args.batch,
+                       log=lambda e, loss: print(f"  epoch {e + 1}: loss {loss:.4f}", file=sys.stderr, flush=True))
+        source = f"trained in-process on {len(train_requests)} requests ({time.perf_counter() - t0:.1f}s)"
+    elif weights.exists():
+        model.load_state_dict(torch.load(str(weights), map_location="cpu"))
+        model.eval()
+        source = str(weights)
+    get_model()
+    verify_many = lambda batch: verify_claims_many(batch, sim_threshold=args.threshold)
+    gnn_many = lambda batch: model.predict_many(batch)
+    report = {"retrieval": str(retrieval), "requests": len(requests), "claims": sum(len(c) for c, _ in requests), "gnn_weights": source, "results": {}}
+    for name, many in (("verify_claims", verify_many), ("gnn", gnn_many)):
+        results = []
+        for i in range(0, len(requests), args.batch):
+            results.extend(many(requests[i:i + args.batch]))
+        r = _scores(results, labels)
+        r["latency_single_request"] = _latency(lambda c: many([c]), requests[:200])
+        r["claims_per_s_batched"] = _throughput(many, requests, args.batch)
+        report["results"][name] = r
+        print(f"{name}: acc {r['accuracy']:.3f} f1 {r['f1']:.3f}, p50 {r['latency_single_request']['p50_ms']:.2f} ms/request, "
+              f"{r['claims_per_s_batched']:.0f} claims/s batched", file=sys.stderr, flush=True)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+WORDS = ["river", "album", "director", "founded", "county", "novel", "band", "city", "born", "company", "played", "team",
+         "american", "british", "film", "author", "released", "station", "record", "state", "league", "village", "museum"]
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 14))]
+    return " ".join(words).capitalize() + "."
+def make_payload(endpoint, rng, n_claims=3, n_snippets=5, sentences=3):
+    if endpoint == "retrieve":
+        return {"question": _sentence(rng).rstrip(".") + "?", "top_k": 5, "rerank": True}
+    retrieved = [{"source": f"doc{rng.randrange(10 ** 6)}", "snippet": " ".join(_sentence(rng) for _ in range(sentences))} for _ in range(n_snippets)]
+    claims = [_sentence(rng) for _ in range(n_claims)]
+    if endpoint == "check":
+        answer = "\n".join(f"{i + 1}. {c}\nEVIDENCE: {rng.randrange(n_snippets)}" for i, c in enumerate(claims))
+        return {"question": _sentence(rng).rstrip(".") + "?", "retrieved": retrieved, "answer": answer}
+    return {"claims": claims, "retrieved": retrieved}
+def percentile(values, p):
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, int(round(p / 100.0 * len(s) + 0.5)) - 1))
+    return s[k]
+async def _batcher_stats(client):
+    try:
+        return (await client.get("/stats")).json().get("batcher")
+    except Exception:
+        return None
+async def run(client, endpoint, n_requests, concurrency, seed=0, **payload_kw):
+    rng = random.Random(seed)
+    payloads = [make_payload(endpoint, rng, **payload_kw) for _ in range(n_requests)]
+    latencies = []
+    errors = {}
+    it = iter(payloads)
+    async def worker():
+        for body in it:
+            t0 = time.perf_counter()
+            try:
+                resp = await client.post(f"/{endpoint}", json=body)
+                ok = resp.status_code == 200
+                err = None if ok else f"HTTP {resp.status_code}"
+            except Exception as e:
+                ok, err = False, type(e).__name__
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            if not ok:
+                errors[err] = errors.get(err, 0) + 1
+    before = await _batcher_stats(client)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - t0
+    after = await _batcher_stats(client)
+    batcher = None
+    if after:
+        batches = after["batches"] - (before or {}).get("batches", 0)
+        texts = after["texts"] - (before or {}).get("texts", 0)
+        batcher = {"max_batch_size": after["max_batch_size"], "max_wait_ms": after["max_wait_ms"], "batches": batches,
+                   "texts": texts, "mean_batch_texts": (texts / batches) if batches else 0.0}
+    return {
+        "endpoint": endpoint,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(n_requests / elapsed, 2) if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies) if latencies else None,
+        "batcher": batcher,
+    }
+async def _main(args):
+    import httpx
+    kw = {"n_claims": args.claims, "n_snippets": args.snippets}
+    if args.inprocess:
+        import service
+        from encode_batcher import get_batcher
+        get_batcher(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+        transport = httpx.ASGITransport(app=service.app)
+        base_url = "http://service"
+    else:
+        transport = None
+        base_url = args.url
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout) as client:
+        if args.warmup:
+            await run(client, args.endpoint, args.warmup, min(args.concurrency, args.warmup), seed=args.seed + 1, **kw)
+        return await run(client, args.endpoint, args.requests, args.concurrency, seed=args.seed, **kw)
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Concurrent load generator for service.py reporting latency percentiles")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--endpoint", choices=["verify", "retrieve", "check"], default="verify")
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--claims", type=int, default=3)
+    ap.add_argument("--snippets", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--inprocess", action="store_true", help="drive service.app directly instead of a running server")
+    ap.add_argument("--max-batch-size", type=int, default=None, help="with --inprocess: batcher size (1 disables batching)")
+    ap.add_argument("--max-wait-ms", type=float, default=None, help="with --inprocess: batcher wait")
+    args = ap.parse_args(argv)
+    result = asyncio.run(_main(args))
+    print(json.dumps(result, indent=2))
+    return 1 if result["errors"] else 0
+if __name__ == "__main__":
+    sys.exit(main())
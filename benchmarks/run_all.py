@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import statistics
+from pathlib import Path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+DEFAULT_DATA_DIR = ROOT.joinpath("data", "bench")
+def _stats(samples_s):
+    ms = sorted(s * 1000.0 for s in samples_s)
+    if not ms:
+        return {"n": 0}
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": ms[len(ms) // 2],
+        "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+    }
+def time_calls(fn, inputs):
+    samples = []
+    for x in inputs:
+        t0 = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - t0)
+    return _stats(samples)
+def time_repeat(fn, repeat):
+    return time_calls(lambda _: fn(), range(repeat))
+def _stage(results, name, fn):
+    try:
+        results[name] = fn()
+    except Exception as e:
+        results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+    print(f"  {name}: {_summary(results[name])}", file=sys.stderr, flush=True)
+def _summary(r):
+    if "skipped" in r:
+        return "skipped (" + r["skipped"] + ")"
+    return ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items() if k in ("n", "p50_ms", "p95_ms", "seconds", "heavy"))
+def _git_meta():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=str(ROOT), capture_output=True, text=True, check=True).stdout.strip()
+        except Exception:
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+def _model_available():
+    try:
+        from model_registry import get_model
+        get_model()
+        return None
+    except Exception as e:
+        return str(e) or type(e).__name__
+def _require(reason):
+    if reason:
+        raise RuntimeError(reason)
+def _point_retriever(hotpot, retrieval):
+    import retriever
+    retriever.HOTPOT_PATH = hotpot
+    retriever.RETRIEVAL_PATH = retrieval
+    retriever._retrieval_loaded = False
+    retriever._hotpot_loaded = False
+    retriever.embedder = None
+    retriever.hotpot_embeddings = None
+    retriever.hotpot_index = None
+    return retriever
+def bench_size(n, data_dir, args, no_model):
+    import synth
+    import snippet_store
+    import ann_index
+    import tracing
+    rng = random.Random(args.seed)
+    results = {}
+    t0 = time.perf_counter()
+    hotpot, retrieval = synth.make_corpus(data_dir.joinpath(f"corpus_{n}"), n, seed=args.seed)
+    results["generate_corpus"] = {"seconds": time.perf_counter() - t0, "hotpot_bytes": hotpot.stat().st_size, "retrieval_bytes": retrieval.stat().st_size}
+    retriever = _point_retriever(hotpot, retrieval)
+    for root in (snippet_store._store_dir("hotpot", hotpot), snippet_store._store_dir("retrieval", retrieval)):
+        if root is not None and root.exists():
+            import shutil
+            shutil.rmtree(root)
+    _stage(results, "load_retrieval_file_json", lambda: time_repeat(retriever._load_retrieval_file, args.load_repeat))
+    _stage(results, "load_hotpot_snippets_jsonl", lambda: time_repeat(retriever._load_hotpot_snippets, args.load_repeat))
+    def compile_stores():
+        t = time.perf_counter()
+        snippet_store.build_snippet_store(hotpot)
+        snippet_store.build_retrieval_store(retrieval, retriever._normalize_question)
+        return {"seconds": time.perf_counter() - t}
+    _stage(results, "compile_stores", compile_stores)
+    _stage(results, "load_retrieval_file_compiled", lambda: time_repeat(retriever._load_retrieval_file, args.load_repeat))
+    _stage(results, "load_hotpot_snippets_compiled", lambda: time_repeat(retriever._load_hotpot_snippets, args.load_repeat))
+    questions = synth.load_questions(retrieval, args.queries, seed=args.seed)
+    _stage(results, "retrieve_exact", lambda: time_calls(lambda q: retriever.retrieve(q, top_k=5), questions))
+    fuzzy = [synth.perturb(q, rng) for q in questions]
+    def retrieve_fuzzy():
+        out = time_calls(lambda q: retriever.retrieve(q, top_k=5), fuzzy)
+        hits = 0
+        for q in fuzzy:
+            with tracing.trace("bench") as t:
+                retriever.retrieve(q, top_k=5)
+            hits += t.attrs.get("match_type") == "fuzzy"
+        out["hit_rate"] = hits / float(len(fuzzy))
+        return out
+    _stage(results, "retrieve_fuzzy", retrieve_fuzzy)
+    def ann_search():
+        import numpy as np
+        embs = np.random.default_rng(args.seed).standard_normal((n, args.dim), dtype=np.float32)
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+        t = time.perf_counter()
+        index = ann_index.load_or_build(embs, key=f"bench{n}", save=False)
+        build_s = time.perf_counter() - t
+        queries = ann_index.sample_queries(embs, n=min(args.queries, n), seed=args.seed)
+        out = time_calls(lambda q: index.search(q, 10), queries)
+        out.update({"backend": type(index).__name__, "build_s": build_s})
+        return out
+    _stage(results, "ann_search_random_vectors", ann_search)
+    def bm25_search():
+        import bm25_index
+        snippets = retriever.get_hotpot_snippets()
+        t = time.perf_counter()
+        index = bm25_index.build(snippets, data_dir.joinpath(f"bm25_{n}"))
+        build_s = time.perf_counter() - t
+        out = time_calls(lambda q: index.search(q, 100), questions)
+        out.update({"build_s": build_s, "postings": index.meta["n_postings"], "terms": index.meta["n_terms"]})
+        return out
+    _stage(results, "bm25_search", bm25_search)
+    def retrieve_from_hotpot():
+        _require(no_model)
+        if n > args.max_embed_rows:
+            raise RuntimeError(f"corpus larger than --max-embed-rows={args.max_embed_rows}")
+        t = time.perf_counter()
+        retriever.ensure_embeddings()
+        setup_s = time.perf_counter() - t
+        out = time_calls(lambda q: retriever.retrieve_from_hotpot(q, 50), fuzzy)
+        out["setup_s"] = setup_s
+        return out
+    _stage(results, "retrieve_from_hotpot", retrieve_from_hotpot)
+    def rerank():
+        _require(no_model)
+        cands = [(q, retriever.get_retrieval_index().get(retriever._normalize_question(q)) or synth.make_snippets(50, rng)) for q in questions[:args.model_queries]]
+        return time_calls(lambda x: retriever.rerank_candidates(x[0], x[1], top_k=5), cands)
+    _stage(results, "rerank_candidates", rerank)
+    return results
+def bench_global(args, no_model):
+    import warmup
+    import synth
+    rng = random.Random(args.seed)
+    results = {}
+    def imports():
+        samples, heavy = [], []
+        for _ in range(args.import_repeat):
+            seconds, heavy = warmup.measure_import()
+            samples.append(seconds)
+        out = _stats(samples)
+        out["heavy"] = heavy
+        return out
+    _stage(results, "import_light_modules", imports)
+    def model_load():
+        _require(no_model)
+        from model_registry import model_stats
+        return model_stats()
+    _stage(results, "model_load", model_load)
+    for n_claims in args.claims:
+        for n_snippets in args.snippets:
+            def verify(n_claims=n_claims, n_snippets=n_snippets):
+                _require(no_model)
+                from verifier import verify_claims
+                cases = [(synth.make_claims(n_claims, rng), synth.make_snippets(n_snippets, rng)) for _ in range(args.model_queries)]
+                cold = time_calls(lambda c: verify_claims(*c), cases)
+                warm = time_calls(lambda c: verify_claims(*c), cases)
+                cold["warm_p50_ms"] = warm["p50_ms"]
+                return cold
+            _stage(results, f"verify_claims_c{n_claims}_s{n_snippets}", verify)
+    def gnn_predict():
+        _require(no_model)
+        from gnn_impl import GNNWrapper
+        g = GNNWrapper()
+        cases = [(synth.make_claims(5, rng), synth.make_snippets(5, rng)) for _ in range(args.model_queries)]
+        return time_calls(lambda c: g.predict(c[0], c[1], {}), cases)
+    _stage(results, "gnn_predict_c5_s5", gnn_predict)
+    import llm_stub
+    from llm_client import _make_prompt
+    answers = [llm_stub.fake_answer(_make_prompt(f"question {i}?", synth.make_snippets(5, rng)), max_claims=5) for i in range(args.queries)]
+    def parse():
+        from pipeline import parse_claims_from_llm
+        return time_calls(parse_claims_from_llm, answers)
+    _stage(results, "parse_claims_from_llm", parse)
+    def llm_stub_roundtrip():
+        import llm_client
+        server, base_url = llm_stub.start_in_thread(latency=args.llm_latency)
+        old_url, old_key = llm_client.OPENAI_BASE_URL, os.environ.get("OPENAI_API_KEY")
+        llm_client.OPENAI_BASE_URL = base_url
+        os.environ["OPENAI_API_KEY"] = "stub"
+        try:
+            items = [(f"question {i}?", synth.make_snippets(5, rng)) for i in range(args.queries)]
+            single = time_calls(lambda it: llm_client.ask_llm(it[0], it[1], use_cache=False), items[:50])
+            t = time.perf_counter()
+            llm_client.ask_llm_many(items, use_cache=False)
+            single["batch_per_request_ms"] = (time.perf_counter() - t) * 1000.0 / len(items)
+            single["stub_latency_ms"] = args.llm_latency * 1000.0
+            return single
+        finally:
+            server.shutdown()
+            llm_client.OPENAI_BASE_URL = old_url
+            if old_key is None:
+                os.environ.pop("OPENAI_API_KEY", None)
+            else:
+                os.environ["OPENAI_API_KEY"] = old_key
+    _stage(results, "llm_stub_roundtrip", llm_stub_roundtrip)
+    return results
+def _flatten(report, metric):
+    out = {}
+    for stage, r in report.get("global", {}).items():
+        if metric in r:
+            out[stage] = r[metric]
+    for size, stages in report.get("sizes", {}).items():
+        for stage, r in stages.items():
+            if metric in r:
+                out[f"{size}/{stage}"] = r[metric]
+    return out
+def compare(baseline, current, threshold=1.5, metric="p50_ms"):
+    old, new = _flatten(baseline, metric), _flatten(current, metric)
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name] / old[name] if old[name] else float("inf")
+        rows.append({"stage": name, "baseline_ms": old[name], "current_ms": new[name], "ratio": ratio, "regression": ratio > threshold})
+    return rows
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Time each pipeline stage over synthetic corpora and write a JSON report")
+    ap.add_argument("--sizes", default="1000,10000", help="comma-separated paragraph counts, e.g. 1000,10000,100000,1000000")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR))
+    ap.add_argument("--out", default=None, help="write the JSON report here (default: stdout)")
+    ap.add_argument("--compare", default=None, metavar="BASELINE_JSON", help="report stages slower than the baseline")
+    ap.add_argument("--threshold", type=float, default=1.5, help="ratio above which --compare flags a regression")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--model-queries", type=int, default=20, help="calls per model-bound stage")
+    ap.add_argument("--claims", default="1,5,20")
+    ap.add_argument("--snippets", default="5,20")
+    ap.add_argument("--load-repeat", type=int, default=3)
+    ap.add_argument("--import-repeat", type=int, default=3)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--max-embed-rows", type=int, default=100000, help="skip retrieve_from_hotpot above this corpus size")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM sleeps per request")
+    ap.add_argument("--no-model", action="store_true", help="skip stages that need the embedding model")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    args.claims = [int(x) for x in args.claims.split(",") if x]
+    args.snippets = [int(x) for x in args.snippets.split(",") if x]
+    data_dir = Path(args.data_dir)
+    os.environ.setdefault("EMBEDDING_STORE_DIR", str(data_dir.joinpath("embeddings")))
+    os.environ.setdefault("COMPILED_STORE_DIR", str(data_dir.joinpath("compiled")))
+    os.environ.setdefault("EVIDENCE_CACHE_DIR", "")
+    os.environ["LLM_CACHE"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    no_model = "--no-model" if args.no_model else _model_available()
+    report = {
+        "meta": dict(_git_meta(), python=platform.python_version(), platform=platform.platform(), cpu_count=os.cpu_count(),
+                     started=time.strftime("%Y-%m-%dT%H:%M:%S"), args={k: v for k, v in vars(args).items() if k not in ("out", "compare")}),
+        "global": {},
+        "sizes": {},
+    }
+    print("global", file=sys.stderr)
+    report["global"] = bench_global(args, no_model)
+    for n in [int(x) for x in args.sizes.split(",") if x]:
+        print(f"size {n}", file=sys.stderr)
+        report["sizes"][str(n)] = bench_size(n, data_dir, args, no_model)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            rows = compare(json.load(f), report, args.threshold)
+        for r in rows:
+            flag = "REGRESSION" if r["regression"] else ""
+            print(f"{r['stage']:55s} {r['baseline_ms']:10.3f} -> {r['current_ms']:10.3f} ms  x{r['ratio']:.2f} {flag}", file=sys.stderr)
+        return 1 if any(r["regression"] for r in rows) else 0
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
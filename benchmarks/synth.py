@@ -0,0 +1,94 @@
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+WH = ["What", "Which", "Who", "When", "Where", "How many", "In what year"]
+COMMON = ["the", "of", "is", "was", "a", "in", "director", "film", "city", "born", "band", "album", "river", "county",
+          "author", "novel", "company", "founded", "located", "played", "team", "based", "American", "British", "state",
+          "released", "station", "record", "league", "village", "museum", "known", "first", "second", "largest"]
+def _name(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))).capitalize()
+def _sentence(rng, subject):
+    words = [subject] + [rng.choice(COMMON) if rng.random() < 0.8 else _name(rng) for _ in range(rng.randint(6, 16))]
+    return " ".join(words) + "."
+def _paragraph(rng, subject, sentences):
+    return " ".join(_sentence(rng, subject) for _ in range(sentences))
+def _question(rng, subject):
+    words = [rng.choice(WH)] + [rng.choice(COMMON) for _ in range(rng.randint(3, 8))] + [subject]
+    return " ".join(words) + "?"
+def make_corpus(out_dir, n_paragraphs, n_questions=None, paragraphs_per_doc=10, sentences=3, top_k=10, seed=0):
+    out_dir = Path(out_dir)
+    n_questions = int(n_questions if n_questions is not None else min(100000, max(100, n_paragraphs // 10)))
+    spec = {"n_paragraphs": int(n_paragraphs), "n_questions": n_questions, "paragraphs_per_doc": paragraphs_per_doc,
+            "sentences": sentences, "top_k": top_k, "seed": seed}
+    manifest = out_dir.joinpath("manifest.json")
+    hotpot = out_dir.joinpath("hotpot_clean.jsonl")
+    retrieval = out_dir.joinpath("retrieval_results.json")
+    try:
+        with open(manifest, "r", encoding="utf-8") as f:
+            if json.load(f) == spec and hotpot.exists() and retrieval.exists():
+                return hotpot, retrieval
+    except Exception:
+        pass
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    subjects = []
+    with open(hotpot, "w", encoding="utf-8") as f:
+        written = 0
+        while written < n_paragraphs:
+            subject = _name(rng)
+            subjects.append(subject)
+            n = min(paragraphs_per_doc, n_paragraphs - written)
+            f.write(json.dumps({"title": subject, "context": [_paragraph(rng, subject, sentences) for _ in range(n)]}) + "\n")
+            written += n
+    with open(retrieval, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(n_questions):
+            subject = rng.choice(subjects)
+            item = {"question": _question(rng, subject),
+                    "retrieved": [{"source": subject if j == 0 else rng.choice(subjects), "snippet": _paragraph(rng, subject, sentences)} for j in range(top_k)]}
+            f.write(("," if i else "") + json.dumps(item))
+        f.write("]")
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    return hotpot, retrieval
+def load_questions(retrieval_path, n=200, seed=0):
+    with open(retrieval_path, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+    rng = random.Random(seed)
+    return rng.sample(questions, min(n, len(questions)))
+def perturb(s, rng, edits=2):
+    chars = list(s)
+    for _ in range(edits):
+        pos = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.5:
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif op < 0.75:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(chars)
+def make_claims(n, rng):
+    return [_sentence(rng, _name(rng)) for _ in range(n)]
+def make_snippets(n, rng, sentences=3):
+    out = []
+    for _ in range(n):
+        subject = _name(rng)
+        out.append({"source": subject, "snippet": _paragraph(rng, subject, sentences)})
+    return out
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic HotpotQA-shaped corpus and retrieval file")
+    ap.add_argument("out_dir")
+    ap.add_argument("--paragraphs", type=int, default=10000)
+    ap.add_argument("--questions", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    hotpot, retrieval = make_corpus(args.out_dir, args.paragraphs, args.questions, seed=args.seed)
+    print(hotpot)
+    print(retrieval)
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
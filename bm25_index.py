@@ -0,0 +1,171 @@
+import os
+import re
+import sys
+import json
+import shutil
+from array import array
+from collections import Counter
+from pathlib import Path
+import embedding_store
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+STOPWORDS = frozenset((
+    "a an and are as at be been but by for from had has have he her his in into is it its of on or she that the their "
+    "there they this to was were which who whom with what when where how did does do than then also after before "
+    "about over under between during while not no"
+).split())
+_TOKEN = re.compile(r"\w+")
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+def _doc_tokens(item):
+    if isinstance(item, dict):
+        return tokenize(f"{item.get('source') or ''} {item.get('snippet') or ''}")
+    return tokenize(str(item))
+class BM25Index:
+    def __init__(self, root):
+        import numpy as np
+        self.root = Path(root)
+        with open(self.root.joinpath("meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(self.root.joinpath("vocab.txt"), "r", encoding="utf-8") as f:
+            self.vocab = {t: i for i, t in enumerate(f.read().split("\n")[:-1])}
+        self.indptr = np.load(str(self.root.joinpath("indptr.npy")), mmap_mode="r")
+        self.doc_ids = np.load(str(self.root.joinpath("doc_ids.npy")), mmap_mode="r")
+        self.impacts = np.load(str(self.root.joinpath("impacts.npy")), mmap_mode="r")
+        self.idf = np.load(str(self.root.joinpath("idf.npy")))
+        self.n_docs = int(self.meta["n_docs"])
+    def __len__(self):
+        return self.n_docs
+    def df(self):
+        import numpy as np
+        return list(self.vocab), np.diff(self.indptr).astype(np.int64)
+    def search(self, query, k=100, idf=None, exclude=None):
+        import numpy as np
+        terms = {self.vocab[t]: t for t in tokenize(query) if t in self.vocab}
+        tids = sorted(terms)
+        if not tids or k <= 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        docs = []
+        weights = []
+        for tid in tids:
+            lo, hi = int(self.indptr[tid]), int(self.indptr[tid + 1])
+            docs.append(self.doc_ids[lo:hi])
+            weights.append(self.impacts[lo:hi] * (self.idf[tid] if idf is None else idf.get(terms[tid], self.idf[tid])))
+        docs = np.concatenate(docs)
+        weights = np.concatenate(weights)
+        if docs.shape[0] * 8 < self.n_docs:
+            cand, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        else:
+            scores = np.bincount(docs, weights=weights, minlength=self.n_docs).astype(np.float32)
+            cand = np.flatnonzero(scores)
+            scores = scores[cand]
+        if exclude is not None and len(exclude):
+            live = ~np.isin(cand, exclude)
+            cand, scores = cand[live], scores[live]
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+        top = top[np.lexsort((cand[top], -scores[top]))]
+        return scores[top], cand[top].astype(np.int64)
+def compute_idf(n_docs, df):
+    import numpy as np
+    return np.log1p((n_docs - df + 0.5) / (df + 0.5))
+def build(docs, out, k1=None, b=None):
+    import numpy as np
+    k1 = BM25_K1 if k1 is None else k1
+    b = BM25_B if b is None else b
+    out = Path(out)
+    vocab = {}
+    term_ids = array("i")
+    doc_ids = array("i")
+    tfs = array("i")
+    doc_len = array("i")
+    for d, item in enumerate(docs):
+        toks = _doc_tokens(item)
+        doc_len.append(len(toks))
+        for t, c in Counter(toks).items():
+            term_ids.append(vocab.setdefault(t, len(vocab)))
+            doc_ids.append(d)
+            tfs.append(c)
+    n_docs = len(doc_len)
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    order = np.argsort(term_ids, kind="stable")
+    df = np.bincount(term_ids, minlength=len(vocab))
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+    sorted_docs = np.frombuffer(doc_ids, dtype=np.int32)[order]
+    tf = np.frombuffer(tfs, dtype=np.int32)[order].astype(np.float32)
+    dl = np.frombuffer(doc_len, dtype=np.int32).astype(np.float32)
+    avgdl = float(dl.mean()) if n_docs else 0.0
+    norm = k1 * (1.0 - b + b * dl[sorted_docs] / max(avgdl, 1e-9))
+    impacts = (tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+    idf = compute_idf(n_docs, df).astype(np.float32)
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(str(tmp.joinpath("indptr.npy")), indptr)
+    np.save(str(tmp.joinpath("doc_ids.npy")), sorted_docs)
+    np.save(str(tmp.joinpath("impacts.npy")), impacts)
+    np.save(str(tmp.joinpath("idf.npy")), idf)
+    with open(tmp.joinpath("vocab.txt"), "w", encoding="utf-8") as f:
+        for t in vocab:
+            f.write(t + "\n")
+    with open(tmp.joinpath("meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"n_docs": n_docs, "n_terms": len(vocab), "n_postings": int(sorted_docs.shape[0]), "avgdl": avgdl, "k1": k1, "b": b}, f)
+    if out.exists():
+        shutil.rmtree(out)
+    os.replace(tmp, out)
+    return BM25Index(out)
+def index_path(path=None):
+    fp = embedding_store.corpus_fingerprint(path)
+    if fp is None:
+        return None
+    return embedding_store.STORE_DIR.joinpath(f"hotpot_{fp[:16]}.bm25")
+def load(path=None, n_docs=None):
+    root = index_path(path)
+    if root is None or not root.exists():
+        return None
+    try:
+        idx = BM25Index(root)
+    except Exception:
+        return None
+    if n_docs is not None and len(idx) != n_docs:
+        return None
+    return idx
+def load_or_build(snippets, path=None):
+    idx = load(path, len(snippets))
+    if idx is None:
+        root = index_path(path)
+        if root is None:
+            return None
+        idx = build(snippets, root)
+    return idx
+def main(argv=None):
+    import time
+    import argparse
+    ap = argparse.ArgumentParser(description="Build the BM25 inverted index over the HotpotQA snippets, or query it")
+    ap.add_argument("--force", action="store_true")
+    ap.add_argument("--query", default=None)
+    ap.add_argument("-k", type=int, default=10)
+    args = ap.parse_args(argv)
+    import retriever
+    snippets = retriever.get_hotpot_snippets()
+    if not len(snippets):
+        print("no snippets found in", retriever.HOTPOT_PATH, file=sys.stderr)
+        return 1
+    root = index_path(retriever.HOTPOT_PATH)
+    t0 = time.perf_counter()
+    idx = None if args.force else load(retriever.HOTPOT_PATH, len(snippets))
+    if idx is None:
+        idx = build(snippets, root)
+        print(f"built {root} in {time.perf_counter() - t0:.1f}s: {json.dumps(idx.meta)}")
+    else:
+        print("up to date:", root)
+    if args.query:
+        t0 = time.perf_counter()
+        scores, idxs = idx.search(args.query, args.k)
+        print(f"{(time.perf_counter() - t0) * 1000:.2f} ms")
+        for s, i in zip(scores.tolist(), idxs.tolist()):
+            print(f"{s:8.3f}  [{i}] {snippets[i]['source']}: {snippets[i]['snippet'][:120]}")
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+import tracing
+CASCADE_LEXICAL_SHORTLIST = float(os.getenv("CASCADE_LEXICAL_SHORTLIST", "0.7"))
+CASCADE_LEXICAL_REJECT = float(os.getenv("CASCADE_LEXICAL_REJECT", "0.1"))
+CASCADE_MIN_TOKENS = int(os.getenv("CASCADE_MIN_TOKENS", "3"))
+CASCADE_BAND = float(os.getenv("CASCADE_BAND", "0.05"))
+CASCADE_CROSS_ENCODER = os.getenv("CASCADE_CROSS_ENCODER", "")
+CASCADE_NLI_THRESHOLD = float(os.getenv("CASCADE_NLI_THRESHOLD", "0.5"))
+CASCADE_ANNOTATION_FALLBACK = os.getenv("CASCADE_ANNOTATION_FALLBACK", "1").lower() not in ("0", "false", "no", "off")
+TIERS = ("lexical", "bi_encoder", "cross_encoder")
+NEGATIONS = frozenset("not no never none nor neither nobody nothing nowhere without cannot".split())
+_WORD = re.compile(r"\w+")
+_lock = threading.Lock()
+_exits = {}
+_cross_encoder_failed = False
+def _exit(tier, n=1):
+    if not n:
+        return
+    with _lock:
+        _exits[tier] = _exits.get(tier, 0) + n
+    tracing.incr(f"cascade_exit_{tier}", n)
+def stats():
+    with _lock:
+        exits = dict(_exits)
+    total = sum(exits.values())
+    return {"claims": total, "exits": exits, "exit_rates": {k: (v / float(total)) for k, v in exits.items()} if total else {}}
+def reset_stats():
+    with _lock:
+        _exits.clear()
+def _words(text):
+    return _WORD.findall(re.sub(r"n't\b", " not", text.lower()))
+def _lexical(text):
+    from bm25_index import STOPWORDS
+    words = _words(text)
+    content = frozenset(t for t in words if t not in STOPWORDS and (len(t) > 1 or t.isdigit()))
+    return " " + " ".join(words) + " ", content, frozenset(t for t in words if t in NEGATIONS)
+def _evidence(retrieved):
+    from gnn_impl import entities
+    from verifier import _split_into_sentences
+    out = []
+    for j, r in enumerate(retrieved):
+        for sent in _split_into_sentences(r.get("snippet", "") or ""):
+            out.append((j, sent, _lexical(sent), entities(sent)))
+    return out
+def lexical_verdict(claim, idx, retrieved, evidence):
+    from gnn_impl import entities
+    if not retrieved:
+        return {"claim": claim, "best_snippet": None, "best_sentence": None, "sim": 0.0, "prob_supported": 0.0, "supported": False, "top_evidence_idxs": [], "tier": "lexical"}, False
+    text, toks, negs = _lexical(claim)
+    if len(toks) < CASCADE_MIN_TOKENS:
+        return None, False
+    ents = entities(claim)
+    best = (0.0, None, None)
+    overall = 0.0
+    seen_ents = set()
+    for j, sent, (s_text, s_toks, s_negs), s_ents in evidence:
+        if idx is not None and j != idx:
+            continue
+        if text in s_text and negs == s_negs:
+            v = {"claim": claim, "best_snippet": retrieved[j], "best_sentence": sent, "sim": 1.0, "prob_supported": 1.0, "supported": True,
+                 "top_evidence_idxs": [j], "tier": "lexical", "lexical_match": "contained"}
+            if idx is not None:
+                v["annotated_evidence_idx"] = idx
+            return v, False
+        recall = len(toks & s_toks) / float(len(toks))
+        if recall > best[0]:
+            best = (recall, j, sent)
+    for j, sent, (s_text, s_toks, s_negs), s_ents in evidence:
+        overall = max(overall, len(toks & s_toks) / float(len(toks)))
+        seen_ents |= ents & s_ents
+    recall, j, sent = best
+    if overall < CASCADE_LEXICAL_REJECT and not seen_ents:
+        v = {"claim": claim, "best_snippet": retrieved[j] if j is not None else retrieved[0], "best_sentence": sent, "sim": 0.0, "prob_supported": 0.0, "supported": False,
+             "top_evidence_idxs": [], "tier": "lexical", "lexical_match": "disjoint"}
+        if idx is not None:
+            v["annotated_evidence_idx"] = idx
+        return v, False
+    return None, recall >= CASCADE_LEXICAL_SHORTLIST
+def _load_cross_encoder(name, device=None):
+    try:
+        from sentence_transformers import CrossEncoder
+    except Exception:
+        raise RuntimeError("sentence-transformers required")
+    return CrossEncoder(name, device=device)
+def get_cross_encoder():
+    global _cross_encoder_failed
+    if not CASCADE_CROSS_ENCODER or _cross_encoder_failed:
+        return None
+    from model_registry import get_model
+    try:
+        return get_model(CASCADE_CROSS_ENCODER, loader=_load_cross_encoder)
+    except Exception:
+        _cross_encoder_failed = True
+        tracing.incr("cascade_cross_encoder_unavailable")
+        return None
+def entailment_probs(model, pairs):
+    import numpy as np
+    scores = np.asarray(model.predict(pairs, batch_size=32, show_progress_bar=False), dtype=np.float32)
+    if scores.ndim == 1:
+        return scores if scores.min() >= 0.0 and scores.max() <= 1.0 else 1.0 / (1.0 + np.exp(-scores))
+    config = getattr(model, "config", None) or model.model.config
+    labels = {int(k): str(v).lower() for k, v in config.id2label.items()}
+    col = next((k for k, v in labels.items() if "entail" in v), scores.shape[1] - 1)
+    scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return scores[:, col] / scores.sum(axis=1)
+def verify_many(batch, sim_threshold, embedder=None):
+    from pipeline import _verify_many_bi_encoder
+    batch = [(list(claims), list(ann or []), list(retrieved)) for claims, ann, retrieved in batch]
+    results = [[None] * len(claims) for claims, _, _ in batch]
+    pending = []
+    shortlist = set()
+    with tracing.stage("cascade_lexical", items=sum(len(c) for c, _, _ in batch)) as st:
+        for b, (claims, ann, retrieved) in enumerate(batch):
+            evidence = _evidence(retrieved) if claims else []
+            for i, claim in enumerate(claims):
+                a = ann[i] if i < len(ann) else None
+                try:
+                    idx = int(a) if a is not None else None
+                except Exception:
+                    idx = None
+                if idx is not None and not 0 <= idx < len(retrieved):
+                    idx = None
+                v, near = lexical_verdict(claim, idx, retrieved, evidence)
+                if v is None:
+                    pending.append((b, i))
+                    if near:
+                        shortlist.add((b, i))
+                else:
+                    results[b][i] = v
+        st.set(exits=sum(len(c) for c, _, _ in batch) - len(pending))
+    _exit("lexical", sum(len(c) for c, _, _ in batch) - len(pending))
+    if not pending:
+        return results
+    by_req = {}
+    for b, i in pending:
+        by_req.setdefault(b, []).append(i)
+    order = sorted(by_req)
+    sub = [([batch[b][0][i] for i in by_req[b]], [batch[b][1][i] if i < len(batch[b][1]) else None for i in by_req[b]], batch[b][2]) for b in order]
+    outs = _verify_many_bi_encoder(sub, sim_threshold, embedder)
+    low = sim_threshold - CASCADE_BAND
+    high = sim_threshold + CASCADE_BAND
+    retry = []
+    for b, verdicts in zip(order, outs):
+        for i, v in zip(by_req[b], verdicts):
+            v["tier"] = "bi_encoder"
+            results[b][i] = v
+            if CASCADE_ANNOTATION_FALLBACK and v.get("annotated_evidence_idx") is not None and float(v.get("sim", 0.0)) < low and len(batch[b][2]) > 1:
+                retry.append((b, i))
+    if retry:
+        tracing.incr("cascade_annotation_fallbacks", len(retry))
+        again = _verify_many_bi_encoder([([batch[b][0][i]], [None], batch[b][2]) for b, i in retry], sim_threshold, embedder)
+        for (b, i), (v,) in zip(retry, again):
+            old = results[b][i]
+            if float(v.get("sim", 0.0)) > float(old.get("sim", 0.0)):
+                v["tier"] = "bi_encoder"
+                v["annotated_evidence_idx"] = old["annotated_evidence_idx"]
+                v["annotation_fallback"] = True
+                results[b][i] = v
+    uncertain = [(b, i) for b, i in pending if ((b, i) in shortlist or low <= float(results[b][i].get("sim", 0.0)) <= high) and results[b][i].get("best_sentence")]
+    model = get_cross_encoder() if uncertain else None
+    if model is None:
+        _exit("bi_encoder", len(pending))
+        if uncertain:
+            tracing.incr("cascade_uncertain_unresolved", len(uncertain))
+        return results
+    _exit("bi_encoder", len(pending) - len(uncertain))
+    with tracing.stage("cascade_cross_encoder", items=len(uncertain)):
+        probs = entailment_probs(model, [(results[b][i]["best_sentence"], results[b][i]["claim"]) for b, i in uncertain])
+    for (b, i), p in zip(uncertain, probs.tolist()):
+        v = results[b][i]
+        v["bi_encoder_sim"] = v.get("sim")
+        v["prob_supported"] = float(p)
+        v["supported"] = bool(p >= CASCADE_NLI_THRESHOLD)
+        v["tier"] = "cross_encoder"
+    _exit("cross_encoder", len(uncertain))
+    return results
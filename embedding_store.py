@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import hashlib
+import warnings
+from pathlib import Path
+from dotenv import load_dotenv
+from model_registry import DEFAULT_MODEL as MODEL_NAME, model_key
+load_dotenv()
+DATA_DIR = Path(__file__).parent.joinpath("data")
+HOTPOT_PATH = DATA_DIR.joinpath("hotpot_clean.jsonl")
+STORE_DIR = Path(os.getenv("EMBEDDING_STORE_DIR", str(DATA_DIR.joinpath("embeddings"))))
+FINGERPRINTS_PATH = STORE_DIR.joinpath("fingerprints.json")
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+def _read_fingerprints():
+    try:
+        with open(FINGERPRINTS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+def _atomic_write_json(path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+def corpus_fingerprint(path=None):
+    path = Path(path or HOTPOT_PATH)
+    if not path.exists():
+        return None
+    st = path.stat()
+    stamp = f"{st.st_size}:{st.st_mtime_ns}"
+    cached = _read_fingerprints()
+    entry = cached.get(str(path.resolve()))
+    if entry and entry.get("stamp") == stamp:
+        return entry["sha256"]
+    digest = file_sha256(path)
+    cached[str(path.resolve())] = {"stamp": stamp, "sha256": digest}
+    try:
+        _atomic_write_json(FINGERPRINTS_PATH, cached)
+    except Exception:
+        pass
+    return digest
+def store_key(model_name=None, path=None):
+    fp = corpus_fingerprint(path)
+    if fp is None:
+        return None
+    return hashlib.sha256(f"{fp}:{model_key(model_name)}".encode("utf-8")).hexdigest()[:16]
+def store_path(key):
+    return STORE_DIR.joinpath(f"hotpot_{key}.npy")
+def load_embeddings(n_rows=None, model_name=None, path=None):
+    key = store_key(model_name, path)
+    if key is None:
+        return None
+    p = store_path(key)
+    if not p.exists():
+        return None
+    import numpy as np
+    try:
+        arr = np.load(str(p), mmap_mode="r")
+    except Exception:
+        return None
+    if n_rows is not None and arr.shape[0] != n_rows:
+        return None
+    return arr
+def build_embeddings(texts, model, model_name=None, path=None, batch_size=256, show_progress_bar=False):
+    import numpy as np
+    key = store_key(model_name, path)
+    if key is None:
+        raise RuntimeError("corpus file not found")
+    embs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=show_progress_bar)
+    embs = np.ascontiguousarray(embs, dtype=np.float32)
+    p = store_path(key)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f"{p.stem}.{os.getpid()}.tmp.npy")
+    np.save(str(tmp), embs)
+    os.replace(tmp, p)
+    meta = {"key": key, "model": model_key(model_name), "corpus": str(Path(path or HOTPOT_PATH)), "rows": int(embs.shape[0]), "dim": int(embs.shape[1]) if embs.ndim == 2 else 0}
+    _atomic_write_json(p.with_suffix(".json"), meta)
+    return np.load(str(p), mmap_mode="r")
+def load_or_build(texts, model, model_name=None, path=None):
+    arr = load_embeddings(len(texts), model_name, path)
+    if arr is None:
+        arr = build_embeddings(texts, model, model_name, path)
+    return arr
+def as_tensor(arr):
+    import torch
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(arr)
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Precompute the HotpotQA fallback embedding store")
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--force", action="store_true", help="rebuild even if a matching store exists")
+    args = ap.parse_args(argv)
+    import retriever
+    texts = [s["snippet"] for s in retriever.get_hotpot_snippets()]
+    if not texts:
+        print("no snippets found in", HOTPOT_PATH, file=sys.stderr)
+        return 1
+    if not args.force and load_embeddings(len(texts), args.model) is not None:
+        print("up to date:", store_path(store_key(args.model)))
+        return 0
+    from model_registry import get_model
+    model = get_model(args.model)
+    arr = build_embeddings(texts, model, args.model, batch_size=args.batch_size, show_progress_bar=True)
+    print(f"wrote {arr.shape[0]}x{arr.shape[1]} embeddings to", store_path(store_key(args.model)))
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
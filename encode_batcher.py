@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dotenv import load_dotenv
+load_dotenv()
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+_PER_CALL = ("batch_size", "show_progress_bar")
+class EncodeBatcher:
+    def __init__(self, model, max_batch_size=None, max_wait_ms=None, encode_batch_size=64):
+        self.model = model
+        self.max_batch_size = max(1, int(BATCH_MAX_SIZE if max_batch_size is None else max_batch_size))
+        self.max_wait = max(0.0, float(BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms)) / 1000.0
+        self.encode_batch_size = encode_batch_size
+        self._pending = deque()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.encode_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+        self._thread.start()
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        try:
+            key = tuple(sorted((k, v) for k, v in kwargs.items() if k not in _PER_CALL))
+            hash(key)
+        except TypeError:
+            return self.model.encode(sentences, **kwargs)
+        if not texts or self._closed:
+            return self.model.encode(sentences, **kwargs)
+        fut = Future()
+        with self._cond:
+            self._pending.append((time.monotonic(), key, texts, fut))
+            self._queued += len(texts)
+            self._cond.notify()
+        out = fut.result()
+        return out[0] if single else out
+    def _take(self):
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None, []
+                self._cond.wait()
+            deadline = self._pending[0][0] + self.max_wait
+            while self._queued < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            key = self._pending[0][1]
+            taken, kept, size = [], deque(), 0
+            while self._pending:
+                entry = self._pending.popleft()
+                if entry[1] == key and (not taken or size + len(entry[2]) <= self.max_batch_size):
+                    taken.append(entry)
+                    size += len(entry[2])
+                else:
+                    kept.append(entry)
+            kept.extend(self._pending)
+            self._pending = kept
+            self._queued -= size
+            return key, taken
+    def _run(self):
+        while True:
+            key, taken = self._take()
+            if not taken:
+                return
+            flat = [t for _, _, texts, _ in taken for t in texts]
+            t0 = time.perf_counter()
+            try:
+                embs = self.model.encode(flat, batch_size=self.encode_batch_size, show_progress_bar=False, **dict(key))
+            except BaseException as e:
+                for _, _, _, fut in taken:
+                    fut.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - t0
+            pos = 0
+            for _, _, texts, fut in taken:
+                fut.set_result(embs[pos:pos + len(texts)])
+                pos += len(texts)
+            with self._cond:
+                self.requests += len(taken)
+                self.texts += len(flat)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(flat))
+                self.encode_seconds += elapsed
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+    def stats(self):
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "mean_batch_texts": (self.texts / self.batches) if self.batches else 0.0,
+                "mean_batch_requests": (self.requests / self.batches) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "encode_seconds": self.encode_seconds,
+                "queued": self._queued,
+            }
+_batcher = None
+_batcher_lock = threading.Lock()
+def get_batcher(max_batch_size=None, max_wait_ms=None):
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from model_registry import get_model
+                _batcher = EncodeBatcher(get_model(), max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    return _batcher
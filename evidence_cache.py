@@ -0,0 +1,135 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+EVIDENCE_CACHE_SIZE = int(os.getenv("EVIDENCE_CACHE_SIZE", "20000"))
+EVIDENCE_CACHE_DIR = os.getenv("EVIDENCE_CACHE_DIR") or None
+EVIDENCE_CACHE_DISK_MAX = int(os.getenv("EVIDENCE_CACHE_DISK_MAX", "200000"))
+class EvidenceCache:
+    def __init__(self, max_entries=None, cache_dir=None, disk_max=None):
+        self.max_entries = int(max_entries if max_entries is not None else EVIDENCE_CACHE_SIZE)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max = int(disk_max if disk_max is not None else EVIDENCE_CACHE_DISK_MAX)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_count = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+    @staticmethod
+    def key(text, model_name):
+        return hashlib.sha1(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+    def _disk_path(self, key):
+        return self.cache_dir.joinpath(key[:2], f"{key}.pt")
+    def _load_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        p = self._disk_path(key)
+        if not p.exists():
+            return None
+        try:
+            import torch
+            obj = torch.load(str(p), map_location="cpu")
+            os.utime(p)
+            return obj["sentences"], obj["embs"]
+        except Exception:
+            return None
+    def _save_disk(self, key, entry):
+        if self.cache_dir is None:
+            return
+        try:
+            import torch
+            p = self._disk_path(key)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            torch.save({"sentences": entry[0], "embs": entry[1]}, str(tmp))
+            existed = p.exists()
+            os.replace(tmp, p)
+        except Exception:
+            return
+        if self.disk_max <= 0:
+            return
+        with self._disk_lock:
+            if self._disk_count is None:
+                self._disk_count = sum(1 for _ in self.cache_dir.glob("*/*.pt"))
+            elif not existed:
+                self._disk_count += 1
+            if self._disk_count > self.disk_max:
+                self._prune_disk()
+    def _prune_disk(self):
+        files = []
+        for p in self.cache_dir.glob("*/*.pt"):
+            try:
+                files.append((p.stat().st_mtime, p))
+            except OSError:
+                pass
+        files.sort()
+        keep = self.disk_max - self.disk_max // 10
+        removed = 0
+        for _, p in files[:max(0, len(files) - keep)]:
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+        self._disk_count = len(files) - removed
+        self.disk_evictions += removed
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._load_disk(key)
+        with self._lock:
+            if entry is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._insert(key, entry)
+            else:
+                self.misses += 1
+        return entry
+    def put(self, key, sentences, embs):
+        entry = (list(sentences), embs.detach().cpu().clone() if hasattr(embs, "detach") else embs)
+        with self._lock:
+            self._insert(key, entry)
+        self._save_disk(key, entry)
+        return entry
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+_cache = None
+_cache_lock = threading.Lock()
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EvidenceCache(cache_dir=EVIDENCE_CACHE_DIR)
+    return _cache
@@ -0,0 +1,128 @@
+import difflib
+import heapq
+from array import array
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
+_N_BUCKETS = 38
+_BUCKETS = None
+def _bucket(c):
+    o = ord(c.lower())
+    if 97 <= o <= 122:
+        return o - 97
+    if 48 <= o <= 57:
+        return o - 22
+    return 36 if c == " " else 37
+def _buckets(s):
+    import numpy as np
+    global _BUCKETS
+    if _BUCKETS is None:
+        _BUCKETS = np.array([_bucket(chr(o)) for o in range(128)], dtype=np.int64)
+    cp = np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32)
+    return np.where(cp < 128, _BUCKETS[np.minimum(cp, 127)], _N_BUCKETS - 1)
+def _char_counts(s):
+    import numpy as np
+    return np.bincount(_buckets(s), minlength=_N_BUCKETS)
+class FuzzyIndex:
+    def __init__(self, keys, n=3, max_df=None, max_grams=10, max_postings=2000, n_verify=8):
+        self.keys = list(keys)
+        self.n = n
+        self.max_grams = max_grams
+        self.max_postings = max_postings
+        self.n_verify = n_verify
+        self.lengths = array("i", (len(k) for k in self.keys))
+        postings = {}
+        for i, k in enumerate(self.keys):
+            for g in self._grams(k):
+                p = postings.get(g)
+                if p is None:
+                    p = postings[g] = array("i")
+                p.append(i)
+        self.max_df = max_df or max(1000, len(self.keys) // 20)
+        self.postings = {g: p for g, p in postings.items() if len(p) <= self.max_df}
+        self._chars = self._char_table()
+    def _char_table(self, block=65536):
+        import numpy as np
+        lengths = np.frombuffer(self.lengths, dtype=np.int32) if len(self.keys) else np.zeros(0, dtype=np.int32)
+        order = np.argsort(lengths, kind="stable")
+        sorted_lengths = lengths[order]
+        dtype = np.uint8 if (lengths.max() if len(lengths) else 0) < 256 else np.uint16
+        counts = np.zeros((len(self.keys), _N_BUCKETS), dtype=dtype)
+        for start in range(0, len(order), block):
+            rows = order[start:start + block].tolist()
+            codes = _buckets("".join(self.keys[i] for i in rows))
+            owner = np.repeat(np.arange(len(rows)), sorted_lengths[start:start + len(rows)])
+            counts[start:start + len(rows)] = np.bincount(owner * _N_BUCKETS + codes, minlength=len(rows) * _N_BUCKETS).reshape(len(rows), _N_BUCKETS)
+        return order, sorted_lengths, counts
+    def __len__(self):
+        return len(self.keys)
+    def _grams(self, s):
+        if len(s) < self.n:
+            return {s} if s else set()
+        return {s[i:i + self.n] for i in range(len(s) - self.n + 1)}
+    def candidates(self, query, cutoff=0.7):
+        grams = [g for g in self._grams(query) if g in self.postings]
+        if not grams:
+            return None
+        grams.sort(key=lambda g: len(self.postings[g]))
+        lists = []
+        total = 0
+        for g in grams[:self.max_grams]:
+            p = self.postings[g]
+            if lists and total + len(p) > self.max_postings:
+                break
+            lists.append(p)
+            total += len(p)
+        counts = Counter(chain.from_iterable(lists))
+        lq = len(query)
+        lengths = self.lengths
+        ok = ((i, c) for i, c in counts.items() if 2.0 * min(lq, lengths[i]) >= cutoff * (lq + lengths[i]))
+        return [i for i, _ in heapq.nlargest(self.n_verify, ok, key=itemgetter(1))]
+    def get_close_match(self, query, cutoff=0.7):
+        import numpy as np
+        if not query or not self.keys:
+            return None
+        s = difflib.SequenceMatcher()
+        s.set_seq2(query)
+        best = None
+        seen = set()
+        masks = {}
+        for k, c in enumerate(query):
+            masks[c] = masks.get(c, 0) | (1 << k)
+        lq = len(query)
+        full = (1 << lq) - 1
+        def check(i):
+            nonlocal best
+            seen.add(i)
+            x = self.keys[i]
+            floor = cutoff if best is None else max(cutoff, best[0])
+            if 2.0 * min(lq, len(x)) / (lq + len(x)) < floor:
+                return
+            v = full
+            for c in x:
+                u = v & masks.get(c, 0)
+                v = ((v + u) | (v - u)) & full
+            if 2.0 * (lq - bin(v).count("1")) / (lq + len(x)) < floor:
+                return
+            s.set_seq1(x)
+            r = s.ratio()
+            if r >= cutoff and (best is None or (r, x) > best):
+                best = (r, x)
+        for i in self.candidates(query, cutoff) or ():
+            check(i)
+        order, lengths, counts = self._chars
+        floor = cutoff if best is None else best[0]
+        lo = np.searchsorted(lengths, lq * floor / (2.0 - floor) - 1e-9, side="left")
+        hi = np.searchsorted(lengths, lq * (2.0 - floor) / floor + 1e-9, side="right")
+        if lo >= hi:
+            return best[1] if best else None
+        inter = np.minimum(counts[lo:hi], np.minimum(_char_counts(query), np.iinfo(counts.dtype).max).astype(counts.dtype)).sum(axis=1, dtype=np.int64)
+        bound = 2.0 * inter / (lq + lengths[lo:hi])
+        keep = np.flatnonzero(bound >= floor - 1e-12)
+        for row in keep[np.argsort(-bound[keep], kind="stable")].tolist():
+            if bound[row] < (cutoff if best is None else best[0]) - 1e-12:
+                break
+            i = int(order[lo + row])
+            if i not in seen:
+                check(i)
+        return best[1] if best else None
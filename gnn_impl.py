@@ -1,27 +1,347 @@
-from sentence_transformers import SentenceTransformer, util
-EMB = SentenceTransformer("all-MiniLM-L6-v2")
+import os
+import re
+import sys
+import json
+import random
+from functools import lru_cache
+from pathlib import Path
+from model_registry import DEFAULT_MODEL, get_model
+import tracing
+GNN_HIDDEN = int(os.getenv("GNN_HIDDEN", "128"))
+GNN_LAYERS = int(os.getenv("GNN_LAYERS", "2"))
+GNN_EDGE_TOPK = int(os.getenv("GNN_EDGE_TOPK", "8"))
+GNN_ENTITY_FANOUT = int(os.getenv("GNN_ENTITY_FANOUT", "16"))
+GNN_THRESHOLD = float(os.getenv("GNN_THRESHOLD", "0.5"))
+EDGE_FEATURES = 5
+CLAIM_FEATURES = 5
+_ENTITY = re.compile(r"\b(?:[A-Z][\w'\-]+|\d[\d,.]*\d|\d)\b")
+def entities(text):
+    from bm25_index import STOPWORDS
+    return frozenset(e.lower() for e in _ENTITY.findall(text) if e.lower() not in STOPWORDS)
+def _unit(t):
+    import torch
+    return torch.nn.functional.normalize(t.float().cpu(), dim=-1)
+def build_graph(requests, claim_embs, evidence, topk=None, fanout=None):
+    import torch
+    topk = GNN_EDGE_TOPK if topk is None else topk
+    fanout = GNN_ENTITY_FANOUT if fanout is None else fanout
+    n_claims = sum(len(claims) for claims, _ in requests)
+    claim_x = _unit(claim_embs)
+    sent_parts = []
+    src = []
+    dst = []
+    attrs = []
+    feats = []
+    best_sent = []
+    plans = []
+    cpos = 0
+    spos = n_claims
+    def edge(a, b, attr):
+        src.extend((a, b))
+        dst.extend((b, a))
+        attrs.extend((attr, attr))
+    for claims, retrieved in requests:
+        ce = claim_x[cpos:cpos + len(claims)]
+        sents = []
+        snip = []
+        parts = []
+        for i, item in enumerate(retrieved):
+            ss, embs = evidence[item.get("snippet", "")]
+            sents.extend(ss)
+            snip.extend([i] * len(ss))
+            parts.append(embs)
+        se = _unit(torch.cat(parts))
+        sent_parts.append(se)
+        sims = ce @ se.T
+        c_ents = [entities(c) for c in claims]
+        s_ents = [entities(s) for s in sents]
+        by_ent = {}
+        for j, es in enumerate(s_ents):
+            for e in es:
+                by_ent.setdefault(e, []).append(j)
+        k = min(topk, len(sents))
+        top_vals, top = sims.topk(k, dim=1)
+        top = top.tolist()
+        top3 = top_vals[:, :3].mean(dim=1).tolist()
+        rows = sims.tolist()
+        for a, ents in enumerate(c_ents):
+            hits = {}
+            for e in ents:
+                for j in by_ent.get(e, ())[:fanout]:
+                    hits[j] = hits.get(j, 0) + 1
+            denom = float(len(ents)) or 1.0
+            for j in set(top[a]) | set(hits):
+                edge(cpos + a, spos + j, (rows[a][j], hits.get(j, 0) / denom, 1.0, 0.0, 0.0))
+            bj = top[a][0]
+            coverage = sum(1 for e in ents if e in by_ent) / denom if ents else 1.0
+            feats.append((rows[a][bj], top3[a], max(hits.values()) / denom if hits else 0.0, hits.get(bj, 0) / denom, coverage))
+            best_sent.append(spos + bj)
+        pairs = {}
+        for j in range(len(sents) - 1):
+            if snip[j] == snip[j + 1]:
+                pairs[(j, j + 1)] = 1
+        for js in by_ent.values():
+            js = js[:fanout]
+            for x in range(len(js)):
+                for y in range(x + 1, len(js)):
+                    if snip[js[x]] != snip[js[y]]:
+                        pairs.setdefault((js[x], js[y]), 2)
+        if pairs:
+            xs = torch.tensor([p[0] for p in pairs], dtype=torch.long)
+            ys = torch.tensor([p[1] for p in pairs], dtype=torch.long)
+            ss_sims = (se[xs] * se[ys]).sum(dim=1).tolist()
+            for (x, y), kind, sim in zip(pairs, pairs.values(), ss_sims):
+                inter = len(s_ents[x] & s_ents[y])
+                edge(spos + x, spos + y, (sim, inter / float(max(1, min(len(s_ents[x]), len(s_ents[y])))), 0.0, float(kind == 1), float(kind == 2)))
+        seg = torch.tensor(snip, dtype=torch.long).unsqueeze(0).expand(len(claims), -1)
+        per_snippet = torch.full((len(claims), len(retrieved)), float("-inf")).scatter_reduce(1, seg, sims, reduce="amax", include_self=True)
+        order = torch.sort(per_snippet, dim=1, descending=True, stable=True)
+        plans.append({"sentences": sents, "snippet_of": snip, "best": [b - spos for b in best_sent[-len(claims):]], "order": order.indices.tolist(), "order_sims": order.values.tolist()})
+        cpos += len(claims)
+        spos += len(sents)
+    x = torch.cat([claim_x] + sent_parts)
+    node_type = torch.zeros(x.shape[0], dtype=torch.long)
+    node_type[n_claims:] = 1
+    return {
+        "x": x,
+        "node_type": node_type,
+        "edge_index": torch.tensor([src, dst], dtype=torch.long).reshape(2, -1),
+        "edge_attr": torch.tensor(attrs, dtype=torch.float32).reshape(-1, EDGE_FEATURES),
+        "claim_feats": torch.tensor(feats, dtype=torch.float32).reshape(-1, CLAIM_FEATURES),
+        "best_sent": torch.tensor(best_sent, dtype=torch.long),
+        "n_claims": n_claims,
+        "plans": plans,
+    }
+def _empty_result(claim, best_snippet=None):
+    return {"claim": claim, "best_snippet": best_snippet, "best_sentence": None, "sim": 0.0, "prob_supported": 0.0, "supported": False, "top_evidence_idxs": [], "top_evidence_sims": []}
+@lru_cache(maxsize=1)
+def _net_class():
+    import torch
+    from torch import nn
+    class GraphNet(nn.Module):
+        def __init__(self, dim, hidden, layers):
+            super().__init__()
+            self.inp = nn.Linear(dim, hidden)
+            self.node_type = nn.Embedding(2, hidden)
+            self.gates = nn.ModuleList(nn.Linear(EDGE_FEATURES, 1) for _ in range(layers))
+            self.msgs = nn.ModuleList(nn.Linear(hidden, hidden, bias=False) for _ in range(layers))
+            self.updates = nn.ModuleList(nn.Linear(hidden, hidden) for _ in range(layers))
+            self.norms = nn.ModuleList(nn.LayerNorm(hidden) for _ in range(layers))
+            self.head = nn.Sequential(nn.Linear(2 * hidden + CLAIM_FEATURES, hidden), nn.ReLU(), nn.Linear(hidden, 1))
+            nn.init.zeros_(self.head[-1].weight)
+            nn.init.zeros_(self.head[-1].bias)
+            self.sim_scale = nn.Parameter(torch.tensor(12.0))
+            self.sim_bias = nn.Parameter(torch.tensor(0.65))
+        def forward(self, g):
+            h = self.inp(g["x"]) + self.node_type(g["node_type"])
+            n = h.shape[0]
+            src, dst = g["edge_index"][0], g["edge_index"][1]
+            for gate, msg, update, norm in zip(self.gates, self.msgs, self.updates, self.norms):
+                w = torch.sigmoid(gate(g["edge_attr"]).squeeze(-1))
+                deg = torch.zeros(n, dtype=w.dtype).index_add(0, dst, w).clamp_min(1e-6)
+                adj = torch.sparse_coo_tensor(torch.stack([dst, src]), w / deg[dst], (n, n))
+                h = norm(h + torch.relu(update(h) + torch.sparse.mm(adj, msg(h))))
+            f = g["claim_feats"]
+            z = torch.cat([h[:g["n_claims"]], h[g["best_sent"]], f], dim=1)
+            return self.sim_scale * (f[:, 0] - self.sim_bias) + self.head(z).squeeze(-1)
+    return GraphNet
 class GNNWrapper:
-    def __init__(self):
-        pass
-    def load_state_dict(self, sd):
-        return
+    def __init__(self, dim=None, hidden=None, layers=None):
+        self.config = {"dim": dim, "hidden": hidden or GNN_HIDDEN, "layers": layers or GNN_LAYERS, "model": DEFAULT_MODEL}
+        self.net = None
+        if dim:
+            self._build()
+    def _build(self):
+        self.net = _net_class()(int(self.config["dim"]), int(self.config["hidden"]), int(self.config["layers"]))
+    def load_state_dict(self, sd, strict=True):
+        if isinstance(sd, dict) and "state_dict" in sd:
+            self.config.update(sd.get("config") or {})
+            sd = sd["state_dict"]
+        if not self.config.get("dim"):
+            self.config["dim"] = int(sd["inp.weight"].shape[1])
+        self._build()
+        return self.net.load_state_dict(sd, strict=strict)
+    def state_dict(self):
+        return self.net.state_dict()
+    def checkpoint(self):
+        return {"config": dict(self.config), "state_dict": self.state_dict()}
+    def parameters(self):
+        return self.net.parameters()
+    def eval(self):
+        if self.net is not None:
+            self.net.eval()
+        return self
+    def train(self, mode=True):
+        if self.net is not None:
+            self.net.train(mode)
+        return self
+    def __call__(self, g):
+        return self.net(g)
+    def graph(self, requests, embedder=None):
+        from verifier import _encode_texts, _snippet_sentence_embeddings
+        embedder = embedder or get_model()
+        claims = [c for cl, _ in requests for c in cl]
+        evidence = _snippet_sentence_embeddings(embedder, [r for _, retrieved in requests for r in retrieved])
+        with tracing.stage("encode_claims", items=len(claims)):
+            claim_embs = _encode_texts(embedder, claims).float().cpu().clone()
+        with tracing.stage("gnn_graph", items=len(claims)) as st:
+            g = build_graph(requests, claim_embs, evidence)
+            st.set(nodes=int(g["x"].shape[0]), edges=int(g["edge_index"].shape[1]))
+        if self.net is None:
+            self.config["dim"] = int(g["x"].shape[1])
+            self._build()
+            self.eval()
+        return g
+    def predict_many(self, requests, params=None):
+        import torch
+        params = params or {}
+        threshold = float(params.get("threshold", GNN_THRESHOLD))
+        top_k = int(params.get("top_k", 3))
+        requests = [([c if isinstance(c, str) else str(c) for c in claims], list(retrieved)) for claims, retrieved in requests]
+        out = [[_empty_result(c, retrieved[0] if retrieved else None) for c in claims] for claims, retrieved in requests]
+        active = [i for i, (claims, retrieved) in enumerate(requests) if claims and retrieved]
+        if not active:
+            return out
+        g = self.graph([requests[i] for i in active], params.get("embedder"))
+        with tracing.stage("gnn_forward", items=g["n_claims"]), torch.inference_mode():
+            probs = torch.sigmoid(self(g)).tolist()
+        feats = g["claim_feats"].tolist()
+        pos = 0
+        for i, plan in zip(active, g["plans"]):
+            claims, retrieved = requests[i]
+            res = []
+            for a, claim in enumerate(claims):
+                p = float(probs[pos])
+                bj = plan["best"][a]
+                res.append({
+                    "claim": claim,
+                    "best_snippet": retrieved[plan["snippet_of"][bj]],
+                    "best_sentence": plan["sentences"][bj],
+                    "sim": float(max(feats[pos][0], 0.0)),
+                    "prob_supported": p,
+                    "supported": bool(p >= threshold),
+                    "top_evidence_idxs": [int(x) for x in plan["order"][a][:top_k]],
+                    "top_evidence_sims": [float(x) for x in plan["order_sims"][a][:top_k]],
+                })
+                pos += 1
+            out[i] = res
+        return out
     def predict(self, claims, evidence, params):
-        outs = []
-        evid_texts = [e.get("snippet","") for e in evidence]
-        if evid_texts:
-            evid_embs = EMB.encode(evid_texts, convert_to_tensor=True)
-        else:
-            evid_embs = None
-        for c in claims:
-            claim_emb = EMB.encode(c, convert_to_tensor=True)
-            prob = 0.0
-            top_idxs = []
-            top_sims = []
-            if evid_embs is not None:
-                sims = util.cos_sim(claim_emb, evid_embs)[0].cpu().numpy().tolist()
-                best_idx = int(max(range(len(sims)), key=lambda i: sims[i])) if sims else -1
-                prob = float(sims[best_idx]) if best_idx>=0 else 0.0
-                top_idxs = [best_idx]
-                top_sims = [prob]
-            outs.append({"claim": c, "prob_supported": prob, "supported": prob>0.65, "top_evidence_idxs": top_idxs, "top_evidence_sims": top_sims})
-        return outs
+        return self.predict_many([(claims, evidence)], params)[0]
+def _drop_word(sentence, rng):
+    words = sentence.split()
+    plain = [i for i, w in enumerate(words) if not _ENTITY.fullmatch(w.strip(".,;:"))]
+    if len(words) > 5 and plain:
+        del words[rng.choice(plain)]
+    return " ".join(words)
+def _swap_entity(sentence, pool_text, rng):
+    own = entities(sentence)
+    spans = [m for m in _ENTITY.finditer(sentence) if m.group(0).lower() in own]
+    if not spans:
+        return None
+    m = rng.choice(spans)
+    numeric = m.group(0)[0].isdigit()
+    pool = [e for e in _ENTITY.findall(pool_text) if e[0].isdigit() == numeric and e.lower() not in own and e.lower() in entities(e)]
+    if not pool:
+        return None
+    return sentence[:m.start()] + rng.choice(pool) + sentence[m.end():]
+def make_examples(groups, n, rng, claims_per=4, snippets_per=5):
+    from verifier import _split_into_sentences
+    groups = [g for g in groups if g]
+    if len(groups) < 2:
+        return [], []
+    def sentences(items):
+        return [s for r in items for s in _split_into_sentences(r.get("snippet", "")) if len(s.split()) >= 4]
+    requests = []
+    labels = []
+    while len(requests) < n:
+        a, b = rng.sample(range(len(groups)), 2)
+        retrieved = groups[a][:snippets_per]
+        own = sentences(retrieved)
+        foreign = sentences(groups[b][:snippets_per])
+        if not own or not foreign:
+            continue
+        claims = []
+        ys = []
+        for j in range(claims_per):
+            kind = j % 4
+            s = rng.choice(own)
+            if kind in (0, 3):
+                claims.append(_drop_word(s, rng))
+                ys.append(1.0)
+            elif kind == 1:
+                claims.append(_swap_entity(s, " ".join(foreign), rng) or rng.choice(foreign))
+                ys.append(0.0)
+            else:
+                claims.append(rng.choice(foreign))
+                ys.append(0.0)
+        requests.append((claims, retrieved))
+        labels.append(ys)
+    return requests, labels
+def load_groups(path):
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    groups = []
+    for item in items:
+        retrieved = []
+        for i, s in enumerate(item.get("retrieved", [])):
+            if isinstance(s, dict):
+                retrieved.append({"source": s.get("source") or s.get("id") or f"source_{i}", "snippet": s.get("snippet") or s.get("text") or ""})
+            else:
+                retrieved.append({"source": f"source_{i}", "snippet": str(s)})
+        groups.append(retrieved)
+    return groups
+def train(model, requests, labels, epochs=8, lr=2e-3, batch_size=32, embedder=None, seed=0, log=None):
+    import torch
+    torch.manual_seed(seed)
+    batches = []
+    for i in range(0, len(requests), batch_size):
+        g = model.graph(requests[i:i + batch_size], embedder)
+        y = torch.tensor([v for ys in labels[i:i + batch_size] for v in ys], dtype=torch.float32)
+        batches.append((g, y))
+    n = sum(int(y.shape[0]) for _, y in batches)
+    opt = torch.optim.Adam(model.parameters(), lr=lr)
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+    rng = random.Random(seed)
+    model.train()
+    for epoch in range(epochs):
+        rng.shuffle(batches)
+        total = 0.0
+        for g, y in batches:
+            opt.zero_grad()
+            loss = loss_fn(model(g), y)
+            loss.backward()
+            opt.step()
+            total += float(loss) * int(y.shape[0])
+        if log is not None:
+            log(epoch, total / max(n, 1))
+    model.eval()
+    return model
+def main(argv=None):
+    import argparse
+    import torch
+    from gnn_loader import MODEL_PATH
+    ap = argparse.ArgumentParser(description="Train the claim-evidence graph verifier on self-supervised examples built from retrieval results")
+    ap.add_argument("--retrieval", default=str(Path(__file__).parent.joinpath("data", "retrieval_results.json")))
+    ap.add_argument("--examples", type=int, default=4000)
+    ap.add_argument("--epochs", type=int, default=8)
+    ap.add_argument("--lr", type=float, default=2e-3)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=str(MODEL_PATH))
+    args = ap.parse_args(argv)
+    groups = load_groups(args.retrieval)
+    requests, labels = make_examples(groups, args.examples, random.Random(args.seed))
+    if not requests:
+        print("not enough retrieval groups in", args.retrieval, file=sys.stderr)
+        return 1
+    model = GNNWrapper()
+    train(model, requests, labels, epochs=args.epochs, lr=args.lr, batch_size=args.batch_size, seed=args.seed,
+          log=lambda e, loss: print(f"epoch {e + 1}: loss {loss:.4f}", file=sys.stderr, flush=True))
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    torch.save(model.checkpoint(), str(out))
+    print("saved", out)
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
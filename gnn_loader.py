@@ -1,11 +1,7 @@
 import os
 from pathlib import Path
+import tracing
 MODEL_PATH = Path(__file__).parent.joinpath("models","gnn.pth")
-try:
-    from gnn_impl import GNNWrapper
-    GNN_IMPL_AVAILABLE = True
-except Exception:
-    GNN_IMPL_AVAILABLE = False
 MODEL = None
 def load_gnn(model_path=None):
     global MODEL
@@ -15,7 +11,9 @@ def load_gnn(model_path=None):
         model_path = MODEL_PATH
     if not model_path.exists():
         return None
-    if not GNN_IMPL_AVAILABLE:
+    try:
+        from gnn_impl import GNNWrapper
+    except Exception:
         return None
     try:
         import torch
@@ -28,9 +26,28 @@ def load_gnn(model_path=None):
 def predict_with_gnn(claims, evidence, params=None):
     m = load_gnn()
     if m is None:
+        tracing.incr("gnn_unavailable")
         return None
-    try:
-        out = m.predict(claims, evidence, params or {})
-        return out
-    except Exception:
+    with tracing.stage("gnn", items=len(claims)) as st:
+        st.set(evidence=len(evidence))
+        try:
+            out = m.predict(claims, evidence, params or {})
+            return out
+        except Exception:
+            tracing.incr("gnn_errors")
+            return None
+def predict_many_with_gnn(requests, params=None):
+    m = load_gnn()
+    if m is None:
+        tracing.incr("gnn_unavailable")
         return None
+    requests = [(list(claims), list(evidence)) for claims, evidence in requests]
+    with tracing.stage("gnn", items=sum(len(c) for c, _ in requests)) as st:
+        st.set(requests=len(requests), evidence=sum(len(e) for _, e in requests))
+        try:
+            return m.predict_many(requests, params or {})
+        except Exception:
+            tracing.incr("gnn_errors")
+            return None
+def warmup():
+    return load_gnn()
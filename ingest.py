@@ -0,0 +1,484 @@
+import os
+import sys
+import json
+import time
+import uuid
+import heapq
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+import embedding_store
+import snippet_store
+import tracing
+LIVE_DIR = Path(os.getenv("LIVE_CORPUS_DIR", str(embedding_store.STORE_DIR.joinpath("live"))))
+LIVE_REFRESH_S = float(os.getenv("LIVE_REFRESH_S", "2"))
+COMPACT_INTERVAL_S = float(os.getenv("COMPACT_INTERVAL_S", "600"))
+COMPACT_MAX_SEGMENTS = int(os.getenv("COMPACT_MAX_SEGMENTS", "8"))
+COMPACT_TOMBSTONE_RATIO = float(os.getenv("COMPACT_TOMBSTONE_RATIO", "0.2"))
+COMPACT_MAX_TOMBSTONES = int(os.getenv("COMPACT_MAX_TOMBSTONES", "1000"))
+SEGMENT_GRACE_S = float(os.getenv("SEGMENT_GRACE_S", "300"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+def content_hash(source, text):
+    return hashlib.sha1(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+def _manifest_path(root):
+    return Path(root).joinpath("manifest.json")
+def read_manifest(root=None):
+    try:
+        with open(_manifest_path(root or LIVE_DIR), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+def _write_manifest(root, manifest):
+    p = _manifest_path(root)
+    tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, p)
+@contextmanager
+def _writer_lock(root):
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root.joinpath(".lock"), "a+") as f:
+        try:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        try:
+            yield
+        finally:
+            try:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            except ImportError:
+                pass
+class Segment:
+    def __init__(self, root):
+        import numpy as np
+        self.root = Path(root)
+        self.name = self.root.name
+        self.snippets = snippet_store.SnippetStore(self.root)
+        self.hashes = np.load(str(self.root.joinpath("hashes.npy")), mmap_mode="r")
+        self.embeddings = np.load(str(self.root.joinpath("embeddings.npy")), mmap_mode="r")
+        self._dense = None
+        self._bm25 = None
+        self._dead = (None, None)
+    def __len__(self):
+        return len(self.snippets)
+    def hash(self, i):
+        return self.hashes[i].decode("ascii")
+    def dense(self):
+        if self._dense is None:
+            import ann_index
+            self._dense = ann_index.load_or_build(self.embeddings, key=f"live_{self.name}")
+        return self._dense
+    def bm25(self):
+        if self._bm25 is None:
+            import bm25_index
+            self._bm25 = bm25_index.BM25Index(self.root.joinpath("bm25"))
+        return self._bm25
+    def dead_rows(self, tombstones):
+        import numpy as np
+        if self._dead[0] is not tombstones:
+            rows = np.flatnonzero(np.isin(self.hashes, np.asarray(sorted(tombstones), dtype="S40"))) if tombstones else np.zeros(0, dtype=np.int64)
+            self._dead = (tombstones, rows)
+        return self._dead[1]
+def _write_segment(root, rows, embs):
+    import numpy as np
+    import bm25_index
+    name = f"seg_{int(time.time() * 1000):013d}_{uuid.uuid4().hex[:6]}"
+    out = Path(root).joinpath(name)
+    tmp = out.with_name(f"{name}.{os.getpid()}.tmp")
+    snippet_store.write_snippets(tmp, ((src, text) for src, text, _ in rows))
+    np.save(str(tmp.joinpath("hashes.npy")), np.asarray([h for _, _, h in rows], dtype="S40"))
+    np.save(str(tmp.joinpath("embeddings.npy")), np.ascontiguousarray(embs, dtype=np.float32))
+    bm25_index.build([{"source": src, "snippet": text} for src, text, _ in rows], tmp.joinpath("bm25"))
+    os.replace(tmp, out)
+    return name
+def _encode(texts, model):
+    import numpy as np
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray(model.encode(texts, batch_size=256, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False), dtype=np.float32)
+def _model(name):
+    from model_registry import get_model
+    return get_model(name)
+def _key_mismatch(manifest):
+    from model_registry import model_key
+    stored = manifest.get("model_key", manifest.get("model"))
+    active = model_key(manifest.get("model"))
+    return None if stored == active else f"live corpus was embedded with {stored} but the active encoder is {active}"
+class LiveCorpus:
+    def __init__(self, root=None, refresh_s=None):
+        self.root = Path(root or LIVE_DIR)
+        self.refresh_s = LIVE_REFRESH_S if refresh_s is None else refresh_s
+        self.segments = []
+        self.tombstones = frozenset()
+        self.version = None
+        self.model_name = None
+        self.mismatch = None
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_s:
+            return False
+        self._checked = now
+        try:
+            st = _manifest_path(self.root).stat()
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return False
+        if stamp == self._stamp:
+            return False
+        with self._lock:
+            manifest = read_manifest(self.root)
+            if manifest is None or manifest.get("version") == self.version:
+                self._stamp = stamp
+                return False
+            current = {s.name: s for s in self.segments}
+            segments = []
+            for name in manifest["segments"]:
+                seg = current.get(name)
+                segments.append(seg if seg is not None else Segment(self.root.joinpath(name)))
+            self.segments = segments
+            self.tombstones = frozenset(manifest.get("tombstones", []))
+            self.version = manifest.get("version")
+            self.model_name = manifest.get("model")
+            self.mismatch = _key_mismatch(manifest)
+            self._stamp = stamp
+        tracing.incr("live_corpus_reloads")
+        return True
+    def __len__(self):
+        return sum(len(s) for s in self.segments)
+    def live_rows(self):
+        return sum(len(s) for s in self.segments) - len(self.tombstones)
+    def row(self, seg_i, i, score, **extra):
+        seg = self.segments[seg_i]
+        s = seg.snippets[i]
+        out = {"id": f"live_{seg.hash(i)[:12]}", "live_ref": [seg.name, int(i)], "source": s["source"], "snippet": s["snippet"], "score": float(score)}
+        out.update(extra)
+        return out
+    def embedding(self, ref):
+        if self.mismatch:
+            return None
+        for seg in self.segments:
+            if seg.name == ref[0]:
+                return seg.embeddings[int(ref[1])]
+        return None
+    def _merge(self, per_segment, k):
+        seen = set()
+        out = []
+        for score, seg_i, i in heapq.merge(*per_segment, key=lambda x: -x[0]):
+            h = self.segments[seg_i].hashes[i]
+            if h in seen or h.decode("ascii") in self.tombstones:
+                continue
+            seen.add(h)
+            out.append((score, seg_i, i))
+            if len(out) >= k:
+                break
+        return out
+    def dense_search(self, q_emb, k):
+        per = []
+        for seg_i, seg in enumerate(self.segments):
+            if not len(seg):
+                continue
+            extra = min(len(seg.dead_rows(self.tombstones)), COMPACT_MAX_TOMBSTONES)
+            vals, idxs = seg.dense().search(q_emb, min(len(seg), k + extra))
+            per.append([(float(v), seg_i, int(i)) for v, i in zip(vals[0].tolist(), idxs[0].tolist()) if i >= 0])
+        return self._merge(per, k)
+    def rescore(self, q_emb, candidates):
+        import numpy as np
+        q = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        out = []
+        by_seg = {}
+        for _, seg_i, i in candidates:
+            by_seg.setdefault(seg_i, []).append(i)
+        for seg_i, rows in by_seg.items():
+            sims = np.asarray(self.segments[seg_i].embeddings[rows], dtype=np.float32) @ q
+            out.extend((float(v), seg_i, i) for v, i in zip(sims.tolist(), rows))
+        out.sort(key=lambda x: (-x[0], x[1], x[2]))
+        return out
+    def bm25_search(self, question, k):
+        per = []
+        for seg_i, seg in enumerate(self.segments):
+            if not len(seg):
+                continue
+            scores, idxs = seg.bm25().search(question, k, exclude=seg.dead_rows(self.tombstones))
+            per.append([(float(v), seg_i, int(i)) for v, i in zip(scores.tolist(), idxs.tolist())])
+        return self._merge(per, k)
+    def search(self, question, top_k, encoder=None, bm25_k=100, dense_k=100, mode="hybrid"):
+        self.refresh()
+        sparse = None
+        if mode != "dense":
+            with tracing.stage("live_bm25_search", items=len(self)):
+                sparse = self.bm25_search(question, max(top_k, bm25_k))
+        dense = None
+        if mode != "bm25":
+            try:
+                if self.mismatch:
+                    tracing.incr("live_encoder_mismatch")
+                    raise RuntimeError(self.mismatch + "; run `python ingest.py init --force` to re-embed")
+                encoder = encoder or _model(self.model_name)
+                with tracing.stage("hotpot_encode", items=1):
+                    q_emb = encoder.encode(question, convert_to_numpy=True, normalize_embeddings=True)
+                if mode == "hybrid" and sparse:
+                    with tracing.stage("live_dense_rescore", items=len(sparse)):
+                        dense = self.rescore(q_emb, sparse)
+                else:
+                    with tracing.stage("live_dense_search", items=len(self)) as st:
+                        dense = self.dense_search(q_emb, max(top_k, dense_k) if sparse is not None else top_k)
+                        st.set(segments=len(self.segments))
+            except RuntimeError:
+                if sparse is None:
+                    raise
+                tracing.incr("hybrid_dense_unavailable")
+        if dense is None:
+            return [self.row(seg_i, i, sc, bm25_score=sc) for sc, seg_i, i in sparse[:top_k]]
+        if sparse is None:
+            return [self.row(seg_i, i, sc) for sc, seg_i, i in dense[:top_k]]
+        fused = {}
+        dense_scores = {}
+        bm25_scores = {}
+        for rank, (sc, seg_i, i) in enumerate(dense):
+            fused[(seg_i, i)] = fused.get((seg_i, i), 0.0) + 1.0 / (RRF_K + 1 + rank)
+            dense_scores[(seg_i, i)] = sc
+        for rank, (sc, seg_i, i) in enumerate(sparse):
+            fused[(seg_i, i)] = fused.get((seg_i, i), 0.0) + 1.0 / (RRF_K + 1 + rank)
+            bm25_scores[(seg_i, i)] = sc
+        best = sorted(fused.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+        return [self.row(seg_i, i, sc, dense_score=dense_scores.get((seg_i, i)), bm25_score=bm25_scores.get((seg_i, i))) for (seg_i, i), sc in best]
+def _live_hashes(root, manifest):
+    live = {}
+    for name in manifest["segments"]:
+        seg = Segment(Path(root).joinpath(name))
+        for h in seg.hashes:
+            live.setdefault(h.decode("ascii"), name)
+    return live
+def _pairs_with_hashes(pairs):
+    rows = []
+    seen = set()
+    for src, text in pairs:
+        h = content_hash(src, text)
+        if h in seen:
+            continue
+        seen.add(h)
+        rows.append((src, text, h))
+    return rows
+def init(path=None, root=None, model_name=None, force=False):
+    root = Path(root or LIVE_DIR)
+    path = Path(path or embedding_store.HOTPOT_PATH)
+    model_name = model_name or embedding_store.MODEL_NAME
+    with _writer_lock(root):
+        if read_manifest(root) is not None and not force:
+            raise RuntimeError(f"live corpus already initialised in {root}")
+        pairs = list(snippet_store.iter_hotpot_snippets(path)) if path.exists() else []
+        rows = [(src, text, content_hash(src, text)) for src, text in pairs]
+        embs = embedding_store.load_embeddings(len(pairs), model_name, path) if pairs else None
+        if embs is None:
+            embs = _encode([text for _, text, _ in rows], _model(model_name))
+        name = _write_segment(root, rows, embs)
+        old = read_manifest(root)
+        retired, due = _retire(old, old["segments"]) if old is not None else ([], [])
+        from model_registry import model_key
+        _write_manifest(root, {"version": 1 if old is None else old["version"] + 1, "model": model_name, "model_key": model_key(model_name), "segments": [name],
+                               "tombstones": [], "retired": retired})
+        _remove_segments(root, due)
+    return {"segments": 1, "rows": len(rows)}
+def ingest(pairs, root=None, sync=False, model=None):
+    root = Path(root or LIVE_DIR)
+    with _writer_lock(root):
+        manifest = read_manifest(root)
+        if manifest is None:
+            raise RuntimeError(f"live corpus not initialised in {root}; run `python ingest.py init` first")
+        mismatch = _key_mismatch(manifest)
+        if mismatch:
+            raise RuntimeError(mismatch + "; run `python ingest.py init --force` to re-embed")
+        rows = _pairs_with_hashes(pairs)
+        live = _live_hashes(root, manifest)
+        tombstones = set(manifest.get("tombstones", []))
+        wanted = {h for _, _, h in rows}
+        new = [r for r in rows if r[2] not in live]
+        restored = [h for h in wanted if h in tombstones]
+        removed = [h for h in live if h not in wanted and h not in tombstones] if sync else []
+        tombstones.difference_update(restored)
+        tombstones.update(removed)
+        segments = list(manifest["segments"])
+        if new:
+            embs = _encode([text for _, text, _ in new], model or _model(manifest["model"]))
+            segments.append(_write_segment(root, new, embs))
+        if new or restored or removed:
+            _write_manifest(root, dict(manifest, version=manifest["version"] + 1, segments=segments, tombstones=sorted(tombstones)))
+    return {"added": len(new), "restored": len(restored), "deleted": len(removed), "unchanged": len(rows) - len(new) - len(restored), "segments": len(segments)}
+def delete(hashes=(), sources=(), root=None):
+    root = Path(root or LIVE_DIR)
+    with _writer_lock(root):
+        manifest = read_manifest(root)
+        if manifest is None:
+            raise RuntimeError(f"live corpus not initialised in {root}")
+        tombstones = set(manifest.get("tombstones", []))
+        before = len(tombstones)
+        hashes = set(hashes)
+        sources = set(sources)
+        for name in manifest["segments"]:
+            seg = Segment(root.joinpath(name))
+            for i in range(len(seg)):
+                h = seg.hash(i)
+                if h in hashes or (sources and seg.snippets.source(i) in sources):
+                    tombstones.add(h)
+        if len(tombstones) != before:
+            _write_manifest(root, dict(manifest, version=manifest["version"] + 1, tombstones=sorted(tombstones)))
+    return {"deleted": len(tombstones) - before}
+def needs_compaction(manifest, total_rows=None):
+    if manifest is None:
+        return False
+    if len(manifest["segments"]) > COMPACT_MAX_SEGMENTS:
+        return True
+    tomb = len(manifest.get("tombstones", []))
+    if tomb > COMPACT_MAX_TOMBSTONES:
+        return True
+    return bool(tomb and total_rows and tomb / float(total_rows) > COMPACT_TOMBSTONE_RATIO)
+def _retire(manifest, names, now=None):
+    now = time.time() if now is None else now
+    retired = [list(r) for r in manifest.get("retired", [])] + [[name, now] for name in names]
+    return [r for r in retired if now - r[1] < SEGMENT_GRACE_S], [r[0] for r in retired if now - r[1] >= SEGMENT_GRACE_S]
+def _remove_segments(root, names):
+    import ann_index
+    for name in names:
+        shutil.rmtree(Path(root).joinpath(name), ignore_errors=True)
+        for backend in ann_index.BACKENDS:
+            if backend == "exact":
+                continue
+            try:
+                ann_index.index_path(f"live_{name}", backend).unlink()
+            except (OSError, AttributeError):
+                pass
+def compact(root=None, if_needed=False):
+    import numpy as np
+    root = Path(root or LIVE_DIR)
+    with _writer_lock(root):
+        manifest = read_manifest(root)
+        if manifest is None:
+            raise RuntimeError(f"live corpus not initialised in {root}")
+        segments = [Segment(root.joinpath(name)) for name in manifest["segments"]]
+        total = sum(len(s) for s in segments)
+        if if_needed and not needs_compaction(manifest, total):
+            retired, due = _retire(manifest, [])
+            if due:
+                _write_manifest(root, dict(manifest, retired=retired))
+                _remove_segments(root, due)
+            return {"compacted": False, "segments": len(segments), "rows": total, "removed": len(due)}
+        tombstones = set(manifest.get("tombstones", []))
+        rows = []
+        parts = []
+        seen = set()
+        for seg in segments:
+            keep = []
+            for i in range(len(seg)):
+                h = seg.hash(i)
+                if h in tombstones or h in seen:
+                    continue
+                seen.add(h)
+                keep.append(i)
+                rows.append((seg.snippets.source(i), seg.snippets.text(i), h))
+            if keep:
+                parts.append(np.asarray(seg.embeddings[keep], dtype=np.float32))
+        embs = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        name = _write_segment(root, rows, embs)
+        retired, due = _retire(manifest, manifest["segments"])
+        _write_manifest(root, dict(manifest, version=manifest["version"] + 1, segments=[name], tombstones=[], retired=retired))
+        _remove_segments(root, due)
+    return {"compacted": True, "segments": 1, "rows": len(rows), "dropped": total - len(rows), "removed": len(due)}
+_compactor = None
+def start_background_compaction(interval=None, root=None):
+    global _compactor
+    interval = COMPACT_INTERVAL_S if interval is None else interval
+    if _compactor is not None or interval <= 0:
+        return _compactor
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                if read_manifest(root) is not None:
+                    with tracing.stage("compact"):
+                        compact(root, if_needed=True)
+            except Exception:
+                pass
+    _compactor = threading.Thread(target=loop, name="live-corpus-compactor", daemon=True)
+    _compactor.start()
+    return _compactor
+_live = None
+_live_lock = threading.Lock()
+def get_live_corpus():
+    global _live
+    if _live is None:
+        if not _manifest_path(LIVE_DIR).exists():
+            return None
+        with _live_lock:
+            if _live is None:
+                _live = LiveCorpus()
+    return _live
+def status(root=None):
+    root = Path(root or LIVE_DIR)
+    manifest = read_manifest(root)
+    if manifest is None:
+        return {"initialised": False, "root": str(root)}
+    sizes = [len(Segment(root.joinpath(n))) for n in manifest["segments"]]
+    return {"initialised": True, "root": str(root), "version": manifest["version"], "model": manifest.get("model_key", manifest["model"]), "encoder_mismatch": _key_mismatch(manifest), "segments": len(sizes),
+            "rows": sum(sizes), "tombstones": len(manifest.get("tombstones", [])), "retired": len(manifest.get("retired", [])), "needs_compaction": needs_compaction(manifest, sum(sizes))}
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Append-only ingestion into the segmented fallback corpus")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("init", help="bootstrap the live corpus from a HotpotQA-style JSONL file (reuses stored embeddings)")
+    p.add_argument("path", nargs="?", default=str(embedding_store.HOTPOT_PATH))
+    p.add_argument("--force", action="store_true")
+    p = sub.add_parser("add", help="embed and append paragraphs that are not in the live corpus yet")
+    p.add_argument("path")
+    p.add_argument("--sync", action="store_true", help="also tombstone live paragraphs missing from the file")
+    p = sub.add_parser("delete", help="tombstone paragraphs by content hash or source title")
+    p.add_argument("--hash", action="append", default=[])
+    p.add_argument("--source", action="append", default=[])
+    p = sub.add_parser("compact", help="merge segments and drop tombstoned rows")
+    p.add_argument("--if-needed", action="store_true")
+    sub.add_parser("status")
+    p = sub.add_parser("watch", help="sync a JSONL file into the live corpus whenever it changes, compacting as needed")
+    p.add_argument("path", nargs="?", default=str(embedding_store.HOTPOT_PATH))
+    p.add_argument("--interval", type=float, default=10.0)
+    args = ap.parse_args(argv)
+    if args.cmd == "init":
+        out = init(args.path, force=args.force)
+    elif args.cmd == "add":
+        out = ingest(snippet_store.iter_hotpot_snippets(args.path), sync=args.sync)
+    elif args.cmd == "delete":
+        out = delete(args.hash, args.source)
+    elif args.cmd == "compact":
+        out = compact(if_needed=args.if_needed)
+    elif args.cmd == "status":
+        out = status()
+    else:
+        path = Path(args.path)
+        last = None
+        while True:
+            try:
+                st = path.stat()
+                stamp = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                stamp = None
+            if stamp is not None and stamp != last:
+                print(json.dumps(ingest(snippet_store.iter_hotpot_snippets(path), sync=True)), flush=True)
+                last = stamp
+            res = compact(if_needed=True)
+            if res["compacted"]:
+                print(json.dumps(res), flush=True)
+            time.sleep(args.interval)
+    print(json.dumps(out))
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
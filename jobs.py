@@ -0,0 +1,209 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+load_dotenv()
+import tracing
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_CACHE_SIZE = int(os.getenv("JOB_CACHE_SIZE", "256"))
+JOB_CACHE_TTL_S = float(os.getenv("JOB_CACHE_TTL_S", "3600"))
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.status = "queued"
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.cacheable = True
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+    def update(self, stage=None, progress=None, **partial):
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            if progress is not None:
+                self.progress = max(self.progress, min(1.0, float(progress)))
+            self.partial.update(partial)
+    def snapshot(self):
+        with self._lock:
+            return {"id": self.id, "status": self.status, "stage": self.stage, "progress": self.progress, "partial": dict(self.partial),
+                    "result": self.result, "error": self.error, "created": self.created, "started": self.started, "finished": self.finished}
+    @property
+    def done(self):
+        return self._done.is_set()
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.result
+    def _start(self):
+        with self._lock:
+            self.status = "running"
+            self.started = time.time()
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.status = "error" if error is not None else "done"
+            self.stage = "Failed" if error is not None else "Done"
+            if error is None:
+                self.progress = 1.0
+            self.finished = time.time()
+        self._done.set()
+class JobPool:
+    def __init__(self, workers=None, cache_size=None, ttl_s=None):
+        self.workers = int(workers or JOB_WORKERS)
+        self.cache_size = int(cache_size if cache_size is not None else JOB_CACHE_SIZE)
+        self.ttl_s = float(ttl_s if ttl_s is not None else JOB_CACHE_TTL_S)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._by_key = OrderedDict()
+        self._by_id = {}
+        self.submitted = 0
+        self.memo_hits = 0
+        self.joined = 0
+    def _fresh(self, job, now):
+        if job.status == "error" or not job.cacheable:
+            return False
+        return job.finished is None or now - job.finished < self.ttl_s
+    def _evict(self):
+        if len(self._by_key) <= self.cache_size:
+            return
+        for key in list(self._by_key):
+            if len(self._by_key) <= self.cache_size:
+                break
+            job = self._by_key[key]
+            if job.done:
+                del self._by_key[key]
+                self._by_id.pop(job.id, None)
+    def submit(self, key, fn, *args, **kwargs):
+        now = time.time()
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and self._fresh(job, now):
+                self._by_key.move_to_end(key)
+                if job.done:
+                    self.memo_hits += 1
+                    tracing.incr("job_memo_hits")
+                else:
+                    self.joined += 1
+                    tracing.incr("job_joined")
+                return job
+            if job is not None:
+                self._by_id.pop(job.id, None)
+            job = Job(key)
+            self._by_key[key] = job
+            self._by_id[job.id] = job
+            self.submitted += 1
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+    def _run(self, job, fn, args, kwargs):
+        job._start()
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            tracing.incr("job_errors")
+            job._finish(error=f"{type(e).__name__}: {e}")
+        else:
+            job._finish(result)
+    def get(self, job_id):
+        with self._lock:
+            return self._by_id.get(job_id)
+    def stats(self):
+        with self._lock:
+            jobs = list(self._by_key.values())
+            return {"workers": self.workers, "submitted": self.submitted, "memo_hits": self.memo_hits, "joined": self.joined,
+                    "cached": len(jobs), "running": sum(1 for j in jobs if j.status == "running"), "queued": sum(1 for j in jobs if j.status == "queued")}
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
+_pool = None
+_pool_lock = threading.Lock()
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = JobPool()
+    return _pool
+def job_key(question, top_k, rerank, gnn):
+    return (" ".join(str(question).split()), int(top_k), bool(rerank), bool(gnn))
+def warmup_job(job, gnn=True):
+    import warmup
+    job.update("Loading models and indexes", 0.1)
+    return warmup.warmup(gnn=gnn)
+def check_question(job, question, top_k, rerank=True, gnn=True, stream=False):
+    from retriever import retrieve, rerank_candidates
+    from llm_client import ask_llm, ask_llm_stream, is_failure
+    from pipeline import (SIM_THRESHOLD, ClaimStream, apply_gnn, final_status, is_conclusion, parse_claims_from_llm,
+                          score_verdicts, verify_with_annotations)
+    import answer_cache
+    scope = ("ui", int(top_k), bool(rerank), bool(gnn))
+    with tracing.trace("ui", question=question, top_k=int(top_k), rerank=rerank, gnn=gnn) as trace:
+        job.update("Checking answer cache", 0.02)
+        cached, info, q_emb = answer_cache.lookup(question, scope)
+        if info is not None:
+            return dict(cached, question=question, cache=info, trace=trace.to_dict())
+        job.update("Retrieving evidence", 0.05)
+        retriever_error = None
+        try:
+            candidates = retrieve(question, top_k=max(50, top_k))
+            if rerank:
+                try:
+                    candidates = rerank_candidates(question, candidates, top_k=top_k)
+                except Exception:
+                    candidates = candidates[:top_k]
+            retrieved = candidates[:top_k]
+        except Exception as e:
+            retrieved = []
+            retriever_error = "Retriever error: " + str(e)
+        job.update("Getting LLM answer", 0.25, retrieved=retrieved, match=trace.attrs.get("match"), retriever_error=retriever_error)
+        verif = []
+        llm_failed = False
+        if stream:
+            claim_stream = ClaimStream()
+            answer = ""
+            def verify_ready(parsed_claims):
+                for p in parsed_claims:
+                    if is_conclusion(p.get("claim", "")):
+                        continue
+                    verif.append(verify_with_annotations([p["claim"]], [p.get("annotated_idx")], retrieved, sim_threshold=SIM_THRESHOLD)[0])
+            try:
+                for delta in ask_llm_stream(question, retrieved):
+                    llm_failed = llm_failed or is_failure(delta)
+                    answer += delta
+                    verify_ready(claim_stream.feed(delta))
+                    job.update("Streaming LLM answer", min(0.8, 0.25 + len(answer) / 4000.0), llm_answer=answer, verdicts=list(verif))
+            except Exception as e:
+                llm_failed = True
+                answer += f"\nLLM call failed: {e}"
+            verify_ready(claim_stream.close())
+            job.update("Verifying claims", 0.85, llm_answer=answer, verdicts=list(verif))
+        else:
+            try:
+                answer = ask_llm(question, retrieved)
+                llm_failed = is_failure(answer)
+            except Exception as e:
+                llm_failed = True
+                answer = f"LLM call failed: {e}"
+            job.update("Extracting claims", 0.6, llm_answer=answer)
+            parsed = [p for p in parse_claims_from_llm(answer) if not is_conclusion(p.get("claim", ""))]
+            job.update("Running verifier", 0.7)
+            verif = verify_with_annotations([p["claim"] for p in parsed], [p.get("annotated_idx") for p in parsed], retrieved, sim_threshold=SIM_THRESHOLD)
+        if gnn and verif:
+            job.update("Running GNN verifier", 0.9, verdicts=list(verif))
+            verif = apply_gnn(verif, retrieved)
+        score = score_verdicts(verif)
+    result = {"question": question, "retrieved": retrieved, "retriever_error": retriever_error, "match": trace.attrs.get("match"), "llm_answer": answer,
+              "verdicts": verif, "score": score, "status": final_status(score), "trace": trace.to_dict(), "cache": None}
+    job.cacheable = retriever_error is None and not llm_failed
+    if job.cacheable:
+        answer_cache.store(question, result, scope, q_emb)
+    return result
@@ -1,6 +1,20 @@
 import os
+import time
+import random
+import json
+import queue
+import asyncio
+import threading
+import weakref
 from dotenv import load_dotenv
+import tracing
 load_dotenv()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+GEN_PARAMS = {"max_tokens": 512, "temperature": 0.0}
 def _make_prompt(question, retrieved):
     context = "\n\n".join([f"{i}: {r.get('source','')} — {r.get('snippet','')}" for i, r in enumerate(retrieved[:10])])
     if context:
@@ -16,38 +30,237 @@ def _make_prompt(question, retrieved):
             f"Question: {question}"
         )
     return prompt
-def ask_llm(question, retrieved):
-    key = os.getenv("OPENAI_API_KEY")
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    if not key:
-        return "LLM not configured (OPENAI_API_KEY missing)."
-    prompt = _make_prompt(question, retrieved)
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=key)
+class LLMError(RuntimeError):
+    pass
+class LLMFailure(str):
+    failed = True
+def is_failure(answer):
+    return isinstance(answer, LLMFailure)
+def _backoff_delay(attempt, base, cap, retry_after=None):
+    if retry_after:
         try:
-            resp = client.chat.completions.create(model=model, messages=[{"role": "user", "content": prompt}], max_tokens=512, temperature=0.0)
-            try:
-                choice = resp.choices[0].message.content
-            except Exception:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+class LLMClient:
+    def __init__(self, api_key=None, model=None, base_url=None, concurrency=None, timeout=None, max_retries=None, backoff_base=0.5, backoff_max=20.0):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        self.base_url = (base_url or OPENAI_BASE_URL).rstrip("/")
+        self.concurrency = int(concurrency or LLM_CONCURRENCY)
+        self.timeout = float(timeout or LLM_TIMEOUT)
+        self.max_retries = int(LLM_MAX_RETRIES if max_retries is None else max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = None
+        self._sem = None
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._client
+    def payload(self, prompt, max_tokens=512, temperature=0.0, **params):
+        body = {"model": self.model, "messages": [{"role": "user", "content": prompt}], "max_tokens": max_tokens, "temperature": temperature}
+        body.update(params)
+        return body
+    async def chat(self, prompt, max_tokens=512, temperature=0.0, **params):
+        import httpx
+        client = self._http()
+        body = self.payload(prompt, max_tokens=max_tokens, temperature=temperature, **params)
+        async with self._sem:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    resp = await client.post("/chat/completions", json=body)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    err = LLMError(f"{type(e).__name__}: {e}")
+                else:
+                    if resp.status_code < 400:
+                        try:
+                            content = resp.json()["choices"][0]["message"]["content"]
+                        except Exception:
+                            content = None
+                        if not isinstance(content, str):
+                            raise LLMError(f"malformed completion: {resp.text[:500]}")
+                        return content.strip()
+                    err = LLMError(f"HTTP {resp.status_code}: {resp.text[:500]}")
+                    if resp.status_code not in RETRY_STATUSES:
+                        raise err
+                    retry_after = resp.headers.get("retry-after")
+                if attempt >= self.max_retries:
+                    raise err
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after))
+    async def stream_chat(self, prompt, max_tokens=512, temperature=0.0, **params):
+        import httpx
+        client = self._http()
+        body = self.payload(prompt, max_tokens=max_tokens, temperature=temperature, stream=True, **params)
+        started = False
+        async with self._sem:
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
                 try:
-                    choice = resp["choices"][0]["message"]["content"]
-                except Exception:
-                    choice = str(resp)
-            return choice.strip()
-        except Exception as e_new_call:
-            new_err = str(e_new_call)
-    except Exception as e_new_import:
-        new_err = str(e_new_import)
+                    async with client.stream("POST", "/chat/completions", json=body) as resp:
+                        if resp.status_code < 400:
+                            async for line in resp.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                try:
+                                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                                except Exception:
+                                    continue
+                                if delta:
+                                    started = True
+                                    yield delta
+                            return
+                        await resp.aread()
+                        err = LLMError(f"HTTP {resp.status_code}: {resp.text[:500]}")
+                        if resp.status_code not in RETRY_STATUSES:
+                            raise err
+                        retry_after = resp.headers.get("retry-after")
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    err = LLMError(f"{type(e).__name__}: {e}")
+                if started or attempt >= self.max_retries:
+                    raise err
+                await asyncio.sleep(_backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after))
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+_loop = None
+_loop_lock = threading.Lock()
+_clients = weakref.WeakKeyDictionary()
+def _background_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+def get_client(**kwargs):
+    loop = asyncio.get_running_loop()
+    key = (os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_MODEL", "gpt-4o-mini"), OPENAI_BASE_URL, tuple(sorted(kwargs.items())))
+    per_loop = _clients.get(loop)
+    if per_loop is None:
+        per_loop = _clients[loop] = {}
+    c = per_loop.get(key)
+    if c is None:
+        c = per_loop[key] = LLMClient(**kwargs)
+    return c
+def _run(coro):
+    t = tracing.current()
+    if t is not None:
+        coro = tracing.bound(t, coro)
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+def _response_cache(use_cache):
+    import llm_cache
+    if use_cache is None:
+        use_cache = llm_cache.LLM_CACHE_ENABLED
+    return llm_cache.get_cache() if use_cache else None
+async def ask_llm_async(question, retrieved, client=None, use_cache=None):
+    with tracing.stage("llm", items=1, cpu=False) as st:
+        return await _ask_llm_async(question, retrieved, client, use_cache, st)
+async def _ask_llm_async(question, retrieved, client, use_cache, st):
+    client = client or get_client()
+    if not client.api_key:
+        return LLMFailure("LLM not configured (OPENAI_API_KEY missing).")
+    prompt = _make_prompt(question, retrieved)
+    cache = _response_cache(use_cache)
+    key = None
+    if cache is not None:
+        key = cache.key(prompt, client.model, dict(GEN_PARAMS, base_url=client.base_url))
+        try:
+            hit = await asyncio.to_thread(cache.get, key)
+        except Exception:
+            hit = None
+        if hit is not None:
+            tracing.incr("llm_cache_hits")
+            st.set(cache="hit")
+            return hit
+        tracing.incr("llm_cache_misses")
+        st.set(cache="miss")
     try:
-        import openai
-        openai.api_key = key
+        answer = await client.chat(prompt, **GEN_PARAMS)
+    except Exception as e:
+        tracing.incr("llm_errors")
+        return LLMFailure(f"LLM error: {e}")
+    if cache is not None:
+        try:
+            await asyncio.to_thread(cache.set, key, answer, client.model)
+        except Exception:
+            pass
+    return answer
+async def ask_llm_many_async(items, client=None, concurrency=None, use_cache=None):
+    client = client or (get_client(concurrency=concurrency) if concurrency else get_client())
+    with tracing.stage("llm_batch", items=len(items), cpu=False):
+        return await asyncio.gather(*[ask_llm_async(q, r, client=client, use_cache=use_cache) for q, r in items])
+def ask_llm(question, retrieved, use_cache=None):
+    return _run(ask_llm_async(question, retrieved, use_cache=use_cache))
+def ask_llm_many(items, concurrency=None, use_cache=None):
+    return _run(ask_llm_many_async(list(items), concurrency=concurrency, use_cache=use_cache))
+async def ask_llm_stream_async(question, retrieved, client=None, use_cache=None):
+    client = client or get_client()
+    if not client.api_key:
+        yield LLMFailure("LLM not configured (OPENAI_API_KEY missing).")
+        return
+    prompt = _make_prompt(question, retrieved)
+    cache = _response_cache(use_cache)
+    key = None
+    if cache is not None:
+        key = cache.key(prompt, client.model, dict(GEN_PARAMS, base_url=client.base_url))
+        try:
+            hit = await asyncio.to_thread(cache.get, key)
+        except Exception:
+            hit = None
+        if hit is not None:
+            tracing.incr("llm_cache_hits")
+            yield hit
+            return
+        tracing.incr("llm_cache_misses")
+    parts = []
+    with tracing.stage("llm_stream", items=1, cpu=False) as st:
+        t0 = time.perf_counter()
+        try:
+            async for delta in client.stream_chat(prompt, **GEN_PARAMS):
+                if not parts:
+                    st.set(first_token_s=time.perf_counter() - t0)
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            tracing.incr("llm_errors")
+            yield LLMFailure(f"{chr(10) if parts else ''}LLM error: {e}")
+            return
+    if cache is not None:
+        try:
+            await asyncio.to_thread(cache.set, key, "".join(parts).strip(), client.model)
+        except Exception:
+            pass
+def ask_llm_stream(question, retrieved, use_cache=None):
+    q = queue.Queue()
+    done = object()
+    async def pump():
         try:
-            resp = openai.ChatCompletion.create(model=model, messages=[{"role":"user","content":prompt}], max_tokens=512, temperature=0.0)
-            return resp["choices"][0]["message"]["content"].strip()
-        except Exception as e_legacy_call:
-            return f"LLM error: new_client_error={new_err!s} legacy_call_error={e_legacy_call!s}"
-    except Exception as e_legacy_import:
-        return f"LLM error: new_client_error={new_err!s} legacy_import_error={e_legacy_import!s}"
-
-
+            async for delta in ask_llm_stream_async(question, retrieved, use_cache=use_cache):
+                q.put(delta)
+        except Exception as e:
+            q.put(LLMFailure(f"LLM error: {e}"))
+        finally:
+            q.put(done)
+    t = tracing.current()
+    asyncio.run_coroutine_threadsafe(tracing.bound(t, pump()) if t is not None else pump(), _background_loop())
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,158 @@
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+EVIDENCE_LINE = re.compile(r"^(\d+): (.*?) — (.*)$")
+def fake_answer(prompt, max_claims=3):
+    claims = []
+    for line in prompt.splitlines():
+        m = EVIDENCE_LINE.match(line)
+        if not m:
+            continue
+        idx, snippet = int(m.group(1)), m.group(3).strip()
+        first = re.split(r"(?<=[.?!])\s", snippet, maxsplit=1)[0].strip()
+        if len(first.split()) < 4:
+            continue
+        claims.append(f"{len(claims) + 1}. {first.rstrip('.')}.\nEVIDENCE: {idx}")
+        if len(claims) >= max_claims:
+            break
+    return "\n".join(claims) if claims else "I don't know."
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    def log_message(self, fmt, *args):
+        return
+    def _send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+    def _send_stream(self, answer, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        def write(data):
+            payload = data.encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+        for i in range(0, len(answer), self.server.chunk_chars):
+            chunk = {"object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {"content": answer[i:i + self.server.chunk_chars]}, "finish_reason": None}]}
+            write(f"data: {json.dumps(chunk)}\n\n")
+            if self.server.token_latency:
+                time.sleep(self.server.token_latency)
+        write("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self._complete(server, body)
+        finally:
+            with server.lock:
+                server.active -= 1
+    def _fail_status(self, server, prompt):
+        if server.fail_first:
+            key = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+            with server.lock:
+                attempt = server.attempts[key] = server.attempts.get(key, 0) + 1
+            if attempt <= server.fail_first:
+                return server.fail_statuses[(attempt - 1) % len(server.fail_statuses)]
+        if server.fail_rate and random.random() < server.fail_rate:
+            return random.choice(server.fail_statuses)
+        return None
+    def _complete(self, server, body):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+        status = self._fail_status(server, prompt)
+        if status is not None:
+            with server.lock:
+                server.failures += 1
+            self._send_json(status, {"error": {"message": f"injected {status}"}}, {"Retry-After": "0"} if status == 429 else None)
+            return
+        answer = server.answer_fn(prompt)
+        if body.get("stream"):
+            self._send_stream(answer, body.get("model", "stub"))
+            return
+        self._send_json(200, {
+            "id": f"stub-{server.requests}",
+            "object": "chat.completion",
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(answer.split()), "total_tokens": len(prompt.split()) + len(answer.split())},
+        })
+def make_server(host="127.0.0.1", port=0, latency=0.0, fail_rate=0.0, fail_statuses=(429, 503), answer_fn=None, chunk_chars=4, token_latency=0.0, fail_first=0):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.fail_statuses = list(fail_statuses)
+    server.fail_first = int(fail_first)
+    server.attempts = {}
+    server.answer_fn = answer_fn or fake_answer
+    server.chunk_chars = max(1, int(chunk_chars))
+    server.token_latency = token_latency
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.failures = 0
+    server.active = 0
+    server.max_active = 0
+    return server
+def start_in_thread(**kwargs):
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+def selftest(n=50, fail_first=2, concurrency=8):
+    import os
+    server, base_url = start_in_thread(latency=0.02, fail_first=fail_first)
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "stub"
+    import llm_client
+    llm_client.OPENAI_BASE_URL = base_url
+    items = [(f"question {i}?", [{"source": f"doc{i}", "snippet": f"Document {i} says the answer is {i}. More text."}]) for i in range(n)]
+    t0 = time.perf_counter()
+    answers = llm_client.ask_llm_many(items, concurrency=concurrency)
+    elapsed = time.perf_counter() - t0
+    ok = all(a == f"1. Document {i} says the answer is {i}.\nEVIDENCE: 0" for i, a in enumerate(answers)) and server.max_active <= concurrency
+    print(json.dumps({"ok": ok, "answers": len(answers), "requests": server.requests, "injected_failures": server.failures,
+                      "max_in_flight": server.max_active, "seconds": round(elapsed, 3)}))
+    server.shutdown()
+    return 0 if ok else 1
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Local stub of the OpenAI chat-completions endpoint")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8009)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds to sleep per request")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 429/503")
+    ap.add_argument("--fail-first", type=int, default=0, help="answer the first N attempts of every distinct prompt with 429/503")
+    ap.add_argument("--selftest", action="store_true", help="run ask_llm_many against an in-process stub that fails every prompt's first two attempts")
+    args = ap.parse_args(argv)
+    if args.selftest:
+        return selftest(fail_first=args.fail_first or 2)
+    server = make_server(args.host, args.port, args.latency, args.fail_rate, fail_first=args.fail_first)
+    print(f"stub listening on http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
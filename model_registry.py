@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").lower()
+logger = logging.getLogger(__name__)
+_models = {}
+_locks = {}
+_stats = {}
+_registry_lock = threading.Lock()
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import psutil
+        return int(psutil.Process().memory_info().rss)
+    except Exception:
+        return None
+def _param_bytes(model):
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    except Exception:
+        return None
+def _load_sentence_transformer(name, device=None):
+    import quantized_encoder
+    return quantized_encoder.load(name, ENCODER_BACKEND, device=device)
+def get_model(name=None, loader=None, device=None):
+    name = name or DEFAULT_MODEL
+    m = _models.get(name)
+    if m is not None:
+        return m
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        m = _models.get(name)
+        if m is not None:
+            return m
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        m = (loader or _load_sentence_transformer)(name, device=device)
+        load_s = time.perf_counter() - t0
+        rss_after = _rss_bytes()
+        _stats[name] = {
+            "load_seconds": load_s,
+            "param_bytes": _param_bytes(m),
+            "rss_delta_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+            "loaded_at": time.time(),
+            "backend": ENCODER_BACKEND if loader is None else "custom",
+        }
+        logger.info("loaded model %s in %.2fs (%s)", name, load_s, _stats[name])
+        _models[name] = m
+    return m
+def model_key(name=None):
+    from quantized_encoder import normalize_backend
+    name = name or DEFAULT_MODEL
+    backend = normalize_backend(ENCODER_BACKEND)
+    return name if backend == "torch" else f"{name}@{backend}"
+def is_loaded(name=None):
+    return (name or DEFAULT_MODEL) in _models
+def model_stats():
+    return {k: dict(v) for k, v in _stats.items()}
+def main(argv=None):
+    import json
+    names = (argv if argv is not None else sys.argv[1:]) or [DEFAULT_MODEL]
+    for n in names:
+        get_model(n)
+    print(json.dumps(model_stats(), indent=2))
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
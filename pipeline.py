@@ -0,0 +1,186 @@
+import os
+import re
+from verifier import verify_claims_many
+SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", 0.65))
+VERIFY_CASCADE = os.getenv("VERIFY_CASCADE", "1").lower() not in ("0", "false", "no", "off")
+def _parse_claim_lines(lines):
+    results = []
+    tail_open = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        m_num = re.match(r'^\s*(\d+)[\.\)]\s*(.+)', line)
+        if m_num:
+            claim_text = m_num.group(2).strip()
+            annotated_idx = None
+            closed = False
+            j = i + 1
+            while j < len(lines) and j <= i + 3:
+                m_ev = re.match(r'^(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)', lines[j], flags=re.I)
+                if m_ev:
+                    v = m_ev.group(1)
+                    if v.lower() != "none":
+                        try:
+                            annotated_idx = int(v)
+                        except Exception:
+                            annotated_idx = None
+                    j += 1
+                    closed = True
+                    break
+                m_inline = re.search(r'(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)', claim_text, flags=re.I)
+                if m_inline:
+                    v = m_inline.group(1)
+                    claim_text = re.sub(r'(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)', '', claim_text, flags=re.I).strip()
+                    if v.lower() != "none":
+                        try:
+                            annotated_idx = int(v)
+                        except Exception:
+                            annotated_idx = None
+                    closed = True
+                    break
+                j += 1
+            if j > i + 3:
+                closed = True
+            i = j
+            tail_open = False
+            if claim_text and not re.match(r'^(Therefore|So|Hence|Thus|In conclusion)\b', claim_text, flags=re.I):
+                if not claim_text.endswith("."):
+                    claim_text = claim_text + "."
+                results.append({"claim": claim_text, "annotated_idx": annotated_idx})
+                tail_open = not closed
+            continue
+        tail_open = False
+        m_pair = re.match(r'^(.+?)\.\s*(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)\s*$', line, flags=re.I)
+        if m_pair:
+            c = m_pair.group(1).strip()
+            v = m_pair.group(2)
+            annotated_idx = None if v.lower() == "none" else int(v)
+            if not c.endswith("."):
+                c = c + "."
+            results.append({"claim": c, "annotated_idx": annotated_idx})
+            i += 1
+            continue
+        if len(line.split()) > 3 and not re.match(r'^(Therefore|So|Hence|Thus|In conclusion)\b', line, flags=re.I):
+            m_ev_inline = re.search(r'(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)', line, flags=re.I)
+            annotated_idx = None
+            if m_ev_inline:
+                v = m_ev_inline.group(1)
+                if v.lower() != "none":
+                    try:
+                        annotated_idx = int(v)
+                    except Exception:
+                        annotated_idx = None
+                line = re.sub(r'(?:EVIDENCE|Evidence)\s*[:\-]\s*(none|\d+)', '', line, flags=re.I).strip()
+            txt = line
+            if not txt.endswith("."):
+                txt = txt + "."
+            results.append({"claim": txt, "annotated_idx": annotated_idx})
+        i += 1
+    return results, tail_open
+def parse_claims_from_llm(llm_text):
+    lines = [l.strip() for l in llm_text.splitlines() if l.strip()]
+    if not lines:
+        cand = [s.strip() for s in re.split(r'(?<!\d)\.(?!\d)', llm_text.replace("\n"," ")) if s.strip()]
+        out = []
+        for s in cand:
+            if len(s.split()) > 3 and not re.match(r'^(Therefore|So|Hence|In conclusion)\b', s, flags=re.I):
+                t = s.rstrip()
+                if not t.endswith("."):
+                    t = t + "."
+                out.append({"claim": t, "annotated_idx": None})
+        return out
+    return _parse_claim_lines(lines)[0]
+def is_conclusion(claim_text):
+    return bool(re.match(r'^(Therefore|Hence|So|Thus|In conclusion|Therefore,)', claim_text.strip(), flags=re.I))
+class ClaimStream:
+    def __init__(self):
+        self.pending = ""
+        self.lines = []
+        self.emitted = 0
+    def _ready(self, final):
+        results, tail_open = _parse_claim_lines(self.lines)
+        ready = len(results) - (1 if tail_open and not final else 0)
+        out = results[self.emitted:ready]
+        self.emitted = max(self.emitted, ready)
+        return out
+    def feed(self, chunk):
+        self.pending += chunk
+        if "\n" not in self.pending:
+            return []
+        complete, _, self.pending = self.pending.rpartition("\n")
+        self.lines.extend(l.strip() for l in complete.splitlines() if l.strip())
+        return self._ready(final=False)
+    def close(self):
+        if self.pending.strip():
+            self.lines.append(self.pending.strip())
+        self.pending = ""
+        return self._ready(final=True)
+def _empty_verdict(claim, error=None):
+    v = {"claim": claim, "best_snippet": None, "best_sentence": None, "sim": 0.0,
+         "prob_supported": 0.0, "supported": False, "top_evidence_idxs": []}
+    if error is not None:
+        v["error"] = error
+    return v
+def _annotation_groups(claims, annotated_evidence_list, retrieved):
+    by_idx, rest = {}, []
+    for i, claim in enumerate(claims):
+        ann = annotated_evidence_list[i] if i < len(annotated_evidence_list) else None
+        try:
+            idx = int(ann) if ann is not None else None
+        except Exception:
+            idx = None
+        if idx is not None and 0 <= idx < len(retrieved):
+            by_idx.setdefault(idx, []).append(i)
+        else:
+            rest.append(i)
+    groups = [(ids, [retrieved[idx]], idx) for idx, ids in by_idx.items()]
+    if rest:
+        groups.append((rest, retrieved, None))
+    return groups
+def verify_many_with_annotations(batch, sim_threshold=None, embedder=None):
+    sim_threshold = SIM_THRESHOLD if sim_threshold is None else sim_threshold
+    if VERIFY_CASCADE:
+        import cascade
+        try:
+            return cascade.verify_many(batch, sim_threshold, embedder)
+        except Exception as e:
+            return [[_empty_verdict(c, str(e)) for c in claims] for claims, _, _ in batch]
+    return _verify_many_bi_encoder(batch, sim_threshold, embedder)
+def _verify_many_bi_encoder(batch, sim_threshold, embedder=None):
+    plans = [_annotation_groups(claims, ann, retrieved) for claims, ann, retrieved in batch]
+    requests = [([claims[i] for i in ids], snips) for (claims, _, _), groups in zip(batch, plans) for ids, snips, _ in groups]
+    try:
+        outs = iter(verify_claims_many(requests, sim_threshold=sim_threshold, embedder=embedder))
+    except Exception as e:
+        return [[_empty_verdict(c, str(e)) for c in claims] for claims, _, _ in batch]
+    results = []
+    for (claims, _, _), groups in zip(batch, plans):
+        verif = [None] * len(claims)
+        for ids, _, idx in groups:
+            for i, r in zip(ids, next(outs)):
+                r["claim"] = claims[i]
+                if idx is not None:
+                    r["annotated_evidence_idx"] = idx
+                verif[i] = r
+        results.append([v if v is not None else _empty_verdict(claims[i]) for i, v in enumerate(verif)])
+    return results
+def verify_with_annotations(claims, annotated_evidence_list, retrieved, sim_threshold=None, embedder=None):
+    return verify_many_with_annotations([(claims, annotated_evidence_list, retrieved)], sim_threshold=sim_threshold, embedder=embedder)[0]
+def apply_gnn(verif, retrieved):
+    from gnn_loader import predict_with_gnn
+    out = predict_with_gnn([v.get("claim", "") for v in verif], retrieved)
+    if not out or len(out) != len(verif):
+        return verif
+    merged = []
+    for v, g in zip(verif, out):
+        v = dict(v, prob_supported=float(g.get("prob_supported", 0.0)), supported=bool(g.get("supported", False)), verifier="gnn")
+        v["gnn_prob"] = v["prob_supported"]
+        merged.append(v)
+    return merged
+def score_verdicts(verif):
+    annotated_verif = [v for v in verif if v.get("annotated_evidence_idx") is not None]
+    if annotated_verif:
+        return sum([float(v.get("prob_supported",0.0)) for v in annotated_verif]) / max(1, len(annotated_verif))
+    return sum([float(v.get("prob_supported",0.0)) for v in verif]) / max(1, len(verif)) if verif else 0.0
+def final_status(score):
+    return "Grounded" if score >= 0.8 else "Partially Grounded" if score >= 0.4 else "Hallucinated"
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import shutil
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+import embedding_store
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0") or 0)
+ENCODE_MAX_TOKENS = int(os.getenv("ENCODE_MAX_TOKENS", "16384"))
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", "256"))
+ONNX_DIR = Path(os.getenv("ONNX_EXPORT_DIR", str(embedding_store.STORE_DIR.joinpath("onnx"))))
+BACKENDS = ("torch", "torch-int8", "onnx-int8")
+_ALIASES = {"onnx": "onnx-int8", "int8": "torch-int8", "pytorch": "torch", "fp32": "torch"}
+def normalize_backend(backend):
+    backend = (backend or "torch").lower()
+    backend = _ALIASES.get(backend, backend)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown encoder backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    return backend
+def set_threads(threads=None):
+    threads = ENCODER_THREADS if threads is None else threads
+    if threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+def _st_config(st):
+    pooling = "mean"
+    normalize = False
+    for module in st:
+        name = type(module).__name__
+        if name == "Pooling":
+            if getattr(module, "pooling_mode_cls_token", False):
+                pooling = "cls"
+            elif getattr(module, "pooling_mode_max_tokens", False):
+                pooling = "max"
+        elif name == "Normalize":
+            normalize = True
+    return {"pooling": pooling, "normalize": normalize, "max_seq_length": int(st.max_seq_length), "dim": int(st.get_sentence_embedding_dimension())}
+def _pool(hidden, mask, mode):
+    import numpy as np
+    if mode == "cls":
+        return hidden[:, 0]
+    m = mask[:, :, None].astype(hidden.dtype)
+    if mode == "max":
+        return np.where(m > 0, hidden, -1e9).max(axis=1)
+    return (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+class BucketedEncoder:
+    def __init__(self, name, backend, tokenizer, forward, config, max_tokens=None, max_batch=None):
+        self.name = name
+        self.backend = backend
+        self.tokenizer = tokenizer
+        self.forward = forward
+        self.config = dict(config)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.max_tokens = int(max_tokens if max_tokens is not None else ENCODE_MAX_TOKENS)
+        self.max_batch = int(max_batch if max_batch is not None else ENCODE_MAX_BATCH)
+        self.batches = 0
+        self.padded_tokens = 0
+        self.real_tokens = 0
+        self._lock = threading.Lock()
+    def get_sentence_embedding_dimension(self):
+        return self.config["dim"]
+    def buckets(self, lengths):
+        order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+        batch = []
+        width = 0
+        for i in order:
+            w = max(width, lengths[i])
+            if batch and (w * (len(batch) + 1) > self.max_tokens or len(batch) >= self.max_batch):
+                yield batch, width
+                batch = []
+                w = lengths[i]
+            batch.append(i)
+            width = w
+        if batch:
+            yield batch, width
+    def embed(self, texts):
+        import numpy as np
+        enc = self.tokenizer(list(texts), truncation=True, max_length=self.max_seq_length, padding=False)
+        ids = enc["input_ids"]
+        types = enc.get("token_type_ids")
+        lengths = [len(x) for x in ids]
+        out = np.zeros((len(ids), self.config["dim"]), dtype=np.float32)
+        for batch, width in self.buckets(lengths):
+            input_ids = np.full((len(batch), width), self.tokenizer.pad_token_id or 0, dtype=np.int64)
+            mask = np.zeros((len(batch), width), dtype=np.int64)
+            token_types = np.zeros((len(batch), width), dtype=np.int64)
+            for r, i in enumerate(batch):
+                n = lengths[i]
+                input_ids[r, :n] = ids[i]
+                mask[r, :n] = 1
+                if types is not None:
+                    token_types[r, :n] = types[i]
+            hidden = self.forward({"input_ids": input_ids, "attention_mask": mask, "token_type_ids": token_types})
+            out[batch] = _pool(np.asarray(hidden, dtype=np.float32), mask, self.config["pooling"])
+            with self._lock:
+                self.batches += 1
+                self.padded_tokens += input_ids.size
+                self.real_tokens += int(mask.sum())
+        return out
+    def encode(self, sentences, batch_size=32, show_progress_bar=None, convert_to_numpy=True, convert_to_tensor=False, normalize_embeddings=False, **kwargs):
+        import numpy as np
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embs = self.embed(texts) if texts else np.zeros((0, self.config["dim"]), dtype=np.float32)
+        if self.config["normalize"] or normalize_embeddings:
+            embs /= np.clip(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12, None)
+        if single:
+            embs = embs[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embs)
+        if not convert_to_numpy:
+            return list(embs)
+        return embs
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "batches": self.batches, "padded_tokens": self.padded_tokens, "real_tokens": self.real_tokens,
+                    "padding_ratio": (1.0 - self.real_tokens / self.padded_tokens) if self.padded_tokens else 0.0}
+def load_torch_int8(name, device=None):
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer
+    except Exception:
+        raise RuntimeError("sentence-transformers required")
+    set_threads()
+    st = SentenceTransformer(name, device="cpu")
+    config = _st_config(st)
+    model = torch.quantization.quantize_dynamic(st[0].auto_model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    accepts_types = getattr(model.config, "type_vocab_size", 0) > 0
+    def forward(feeds):
+        feeds = {k: torch.from_numpy(v) for k, v in feeds.items() if k != "token_type_ids" or accepts_types}
+        with torch.inference_mode():
+            return model(**feeds).last_hidden_state.numpy()
+    return BucketedEncoder(name, "torch-int8", st.tokenizer, forward, config)
+def export_dir(name):
+    return ONNX_DIR.joinpath(name.replace("/", "__"))
+def export_onnx(name, out=None, opset=14):
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except Exception:
+        raise RuntimeError("sentence-transformers and onnxruntime required to export the ONNX encoder")
+    out = Path(out or export_dir(name))
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    st = SentenceTransformer(name, device="cpu")
+    config = _st_config(st)
+    hf = st[0].auto_model.eval()
+    st.tokenizer.save_pretrained(str(tmp))
+    dummy = st.tokenizer(["export the encoder"], return_tensors="pt")
+    inputs = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in dummy]
+    axes = {k: {0: "batch", 1: "seq"} for k in inputs + ["last_hidden_state"]}
+    fp32 = tmp.joinpath("model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(hf, tuple(dummy[k] for k in inputs), str(fp32), input_names=inputs, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=opset, do_constant_folding=True)
+    quantize_dynamic(str(fp32), str(tmp.joinpath("model_int8.onnx")), weight_type=QuantType.QInt8)
+    fp32.unlink()
+    with open(tmp.joinpath("encoder.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(config, model=name, inputs=inputs), f)
+    if out.exists():
+        shutil.rmtree(out)
+    os.replace(tmp, out)
+    return out
+def load_onnx_int8(name, device=None):
+    try:
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+    except Exception:
+        raise RuntimeError("onnxruntime and transformers required for ENCODER_BACKEND=onnx-int8")
+    root = export_dir(name)
+    if not root.joinpath("encoder.json").exists():
+        export_onnx(name, root)
+    with open(root.joinpath("encoder.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    opts = ort.SessionOptions()
+    if ENCODER_THREADS > 0:
+        opts.intra_op_num_threads = ENCODER_THREADS
+    opts.inter_op_num_threads = 1
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(str(root.joinpath("model_int8.onnx")), opts, providers=["CPUExecutionProvider"])
+    inputs = [i.name for i in session.get_inputs()]
+    tokenizer = AutoTokenizer.from_pretrained(str(root))
+    def forward(feeds):
+        return session.run(None, {k: feeds[k] for k in inputs})[0]
+    return BucketedEncoder(name, "onnx-int8", tokenizer, forward, config)
+def load(name, backend=None, device=None):
+    backend = normalize_backend(backend)
+    if backend == "torch-int8":
+        return load_torch_int8(name, device=device)
+    if backend == "onnx-int8":
+        return load_onnx_int8(name, device=device)
+    try:
+        from sentence_transformers import SentenceTransformer
+    except Exception:
+        raise RuntimeError("sentence-transformers required")
+    set_threads()
+    return SentenceTransformer(name, device=device)
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Export the sentence encoder to int8 ONNX for ENCODER_BACKEND=onnx-int8")
+    ap.add_argument("--model", default=embedding_store.MODEL_NAME)
+    ap.add_argument("--force", action="store_true")
+    args = ap.parse_args(argv)
+    root = export_dir(args.model)
+    if root.joinpath("encoder.json").exists() and not args.force:
+        print("up to date:", root)
+        return 0
+    print("exported", export_onnx(args.model, root))
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
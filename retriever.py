@@ -4,15 +4,28 @@ import difflib
 from pathlib import Path
 import html
 import re
+import threading
 from dotenv import load_dotenv
+from fuzzy_index import FuzzyIndex
+import snippet_store
+import tracing
 load_dotenv()
 TOP_K = int(os.getenv("TOP_K", "5"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+BM25_CANDIDATES = int(os.getenv("BM25_CANDIDATES", "100"))
+DENSE_CANDIDATES = int(os.getenv("DENSE_CANDIDATES", "100"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LIVE_CORPUS = os.getenv("LIVE_CORPUS", "auto").lower()
+RETRIEVAL_SHARDS = os.getenv("RETRIEVAL_SHARDS", "")
 DATA_DIR = Path(__file__).parent.joinpath("data")
 RETRIEVAL_PATH = DATA_DIR.joinpath("retrieval_results.json")
 HOTPOT_PATH = DATA_DIR.joinpath("hotpot_clean.jsonl")
 retrieval_index = {}
-LAST_MATCH = type("X", (), {})()
-LAST_MATCH.value = None
+retrieval_fuzzy = None
+hotpot_snippets = []
+_retrieval_loaded = False
+_hotpot_loaded = False
+_load_lock = threading.Lock()
 def _normalize_question(s):
     if not s:
         return ""
@@ -23,10 +36,17 @@ def _normalize_question(s):
     s = re.sub(r"\s+", " ", s)
     return s.lower()
 def _load_retrieval_file():
-    global retrieval_index
+    global retrieval_index, retrieval_fuzzy, _retrieval_loaded
     retrieval_index = {}
+    retrieval_fuzzy = None
+    _retrieval_loaded = True
     if not RETRIEVAL_PATH.exists():
         return
+    store = snippet_store.open_retrieval_store(RETRIEVAL_PATH)
+    if store is not None:
+        retrieval_index = store
+        retrieval_fuzzy = FuzzyIndex(store.keys())
+        return
     try:
         with open(RETRIEVAL_PATH, "r", encoding="utf-8") as f:
             rr = json.load(f)
@@ -34,104 +54,246 @@ def _load_retrieval_file():
             qraw = item.get("question", "")
             q = _normalize_question(qraw)
             retrieval_index[q] = item.get("retrieved", [])
+        retrieval_fuzzy = FuzzyIndex(retrieval_index.keys())
     except Exception:
         retrieval_index = {}
-_load_retrieval_file()
-hotpot_snippets = []
-if HOTPOT_PATH.exists():
+        retrieval_fuzzy = None
+def _load_hotpot_snippets():
+    global hotpot_snippets, _hotpot_loaded
+    hotpot_snippets = []
+    _hotpot_loaded = True
+    if not HOTPOT_PATH.exists():
+        return
+    store = snippet_store.open_snippet_store(HOTPOT_PATH)
+    if store is not None:
+        hotpot_snippets = store
+        return
     try:
-        with open(HOTPOT_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                except Exception:
-                    continue
-                title = obj.get("title") or obj.get("article_title") or obj.get("id") or "doc"
-                contexts = []
-                if "context" in obj and isinstance(obj["context"], list):
-                    for c in obj["context"]:
-                        contexts.append(c)
-                elif "paragraphs" in obj and isinstance(obj["paragraphs"], list):
-                    for p in obj["paragraphs"]:
-                        if isinstance(p, dict) and "context" in p:
-                            contexts.append(p["context"])
-                for t in contexts:
-                    hotpot_snippets.append({"source": title, "snippet": t})
+        hotpot_snippets = [{"source": title, "snippet": t} for title, t in snippet_store.iter_hotpot_snippets(HOTPOT_PATH)]
     except Exception:
         hotpot_snippets = []
+def get_retrieval_index():
+    if not _retrieval_loaded:
+        with _load_lock:
+            if not _retrieval_loaded:
+                with tracing.stage("load_retrieval_file"):
+                    _load_retrieval_file()
+    return retrieval_index
+def get_hotpot_snippets():
+    if not _hotpot_loaded:
+        with _load_lock:
+            if not _hotpot_loaded:
+                with tracing.stage("load_hotpot_snippets"):
+                    _load_hotpot_snippets()
+    return hotpot_snippets
 embedder = None
 hotpot_embeddings = None
+hotpot_embedding_array = None
+hotpot_index = None
+hotpot_bm25 = None
 def ensure_embeddings():
-    global embedder, hotpot_embeddings
+    global embedder, hotpot_embeddings, hotpot_embedding_array, hotpot_index
     if embedder is not None:
         return
+    get_hotpot_snippets()
+    import embedding_store
+    from model_registry import get_model
     try:
-        from sentence_transformers import SentenceTransformer
-    except Exception:
+        embedder = get_model(embedding_store.MODEL_NAME)
+    except RuntimeError:
         raise RuntimeError("Install sentence-transformers to enable semantic fallback")
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    texts = [s["snippet"] for s in hotpot_snippets]
-    if texts:
-        hotpot_embeddings = embedder.encode(texts, convert_to_tensor=True)
-def retrieve_from_hotpot(question, top_k):
+    if len(hotpot_snippets):
+        arr = embedding_store.load_embeddings(len(hotpot_snippets))
+        if arr is None:
+            arr = embedding_store.build_embeddings([s["snippet"] for s in hotpot_snippets], embedder)
+        hotpot_embedding_array = arr
+        hotpot_embeddings = embedding_store.as_tensor(arr)
+        import ann_index
+        hotpot_index = ann_index.load_or_build(arr)
+def ensure_bm25():
+    global hotpot_bm25
+    if hotpot_bm25 is None:
+        get_hotpot_snippets()
+        with _load_lock:
+            if hotpot_bm25 is None and len(hotpot_snippets):
+                import bm25_index
+                with tracing.stage("load_bm25", items=len(hotpot_snippets)):
+                    hotpot_bm25 = bm25_index.load_or_build(hotpot_snippets, HOTPOT_PATH)
+    return hotpot_bm25
+_sharded = None
+_sharded_failed = False
+def get_sharded():
+    global _sharded, _sharded_failed
+    if _sharded is None and not _sharded_failed and RETRIEVAL_SHARDS:
+        with _load_lock:
+            if _sharded is None and not _sharded_failed:
+                import shard_retrieval
+                try:
+                    with tracing.stage("start_shards"):
+                        _sharded = shard_retrieval.from_spec(RETRIEVAL_SHARDS)
+                except Exception:
+                    _sharded_failed = True
+                    tracing.incr("shard_start_errors")
+    return _sharded
+def get_live_corpus():
+    if LIVE_CORPUS in ("0", "false", "no", "off"):
+        return None
+    import ingest
+    return ingest.get_live_corpus()
+def _hotpot_result(idx, score, **extra):
+    s = hotpot_snippets[int(idx)]
+    out = {"id": f"hotpot_{idx}", "hotpot_idx": int(idx), "source": s.get("source"), "snippet": s.get("snippet"), "score": float(score)}
+    out.update(extra)
+    return out
+def _bm25_search(question, k):
+    index = ensure_bm25()
+    if index is None:
+        return None
+    with tracing.stage("bm25_search", items=len(index)):
+        return index.search(question, k)
+def _encode_query(question, model=None):
     ensure_embeddings()
-    from sentence_transformers import util
-    q_emb = embedder.encode(question, convert_to_tensor=True)
-    hits = util.cos_sim(q_emb, hotpot_embeddings)[0]
-    import torch
-    vals, idxs = torch.topk(hits, k=min(top_k, len(hotpot_snippets)))
-    results = []
-    for score, idx in zip(vals.tolist(), idxs.tolist()):
-        s = hotpot_snippets[int(idx)]
-        results.append({"id": f"hotpot_{idx}", "source": s.get("source"), "snippet": s.get("snippet"), "score": float(score)})
-    return results
-def rerank_candidates(question, candidates, top_k=5):
+    with tracing.stage("hotpot_encode", items=1):
+        return (model or embedder).encode(question, convert_to_numpy=True, normalize_embeddings=True)
+def _dense_search(question, k, model=None):
+    q_emb = _encode_query(question, model)
+    with tracing.stage("hotpot_search", items=len(hotpot_snippets)) as st:
+        vals, idxs = hotpot_index.search(q_emb, min(k, len(hotpot_snippets)))
+        st.set(index=type(hotpot_index).__name__)
+    keep = idxs[0] >= 0
+    return q_emb, vals[0][keep], idxs[0][keep]
+def _fuse(q_emb, bm25_scores, bm25_idxs, dense_idxs, top_k):
+    import numpy as np
+    with tracing.stage("fuse", items=len(bm25_idxs) + len(dense_idxs)):
+        union = np.union1d(bm25_idxs, dense_idxs).astype(np.int64)
+        dense = np.asarray(hotpot_embedding_array[union], dtype=np.float32) @ np.asarray(q_emb, dtype=np.float32)
+        dense_rank = np.empty(len(union), dtype=np.int64)
+        dense_rank[np.argsort(-dense, kind="stable")] = np.arange(len(union))
+        fused = 1.0 / (RRF_K + 1 + dense_rank)
+        bm25 = dict(zip(bm25_idxs.tolist(), bm25_scores.tolist()))
+        pos = {int(i): j for j, i in enumerate(union.tolist())}
+        for rank, i in enumerate(bm25_idxs.tolist()):
+            fused[pos[i]] += 1.0 / (RRF_K + 1 + rank)
+        order = np.lexsort((union, -fused))[:top_k]
+    return [_hotpot_result(union[j], fused[j], dense_score=float(dense[j]), bm25_score=bm25.get(int(union[j]))) for j in order]
+def retrieve_from_hotpot(question, top_k, model=None):
+    mode = RETRIEVAL_MODE
+    sharded = get_sharded()
+    if sharded is not None:
+        q_emb = None
+        if mode != "bm25":
+            try:
+                from model_registry import get_model
+                with tracing.stage("hotpot_encode", items=1):
+                    q_emb = (model or get_model()).encode(question, convert_to_numpy=True, normalize_embeddings=True)
+            except RuntimeError:
+                if mode == "dense":
+                    raise
+                tracing.incr("hybrid_dense_unavailable")
+        return sharded.search(question, top_k, q_emb=q_emb, mode=mode, bm25_k=BM25_CANDIDATES, dense_k=DENSE_CANDIDATES)
+    live = get_live_corpus()
+    if live is not None:
+        return live.search(question, top_k, encoder=model, bm25_k=BM25_CANDIDATES, dense_k=DENSE_CANDIDATES, mode=mode)
+    sparse = None
+    if mode != "dense":
+        sparse = _bm25_search(question, max(top_k, BM25_CANDIDATES))
+    if mode == "bm25" and sparse is not None:
+        return [_hotpot_result(i, sc, bm25_score=float(sc)) for sc, i in zip(sparse[0].tolist()[:top_k], sparse[1].tolist()[:top_k])]
+    shortlist = mode == "hybrid" and sparse is not None and len(sparse[1]) > 0
+    try:
+        if shortlist:
+            q_emb = _encode_query(question, model)
+            idxs = sparse[1][:0]
+        else:
+            q_emb, vals, idxs = _dense_search(question, max(top_k, DENSE_CANDIDATES) if sparse is not None else top_k, model)
+    except RuntimeError:
+        if sparse is None:
+            raise
+        tracing.incr("hybrid_dense_unavailable")
+        return [_hotpot_result(i, sc, bm25_score=float(sc)) for sc, i in zip(sparse[0].tolist()[:top_k], sparse[1].tolist()[:top_k])]
+    if sparse is None or hotpot_embedding_array is None:
+        return [_hotpot_result(i, sc) for sc, i in zip(vals.tolist()[:top_k], idxs.tolist()[:top_k])]
+    return _fuse(q_emb, sparse[0], sparse[1], idxs, top_k)
+def rerank_candidates(question, candidates, top_k=5, model=None):
     if not candidates:
         return candidates[:top_k]
     try:
-        from sentence_transformers import SentenceTransformer, util
+        from sentence_transformers import util
+        from model_registry import get_model
+        model = model or get_model()
     except Exception:
         return candidates[:top_k]
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    q_emb = model.encode(question, convert_to_tensor=True)
-    texts = [c.get("snippet","") for c in candidates]
-    t_emb = model.encode(texts, convert_to_tensor=True)
-    sims = util.cos_sim(q_emb, t_emb)[0].cpu().tolist()
+    with tracing.stage("rerank", items=len(candidates)) as st:
+        q_emb = model.encode(question, convert_to_tensor=True)
+        stored = {}
+        if hotpot_embedding_array is not None:
+            for i, c in enumerate(candidates):
+                if c.get("hotpot_idx") is not None:
+                    stored[i] = hotpot_embedding_array[int(c["hotpot_idx"])]
+        live = get_live_corpus() if any(c.get("live_ref") for c in candidates) else None
+        if live is not None:
+            for i, c in enumerate(candidates):
+                emb = live.embedding(c["live_ref"]) if c.get("live_ref") else None
+                if emb is not None:
+                    stored[i] = emb
+        missing = [i for i in range(len(candidates)) if i not in stored]
+        st.set(encoded=len(missing))
+        if stored:
+            import numpy as np
+            import torch
+            rows = np.asarray(list(stored.values()), dtype=np.float32)
+            t_emb = torch.empty((len(candidates), rows.shape[1]), dtype=torch.float32)
+            t_emb[list(stored)] = torch.from_numpy(rows)
+            if missing:
+                t_emb[missing] = model.encode([candidates[i].get("snippet","") for i in missing], convert_to_tensor=True).float().cpu()
+            t_emb = t_emb.to(q_emb.device)
+        else:
+            texts = [c.get("snippet","") for c in candidates]
+            t_emb = model.encode(texts, convert_to_tensor=True)
+        sims = util.cos_sim(q_emb, t_emb)[0].cpu().tolist()
     pairs = sorted(enumerate(sims), key=lambda x: x[1], reverse=True)
     out = []
     for i,_ in pairs[:top_k]:
         out.append(candidates[int(i)])
     return out
-def retrieve(question, top_k=None):
+def _record_match(kind, detail=None):
+    tracing.annotate(match=f"{kind}:{detail}" if detail is not None else kind, match_type=kind)
+    tracing.incr(f"retrieve_{kind}")
+def retrieve(question, top_k=None, model=None):
+    with tracing.stage("retrieve") as st:
+        out = _retrieve(question, top_k, model)
+        st.set(items=len(out))
+        return out
+def _retrieve(question, top_k=None, model=None):
     top_k = int(top_k or TOP_K)
     qnorm = _normalize_question(question)
-    LAST_MATCH.value = None
+    get_retrieval_index()
     if retrieval_index:
         if qnorm in retrieval_index:
             out = retrieval_index[qnorm]
-            LAST_MATCH.value = f"exact:{qnorm}"
+            _record_match("exact", qnorm)
         else:
-            keys = list(retrieval_index.keys())
-            best = difflib.get_close_matches(qnorm, keys, n=1, cutoff=0.7)
-            if best:
-                out = retrieval_index[best[0]]
-                LAST_MATCH.value = f"fuzzy:{best[0]}"
+            if retrieval_fuzzy is not None:
+                best = retrieval_fuzzy.get_close_match(qnorm, cutoff=0.7)
+            else:
+                best = (difflib.get_close_matches(qnorm, list(retrieval_index.keys()), n=1, cutoff=0.7) or [None])[0]
+            if best is not None:
+                out = retrieval_index[best]
+                _record_match("fuzzy", best)
             else:
                 out = []
     else:
         out = []
     if not out:
-        if hotpot_snippets:
+        if get_sharded() is not None or get_live_corpus() is not None or get_hotpot_snippets():
             try:
-                hot = retrieve_from_hotpot(question, top_k=top_k)
-                LAST_MATCH.value = f"hotpot_fallback ({len(hot)} hits)"
+                hot = retrieve_from_hotpot(question, top_k=top_k, model=model)
+                _record_match("hotpot_fallback", f"{len(hot)} hits")
                 return hot[:top_k]
             except Exception as e:
-                LAST_MATCH.value = f"hotpot_error:{e}"
+                _record_match("hotpot_error", e)
                 return []
+        _record_match("none")
         return []
     normalized = []
     for i, s in enumerate(out[:top_k]):
@@ -143,5 +305,22 @@ def retrieve(question, top_k=None):
             snip = str(s)
         normalized.append({"id": f"pre_{i}", "source": src, "snippet": snip})
     return normalized
-
-
+def warmup(embeddings=True):
+    get_retrieval_index()
+    if get_sharded() is not None:
+        return
+    live = get_live_corpus()
+    if live is not None:
+        import ingest
+        ingest.start_background_compaction()
+        for seg in live.segments:
+            if RETRIEVAL_MODE != "dense":
+                seg.bm25()
+            if RETRIEVAL_MODE != "bm25":
+                seg.dense()
+        return
+    get_hotpot_snippets()
+    if hotpot_snippets and RETRIEVAL_MODE != "dense":
+        ensure_bm25()
+    if embeddings and hotpot_snippets and RETRIEVAL_MODE != "bm25":
+        ensure_embeddings()
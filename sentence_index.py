@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import embedding_store
+from verifier import _split_into_sentences
+_index = None
+_loaded = False
+_lock = threading.Lock()
+def index_paths(key):
+    base = embedding_store.STORE_DIR
+    return base.joinpath(f"hotpot_{key}.sent.npy"), base.joinpath(f"hotpot_{key}.sent_offsets.npy")
+class SentenceIndex:
+    def __init__(self, embs, offsets):
+        self.embs = embs
+        self.offsets = offsets
+    def __len__(self):
+        return int(self.offsets.shape[0]) - 1
+    def lookup(self, idx, text):
+        idx = int(idx)
+        if idx < 0 or idx >= len(self):
+            return None
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        sents = _split_into_sentences(text)
+        if len(sents) != end - start:
+            return None
+        import numpy as np
+        return sents, embedding_store.as_tensor(np.array(self.embs[start:end]))
+def build(texts, model, key=None, batch_size=256, show_progress_bar=False):
+    import numpy as np
+    key = key or embedding_store.store_key()
+    if key is None:
+        raise RuntimeError("corpus file not found")
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    flat = []
+    for i, t in enumerate(texts):
+        sents = _split_into_sentences(t)
+        flat.extend(sents)
+        offsets[i + 1] = offsets[i] + len(sents)
+    embs = model.encode(flat, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=show_progress_bar)
+    embs = np.ascontiguousarray(embs, dtype=np.float32)
+    emb_path, off_path = index_paths(key)
+    emb_path.parent.mkdir(parents=True, exist_ok=True)
+    for path, arr in ((off_path, offsets), (emb_path, embs)):
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+        np.save(str(tmp), arr)
+        os.replace(tmp, path)
+    return SentenceIndex(np.load(str(emb_path), mmap_mode="r"), np.load(str(off_path), mmap_mode="r"))
+def load(key=None, n_paragraphs=None):
+    import numpy as np
+    key = key or embedding_store.store_key()
+    if key is None:
+        return None
+    emb_path, off_path = index_paths(key)
+    if not emb_path.exists() or not off_path.exists():
+        return None
+    try:
+        idx = SentenceIndex(np.load(str(emb_path), mmap_mode="r"), np.load(str(off_path), mmap_mode="r"))
+    except Exception:
+        return None
+    if n_paragraphs is not None and len(idx) != n_paragraphs:
+        return None
+    if int(idx.offsets[-1]) != int(idx.embs.shape[0]):
+        return None
+    return idx
+def get_index():
+    global _index, _loaded
+    if _loaded:
+        return _index
+    with _lock:
+        if not _loaded:
+            try:
+                _index = load()
+            except Exception:
+                _index = None
+            _loaded = True
+    return _index
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Split the HotpotQA corpus into sentences and precompute their embeddings")
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--force", action="store_true")
+    args = ap.parse_args(argv)
+    import retriever
+    from model_registry import get_model
+    texts = [s["snippet"] for s in retriever.get_hotpot_snippets()]
+    if not texts:
+        print("no snippets found in", embedding_store.HOTPOT_PATH, file=sys.stderr)
+        return 1
+    key = embedding_store.store_key()
+    if not args.force and load(key, len(texts)) is not None:
+        print("up to date:", index_paths(key)[0])
+        return 0
+    idx = build(texts, get_model(embedding_store.MODEL_NAME), key, batch_size=args.batch_size, show_progress_bar=True)
+    print(f"wrote {idx.embs.shape[0]} sentence embeddings for {len(idx)} paragraphs to", index_paths(key)[0])
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
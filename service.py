@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import tracing
+load_dotenv()
+SERVICE_THREADS = int(os.getenv("SERVICE_THREADS", "64"))
+SERVICE_WARMUP = os.getenv("SERVICE_WARMUP", "1").lower() not in ("0", "false", "no", "off")
+TOP_K = int(os.getenv("TOP_K", "5"))
+_executor = None
+_executor_lock = threading.Lock()
+_started = time.time()
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(SERVICE_THREADS, thread_name_prefix="service")
+    return _executor
+async def _blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_pool(), lambda: ctx.run(fn, *args, **kwargs))
+def _encoder():
+    from encode_batcher import get_batcher
+    try:
+        b = get_batcher()
+    except RuntimeError:
+        return None
+    return b if b.max_batch_size > 1 else b.model
+def _retrieve(question, top_k, rerank):
+    from retriever import retrieve, rerank_candidates
+    model = _encoder()
+    candidates = retrieve(question, top_k=max(50, top_k) if rerank else top_k, model=model)
+    if rerank:
+        candidates = rerank_candidates(question, candidates, top_k=top_k, model=model)
+    return candidates[:top_k]
+def _verify(claims, retrieved, sim_threshold, top_k):
+    from verifier import verify_claims
+    return verify_claims(claims, retrieved, sim_threshold=sim_threshold, top_k=top_k, embedder=_encoder())
+def _check(question, answer, retrieved, sim_threshold):
+    from pipeline import final_status, is_conclusion, parse_claims_from_llm, score_verdicts, verify_with_annotations
+    parsed = [p for p in parse_claims_from_llm(answer) if not is_conclusion(p.get("claim", ""))]
+    claims = [p["claim"] for p in parsed]
+    verif = verify_with_annotations(claims, [p.get("annotated_idx") for p in parsed], retrieved, sim_threshold=sim_threshold, embedder=_encoder())
+    score = score_verdicts(verif)
+    return {"question": question, "answer": answer, "retrieved": retrieved, "verification": verif, "score": score, "status": final_status(score)}
+def _field(body, name, kind, default=None):
+    value = body.get(name, default)
+    if value is None or not isinstance(value, kind):
+        raise HTTPError(400, f"'{name}' must be {kind.__name__ if isinstance(kind, type) else ' or '.join(k.__name__ for k in kind)}")
+    return value
+async def handle_retrieve(body):
+    question = _field(body, "question", str)
+    top_k = int(_field(body, "top_k", int, TOP_K))
+    t0 = time.perf_counter()
+    retrieved = await _blocking(_retrieve, question, top_k, bool(body.get("rerank", True)))
+    return {"retrieved": retrieved, "elapsed_ms": (time.perf_counter() - t0) * 1000.0}
+async def handle_verify(body):
+    from pipeline import SIM_THRESHOLD
+    claims = _field(body, "claims", list)
+    retrieved = _field(body, "retrieved", list)
+    t0 = time.perf_counter()
+    verif = await _blocking(_verify, claims, retrieved, float(_field(body, "sim_threshold", (int, float), SIM_THRESHOLD)), int(_field(body, "top_k", int, 3)))
+    return {"verification": verif, "elapsed_ms": (time.perf_counter() - t0) * 1000.0}
+async def handle_check(body):
+    from pipeline import SIM_THRESHOLD
+    from llm_client import ask_llm_async, is_failure
+    import answer_cache
+    question = _field(body, "question", str)
+    top_k = int(_field(body, "top_k", int, TOP_K))
+    sim_threshold = float(_field(body, "sim_threshold", (int, float), SIM_THRESHOLD))
+    t0 = time.perf_counter()
+    retrieved = body.get("retrieved")
+    cacheable = not isinstance(retrieved, list) and not isinstance(body.get("answer"), str) and body.get("cache", True) is not False
+    scope = ("check", top_k, bool(body.get("rerank", True)), sim_threshold)
+    q_emb = None
+    if cacheable:
+        cached, info, q_emb = await _blocking(answer_cache.lookup, question, scope, _encoder())
+        if info is not None:
+            return dict(cached, question=question, cache=info, timings_ms={"cache": (time.perf_counter() - t0) * 1000.0})
+    if not isinstance(retrieved, list):
+        retrieved = await _blocking(_retrieve, question, top_k, bool(body.get("rerank", True)))
+    t1 = time.perf_counter()
+    answer = body.get("answer")
+    if not isinstance(answer, str):
+        answer = await ask_llm_async(question, retrieved)
+    t2 = time.perf_counter()
+    out = await _blocking(_check, question, answer, retrieved, sim_threshold)
+    t3 = time.perf_counter()
+    if cacheable and not is_failure(answer):
+        await _blocking(answer_cache.store, question, dict(out), scope, q_emb, _encoder())
+        out["cache"] = None
+    out["timings_ms"] = {"retrieve": (t1 - t0) * 1000.0, "llm": (t2 - t1) * 1000.0, "verify": (t3 - t2) * 1000.0}
+    return out
+def handle_stats():
+    from encode_batcher import _batcher
+    from model_registry import model_stats
+    from retriever import _sharded
+    import answer_cache
+    import cascade
+    return {"uptime_s": time.time() - _started, "batcher": _batcher.stats() if _batcher is not None else None, "models": model_stats(), "shards": _sharded.stats() if _sharded is not None else None, "cascade": cascade.stats(), "answer_cache": answer_cache.get_cache().stats() if answer_cache.ANSWER_CACHE_ENABLED else None}
+ROUTES = {
+    ("POST", "/retrieve"): handle_retrieve,
+    ("POST", "/verify"): handle_verify,
+    ("POST", "/check"): handle_check,
+}
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+async def _send(send, status, data, content_type, headers=None):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type), (b"content-length", str(len(data)).encode("ascii"))] + list(headers or [])})
+    await send({"type": "http.response.body", "body": data})
+async def _send_json(send, status, obj, headers=None):
+    await _send(send, status, json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"), b"application/json", headers)
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                if SERVICE_WARMUP:
+                    await _blocking(warmup)
+                await send({"type": "lifespan.startup.complete"})
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    method, path = scope["method"], scope["path"].rstrip("/") or "/"
+    if method == "GET" and path == "/health":
+        await _send_json(send, 200, {"status": "ok"})
+        return
+    if method == "GET" and path == "/stats":
+        await _send_json(send, 200, handle_stats())
+        return
+    if method == "GET" and path == "/metrics":
+        await _send(send, 200, tracing.render_metrics().encode("utf-8"), b"text/plain; version=0.0.4")
+        return
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        status = 405 if any(p == path for _, p in ROUTES) else 404
+        await _send_json(send, status, {"error": "method not allowed" if status == 405 else "not found"})
+        return
+    raw = await _read_body(receive)
+    if raw is None:
+        return
+    try:
+        body = json.loads(raw or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        await _send_json(send, 400, {"error": f"invalid JSON body: {e}"})
+        return
+    trace = tracing.trace(path.strip("/"))
+    headers = [(b"x-trace-id", trace.id.encode("ascii"))]
+    try:
+        with trace:
+            out = await handler(body)
+    except HTTPError as e:
+        await _send_json(send, e.status, {"error": str(e)}, headers)
+        return
+    except Exception as e:
+        await _send_json(send, 500, {"error": f"{type(e).__name__}: {e}"}, headers)
+        return
+    if body.get("trace"):
+        out["trace"] = trace.to_dict()
+    await _send_json(send, 200, out, headers)
+def warmup():
+    import retriever
+    import verifier
+    _encoder()
+    retriever.warmup()
+    verifier.warmup()
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="HTTP API for retrieval and claim verification")
+    ap.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8000")))
+    ap.add_argument("--max-batch-size", type=int, default=None, help="texts per encode call (1 disables batching)")
+    ap.add_argument("--max-wait-ms", type=float, default=None, help="how long the first queued request waits for others")
+    ap.add_argument("--no-warmup", action="store_true")
+    args = ap.parse_args(argv)
+    global SERVICE_WARMUP
+    if args.no_warmup:
+        SERVICE_WARMUP = False
+    if args.max_batch_size is not None or args.max_wait_ms is not None:
+        from encode_batcher import get_batcher
+        try:
+            get_batcher(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+    try:
+        import uvicorn
+    except Exception:
+        print("uvicorn required: pip install uvicorn", file=sys.stderr)
+        return 1
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
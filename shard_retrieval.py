@@ -0,0 +1,493 @@
+import os
+import sys
+import json
+import time
+import heapq
+import itertools
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv()
+import embedding_store
+import snippet_store
+import tracing
+SHARD_TIMEOUT_MS = float(os.getenv("SHARD_TIMEOUT_MS", "250"))
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", "")
+SHARD_START_TIMEOUT_S = float(os.getenv("SHARD_START_TIMEOUT_S", "600"))
+SHARD_CONNECT_TIMEOUT_S = float(os.getenv("SHARD_CONNECT_TIMEOUT_S", "5"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+def shard_range(index, count, total):
+    return total * index // count, total * (index + 1) // count
+def _shard_key(base, index, count):
+    return f"{base}_s{index}of{count}"
+class Shard:
+    def __init__(self, index, count, path=None):
+        import numpy as np
+        self.index = index
+        self.count = count
+        self.path = Path(path or embedding_store.HOTPOT_PATH)
+        store = snippet_store.open_snippet_store(self.path)
+        if store is None:
+            snippet_store.build_snippet_store(self.path)
+            store = snippet_store.open_snippet_store(self.path)
+        if store is None:
+            raise RuntimeError(f"corpus not found: {self.path}")
+        self.store = store
+        self.lo, self.hi = shard_range(index, count, len(store))
+        fp = embedding_store.corpus_fingerprint(self.path)
+        embs = embedding_store.load_embeddings(len(store), path=self.path)
+        self.embeddings = None
+        self.dense = None
+        if embs is not None:
+            import ann_index
+            self.embeddings = np.ascontiguousarray(embs[self.lo:self.hi], dtype=np.float32)
+            self.dense = ann_index.load_or_build(self.embeddings, key=_shard_key(embedding_store.store_key(path=self.path), index, count))
+        import bm25_index
+        root = embedding_store.STORE_DIR.joinpath(_shard_key(f"hotpot_{fp[:16]}", index, count) + ".bm25")
+        try:
+            self.bm25 = bm25_index.BM25Index(root)
+        except Exception:
+            self.bm25 = bm25_index.build((store[i] for i in range(self.lo, self.hi)), root)
+    def __len__(self):
+        return self.hi - self.lo
+    def info(self):
+        return {"shard": self.index, "shards": self.count, "rows": [self.lo, self.hi], "dense": self.dense is not None, "index": type(self.dense).__name__ if self.dense is not None else None, "pid": os.getpid()}
+    def df(self):
+        terms, df = self.bm25.df()
+        return {"n_docs": len(self.bm25), "terms": terms, "df": df}
+    def search(self, q_emb=None, question=None, dense_k=0, bm25_k=0, idf=None, rescore=False):
+        import numpy as np
+        t0 = time.perf_counter()
+        dense = []
+        sparse = []
+        if q_emb is not None and dense_k and self.dense is not None and len(self):
+            vals, idxs = self.dense.search(q_emb, min(dense_k, len(self)))
+            dense = [(float(v), self.lo + int(i)) for v, i in zip(vals[0].tolist(), idxs[0].tolist()) if i >= 0]
+        if question and bm25_k and len(self):
+            scores, idxs = self.bm25.search(question, bm25_k, idf=idf)
+            sparse = [(float(v), self.lo + int(i)) for v, i in zip(scores.tolist(), idxs.tolist())]
+            if rescore and q_emb is not None and self.embeddings is not None and len(idxs):
+                sims = self.embeddings[idxs] @ np.asarray(q_emb, dtype=np.float32).reshape(-1)
+                dense = [(float(v), self.lo + int(i)) for v, i in zip(sims.tolist(), idxs.tolist())]
+        rows = {i: self.store[i] for i in {i for _, i in dense} | {i for _, i in sparse}}
+        return {"dense": dense, "bm25": sparse, "rows": rows, "seconds": time.perf_counter() - t0}
+def _nodelay(conn):
+    try:
+        import socket
+        sock = socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        finally:
+            sock.close()
+    except Exception:
+        pass
+    return conn
+def _set_timeout(conn, seconds):
+    import socket
+    import struct
+    sec = max(0.0, seconds or 0.0)
+    tv = struct.pack("ll", int(sec), int((sec - int(sec)) * 1e6))
+    sock = socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, tv)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, tv)
+    finally:
+        sock.close()
+    return conn
+def connect(address, authkey=None, timeout_s=None):
+    import socket
+    from multiprocessing.connection import Connection, answer_challenge, deliver_challenge
+    timeout_s = SHARD_CONNECT_TIMEOUT_S if timeout_s is None else timeout_s
+    sock = socket.create_connection(tuple(address), timeout=timeout_s)
+    sock.settimeout(None)
+    conn = Connection(sock.detach())
+    try:
+        _set_timeout(_nodelay(conn), timeout_s)
+        if authkey:
+            answer_challenge(conn, authkey)
+            deliver_challenge(conn, authkey)
+        return _set_timeout(conn, 0)
+    except BaseException:
+        conn.close()
+        raise
+def _handle(shard, conn, authkey=None):
+    from multiprocessing.connection import answer_challenge, deliver_challenge
+    _nodelay(conn)
+    if authkey:
+        try:
+            _set_timeout(conn, SHARD_CONNECT_TIMEOUT_S)
+            deliver_challenge(conn, authkey)
+            answer_challenge(conn, authkey)
+            _set_timeout(conn, 0)
+        except Exception:
+            conn.close()
+            return
+    with conn:
+        while True:
+            try:
+                rid, op, payload = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if op == "search":
+                    out = shard.search(**payload)
+                elif op == "info":
+                    out = shard.info()
+                elif op == "df":
+                    out = shard.df()
+                else:
+                    raise ValueError(f"unknown op: {op}")
+                reply = (rid, True, out)
+            except Exception as e:
+                reply = (rid, False, f"{type(e).__name__}: {e}")
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+def serve(index, count, address=("127.0.0.1", 0), authkey=None, ready=None, path=None):
+    from multiprocessing.connection import Listener
+    shard = Shard(index, count, path)
+    listener = Listener(address)
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception:
+            continue
+        threading.Thread(target=_handle, args=(shard, conn, authkey), name=f"shard-{index}-conn", daemon=True).start()
+def _serve_child(index, count, address, authkey, ready, path):
+    try:
+        serve(index, count, address, authkey, ready, path)
+    except Exception as e:
+        try:
+            ready.send(RuntimeError(f"shard {index} failed to start: {type(e).__name__}: {e}"))
+        except Exception:
+            pass
+        raise
+def start_local_shards(count, authkey=None, path=None):
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")
+    authkey = authkey or os.urandom(16)
+    procs = []
+    pipes = []
+    for i in range(count):
+        parent, child = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=_serve_child, args=(i, count, ("127.0.0.1", 0), authkey, child, path), name=f"retrieval-shard-{i}", daemon=True)
+        p.start()
+        child.close()
+        procs.append(p)
+        pipes.append(parent)
+    addresses = []
+    for i, parent in enumerate(pipes):
+        if not parent.poll(SHARD_START_TIMEOUT_S):
+            raise RuntimeError(f"shard {i} did not start within {SHARD_START_TIMEOUT_S:.0f}s")
+        addr = parent.recv()
+        if isinstance(addr, Exception):
+            raise addr
+        addresses.append(addr)
+    return addresses, authkey, procs
+def parse_addresses(spec):
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        host, _, port = part.rpartition(":")
+        out.append((host or "127.0.0.1", int(port)))
+    return out
+class ShardedRetriever:
+    def __init__(self, addresses, authkey=None, timeout_ms=None, procs=None):
+        self.addresses = [tuple(a) for a in addresses]
+        self.authkey = authkey
+        self.timeout_ms = SHARD_TIMEOUT_MS if timeout_ms is None else timeout_ms
+        self.procs = list(procs or [])
+        self._idle = [[] for _ in self.addresses]
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._stats = [{"calls": 0, "ok": 0, "timeouts": 0, "errors": 0, "seconds": 0.0} for _ in self.addresses]
+        self._connector = None
+        self._connecting = [0] * len(self.addresses)
+        self.max_connecting = 4
+        self._df = None
+        self._n_docs = 0
+        self._df_attempt = 0.0
+    def __len__(self):
+        return len(self.addresses)
+    def _open(self, i, box):
+        try:
+            conn = connect(self.addresses[i], self.authkey)
+        finally:
+            with self._lock:
+                self._connecting[i] -= 1
+        with self._lock:
+            if box.get("abandoned"):
+                self._idle[i].append(conn)
+            else:
+                box["conn"] = conn
+    def _acquire(self, i):
+        with self._lock:
+            if self._idle[i]:
+                return self._idle[i].pop(), None
+            if self._connecting[i] >= self.max_connecting:
+                return None, None
+            self._connecting[i] += 1
+            if self._connector is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._connector = ThreadPoolExecutor(max_workers=self.max_connecting * len(self.addresses), thread_name_prefix="shard-connect")
+        box = {}
+        box["future"] = self._connector.submit(self._open, i, box)
+        return None, box
+    def _claim(self, box):
+        with self._lock:
+            conn = box.get("conn")
+            if conn is None:
+                box["abandoned"] = True
+            return conn
+    def _release(self, i, conn):
+        with self._lock:
+            self._idle[i].append(conn)
+    def _count(self, i, key, seconds=None):
+        with self._lock:
+            self._stats[i][key] += 1
+            if seconds is not None:
+                self._stats[i]["seconds"] += seconds
+    def call(self, op, payload, timeout_ms=None):
+        from multiprocessing.connection import wait
+        timeout_ms = self.timeout_ms if timeout_ms is None else timeout_ms
+        rid = next(self._ids)
+        t0 = time.monotonic()
+        deadline = t0 + timeout_ms / 1000.0
+        pending = {}
+        results = {}
+        failed = {}
+        connecting = {}
+        for i in range(len(self.addresses)):
+            self._count(i, "calls")
+            conn, box = self._acquire(i)
+            if conn is None and box is None:
+                self._count(i, "timeouts")
+                failed[i] = "connecting"
+                continue
+            if conn is None:
+                connecting[i] = box
+                continue
+            try:
+                conn.send((rid, op, payload))
+                pending[conn] = i
+            except Exception as e:
+                conn.close()
+                self._count(i, "errors")
+                failed[i] = f"{type(e).__name__}: {e}"
+        if connecting:
+            from concurrent.futures import wait as wait_futures
+            wait_futures([b["future"] for b in connecting.values()], max(0.0, deadline - time.monotonic()))
+            for i, box in connecting.items():
+                conn = self._claim(box)
+                if conn is None:
+                    fut = box["future"]
+                    if fut.done() and fut.exception() is not None:
+                        e = fut.exception()
+                        self._count(i, "errors")
+                        failed[i] = f"connect: {type(e).__name__}: {e}"
+                    else:
+                        self._count(i, "timeouts")
+                        failed[i] = "connect timeout"
+                    continue
+                try:
+                    conn.send((rid, op, payload))
+                    pending[conn] = i
+                except Exception as e:
+                    conn.close()
+                    self._count(i, "errors")
+                    failed[i] = f"{type(e).__name__}: {e}"
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), remaining):
+                i = pending.pop(conn)
+                try:
+                    r_id, ok, out = conn.recv()
+                except Exception as e:
+                    conn.close()
+                    self._count(i, "errors")
+                    failed[i] = f"{type(e).__name__}: {e}"
+                    continue
+                if r_id != rid:
+                    conn.close()
+                    self._count(i, "errors")
+                    failed[i] = "out-of-order reply"
+                    continue
+                self._release(i, conn)
+                if ok:
+                    self._count(i, "ok", time.monotonic() - t0)
+                    results[i] = out
+                else:
+                    self._count(i, "errors")
+                    failed[i] = out
+        for conn, i in pending.items():
+            conn.close()
+            self._count(i, "timeouts")
+            failed[i] = "timeout"
+        return results, failed
+    def info(self, timeout_ms=5000):
+        results, failed = self.call("info", {}, timeout_ms)
+        return [results.get(i) or {"shard": i, "error": failed.get(i)} for i in range(len(self.addresses))]
+    def load_bm25_stats(self, timeout_ms=30000):
+        from collections import Counter
+        self._df_attempt = time.monotonic()
+        results, failed = self.call("df", {}, timeout_ms)
+        if failed or not results:
+            self._df = None
+            tracing.incr("shard_df_unavailable")
+            return False
+        df = Counter()
+        for r in results.values():
+            df.update(dict(zip(r["terms"], r["df"].tolist())))
+        self._df = dict(df)
+        self._n_docs = sum(r["n_docs"] for r in results.values())
+        return True
+    def global_idf(self, question):
+        if self._df is None:
+            with self._lock:
+                retry = time.monotonic() - self._df_attempt > 30.0
+                if retry:
+                    self._df_attempt = time.monotonic()
+            if retry:
+                threading.Thread(target=self.load_bm25_stats, name="shard-df", daemon=True).start()
+            return None
+        import bm25_index
+        return {t: float(bm25_index.compute_idf(self._n_docs, self._df[t])) for t in set(bm25_index.tokenize(question)) if t in self._df}
+    def search(self, question, top_k, q_emb=None, mode="hybrid", bm25_k=100, dense_k=100, timeout_ms=None):
+        use_bm25 = mode != "dense"
+        use_dense = q_emb is not None and mode != "bm25"
+        shortlist = use_dense and mode == "hybrid"
+        if use_dense:
+            import numpy as np
+            q_emb = np.asarray(q_emb, dtype=np.float32)
+        full_dense_k = (max(top_k, dense_k) if use_bm25 else top_k) if use_dense else 0
+        bm25_k = max(top_k, bm25_k) if use_bm25 else 0
+        with tracing.stage("shard_search", items=len(self.addresses)) as st:
+            idf = self.global_idf(question) if use_bm25 else None
+            payload = {"q_emb": q_emb if use_dense else None, "question": question if use_bm25 else None, "dense_k": 0 if shortlist else full_dense_k,
+                       "bm25_k": bm25_k, "idf": idf, "rescore": shortlist}
+            results, failed = self.call("search", payload, timeout_ms)
+            if shortlist and results and not any(r["bm25"] for r in results.values()):
+                shortlist = False
+                results, failed = self.call("search", dict(payload, dense_k=full_dense_k, bm25_k=0, rescore=False), timeout_ms)
+            st.set(answered=len(results), failed=len(failed), shortlist=shortlist)
+        if failed:
+            tracing.incr("shard_degraded")
+            tracing.incr("shard_failures", len(failed))
+            tracing.annotate(shards_failed={str(i): reason for i, reason in failed.items()})
+        if not results:
+            raise RuntimeError(f"no retrieval shard answered ({len(failed)} failed)")
+        rows = {}
+        for r in results.values():
+            rows.update(r["rows"])
+        if idf is not None:
+            sparse = list(itertools.islice(heapq.merge(*[r["bm25"] for r in results.values()], key=lambda x: -x[0]), bm25_k))
+        else:
+            sparse = [(sc, i) for _, _, sc, i in sorted((rank, s, sc, i) for s, r in results.items() for rank, (sc, i) in enumerate(r["bm25"]))][:bm25_k]
+        if shortlist:
+            sims = {i: sc for r in results.values() for sc, i in r["dense"]}
+            dense = sorted(((sims[i], i) for _, i in sparse if i in sims), key=lambda x: (-x[0], x[1]))
+        else:
+            dense = list(itertools.islice(heapq.merge(*[r["dense"] for r in results.values()], key=lambda x: -x[0]), full_dense_k))
+        def result(idx, score, **extra):
+            s = rows[idx]
+            out = {"id": f"hotpot_{idx}", "hotpot_idx": int(idx), "source": s.get("source"), "snippet": s.get("snippet"), "score": float(score)}
+            out.update(extra)
+            return out
+        if not use_dense or not dense:
+            return [result(i, sc, bm25_score=sc) for sc, i in sparse[:top_k]]
+        if not use_bm25:
+            return [result(i, sc) for sc, i in dense[:top_k]]
+        fused = {}
+        dense_scores = dict((i, sc) for sc, i in dense)
+        bm25_scores = dict((i, sc) for sc, i in sparse)
+        for ranked in (dense, sparse):
+            for rank, (_, i) in enumerate(ranked):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + 1 + rank)
+        best = sorted(fused.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+        return [result(i, sc, dense_score=dense_scores.get(i), bm25_score=bm25_scores.get(i)) for i, sc in best]
+    def stats(self):
+        with self._lock:
+            return [dict(s, address=f"{a[0]}:{a[1]}", idle=len(self._idle[i])) for i, (a, s) in enumerate(zip(self.addresses, self._stats))]
+    def close(self):
+        with self._lock:
+            idle = [c for conns in self._idle for c in conns]
+            self._idle = [[] for _ in self.addresses]
+        for c in idle:
+            try:
+                c.close()
+            except Exception:
+                pass
+        if self._connector is not None:
+            self._connector.shutdown(wait=False)
+        for p in self.procs:
+            p.terminate()
+def from_spec(spec, authkey=None, timeout_ms=None):
+    spec = (spec or "").strip().lower()
+    if spec in ("", "0", "off", "false", "no"):
+        return None
+    key = authkey if authkey is not None else (SHARD_AUTHKEY.encode("utf-8") or None)
+    if spec.startswith("local:") or spec.isdigit():
+        count = int(spec.split(":", 1)[-1])
+        addresses, key, procs = start_local_shards(count, key)
+        sharded = ShardedRetriever(addresses, key, timeout_ms, procs)
+    else:
+        if key is None:
+            raise RuntimeError("SHARD_AUTHKEY is required to connect to remote retrieval shards")
+        sharded = ShardedRetriever(parse_addresses(spec), key, timeout_ms)
+    sharded.load_bm25_stats()
+    return sharded
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Serve one shard of the fallback corpus, or query a set of shards")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="serve shard INDEX of COUNT over multiprocessing.connection (needs SHARD_AUTHKEY)")
+    p.add_argument("--shard", type=int, required=True)
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7300)
+    p = sub.add_parser("query", help="query shards (local:N or host:port,...) and print hits and per-shard stats")
+    p.add_argument("question")
+    p.add_argument("--shards", default="local:2")
+    p.add_argument("--mode", default=os.getenv("RETRIEVAL_MODE", "hybrid").lower())
+    p.add_argument("-k", type=int, default=5)
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--timeout-ms", type=float, default=None)
+    args = ap.parse_args(argv)
+    if args.cmd == "serve":
+        if not SHARD_AUTHKEY:
+            print("set SHARD_AUTHKEY to serve a shard", file=sys.stderr)
+            return 1
+        print(f"shard {args.shard}/{args.shards} listening on {args.host}:{args.port}", file=sys.stderr, flush=True)
+        serve(args.shard, args.shards, (args.host, args.port), SHARD_AUTHKEY.encode("utf-8"))
+        return 0
+    t0 = time.perf_counter()
+    sharded = from_spec(args.shards, timeout_ms=args.timeout_ms)
+    print(f"{len(sharded)} shards ready in {time.perf_counter() - t0:.1f}s: {json.dumps(sharded.info())}", file=sys.stderr)
+    q_emb = None
+    if args.mode != "bm25":
+        try:
+            from model_registry import get_model
+            q_emb = get_model().encode(args.question, convert_to_numpy=True, normalize_embeddings=True)
+        except Exception as e:
+            print(f"dense search unavailable ({e}); using BM25 only", file=sys.stderr)
+    samples = []
+    for _ in range(max(1, args.repeat)):
+        t0 = time.perf_counter()
+        hits = sharded.search(args.question, args.k, q_emb=q_emb, mode=args.mode)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    for h in hits:
+        print(f"{h['score']:8.4f}  [{h['hotpot_idx']}] {h['source']}: {h['snippet'][:120]}")
+    print(f"p50 {samples[len(samples) // 2]:.2f} ms over {len(samples)} queries; {json.dumps(sharded.stats())}", file=sys.stderr)
+    sharded.close()
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import mmap
+import shutil
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+import embedding_store
+COMPILED_DIR = Path(os.getenv("COMPILED_STORE_DIR", str(embedding_store.DATA_DIR.joinpath("compiled"))))
+STORE_FILES = {
+    "hotpot": ("offsets.npy", "source_ids.npy", "sources.json", "text.bin"),
+    "retrieval": ("offsets.npy", "values.bin", "key_offsets.npy", "keys.bin"),
+}
+def iter_hotpot_snippets(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            title = obj.get("title") or obj.get("article_title") or obj.get("id") or "doc"
+            contexts = []
+            if "context" in obj and isinstance(obj["context"], list):
+                for c in obj["context"]:
+                    contexts.append(c)
+            elif "paragraphs" in obj and isinstance(obj["paragraphs"], list):
+                for p in obj["paragraphs"]:
+                    if isinstance(p, dict) and "context" in p:
+                        contexts.append(p["context"])
+            for t in contexts:
+                yield title, t
+def _store_dir(kind, path):
+    fp = embedding_store.corpus_fingerprint(path)
+    if fp is None:
+        return None
+    return COMPILED_DIR.joinpath(f"{kind}_{fp[:16]}")
+def _open_blob(path):
+    size = path.stat().st_size
+    if size == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+def _finish(tmp, out):
+    if out.exists():
+        shutil.rmtree(tmp, ignore_errors=True)
+        return out
+    try:
+        os.replace(tmp, out)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+class SnippetStore(Sequence):
+    def __init__(self, root):
+        import numpy as np
+        self.root = Path(root)
+        self.offsets = np.load(str(self.root.joinpath("offsets.npy")), mmap_mode="r")
+        self.source_ids = np.load(str(self.root.joinpath("source_ids.npy")), mmap_mode="r")
+        with open(self.root.joinpath("sources.json"), "r", encoding="utf-8") as f:
+            self.sources = json.load(f)
+        self.blob = _open_blob(self.root.joinpath("text.bin"))
+    def __len__(self):
+        return int(self.offsets.shape[0]) - 1
+    def text(self, i):
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+    def source(self, i):
+        return self.sources[int(self.source_ids[i])]
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        return {"source": self.source(i), "snippet": self.text(i)}
+    def texts(self):
+        for i in range(len(self)):
+            yield self.text(i)
+class RetrievalStore(Mapping):
+    def __init__(self, root):
+        import numpy as np
+        self.root = Path(root)
+        self.offsets = np.load(str(self.root.joinpath("offsets.npy")), mmap_mode="r")
+        self.key_offsets = np.load(str(self.root.joinpath("key_offsets.npy")), mmap_mode="r")
+        self.key_blob = _open_blob(self.root.joinpath("keys.bin"))
+        self.blob = _open_blob(self.root.joinpath("values.bin"))
+    def __len__(self):
+        return int(self.key_offsets.shape[0]) - 1
+    def _key(self, i):
+        return self.key_blob[int(self.key_offsets[i]):int(self.key_offsets[i + 1])]
+    def _row(self, key):
+        if not isinstance(key, str):
+            return None
+        target = key.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._key(lo) == target:
+            return lo
+        return None
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._key(i).decode("utf-8")
+    def __contains__(self, key):
+        return self._row(key) is not None
+    def __getitem__(self, key):
+        i = self._row(key)
+        if i is None:
+            raise KeyError(key)
+        return json.loads(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8"))
+def build_snippet_store(path):
+    out = _store_dir("hotpot", path)
+    if out is None:
+        raise RuntimeError(f"corpus file not found: {path}")
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    write_snippets(tmp, iter_hotpot_snippets(path))
+    return _finish(tmp, out)
+def write_snippets(root, pairs):
+    import numpy as np
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    offsets = [0]
+    source_ids = []
+    sources = {}
+    with open(root.joinpath("text.bin"), "wb") as blob:
+        for title, text in pairs:
+            data = str(text).encode("utf-8")
+            blob.write(data)
+            offsets.append(offsets[-1] + len(data))
+            source_ids.append(sources.setdefault(title, len(sources)))
+    np.save(str(root.joinpath("offsets.npy")), np.asarray(offsets, dtype=np.int64))
+    np.save(str(root.joinpath("source_ids.npy")), np.asarray(source_ids, dtype=np.int32))
+    with open(root.joinpath("sources.json"), "w", encoding="utf-8") as f:
+        json.dump(list(sources), f)
+    return root
+def build_retrieval_store(path, normalize):
+    import numpy as np
+    out = _store_dir("retrieval", path)
+    if out is None:
+        raise RuntimeError(f"retrieval file not found: {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        rr = json.load(f)
+    index = {}
+    for item in rr:
+        index[normalize(item.get("question", ""))] = item.get("retrieved", [])
+    del rr
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    offsets = [0]
+    key_offsets = [0]
+    with open(tmp.joinpath("keys.bin"), "wb") as keys, open(tmp.joinpath("values.bin"), "wb") as blob:
+        for q in sorted(index, key=lambda q: q.encode("utf-8")):
+            data = q.encode("utf-8")
+            keys.write(data)
+            key_offsets.append(key_offsets[-1] + len(data))
+            data = json.dumps(index[q], ensure_ascii=False).encode("utf-8")
+            blob.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(str(tmp.joinpath("offsets.npy")), np.asarray(offsets, dtype=np.int64))
+    np.save(str(tmp.joinpath("key_offsets.npy")), np.asarray(key_offsets, dtype=np.int64))
+    return _finish(tmp, out)
+def open_snippet_store(path):
+    try:
+        root = _store_dir("hotpot", path)
+        if root is None or not root.exists():
+            return None
+        return SnippetStore(root)
+    except Exception:
+        return None
+def open_retrieval_store(path):
+    try:
+        root = _store_dir("retrieval", path)
+        if root is None or not root.exists():
+            return None
+        return RetrievalStore(root)
+    except Exception:
+        return None
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Compile the HotpotQA corpus and retrieval results into memory-mapped stores")
+    ap.add_argument("--force", action="store_true")
+    args = ap.parse_args(argv)
+    import retriever
+    for kind, path, build in (("hotpot", retriever.HOTPOT_PATH, build_snippet_store), ("retrieval", retriever.RETRIEVAL_PATH, lambda p: build_retrieval_store(p, retriever._normalize_question))):
+        if not Path(path).exists():
+            print("skipping missing", path, file=sys.stderr)
+            continue
+        root = _store_dir(kind, path)
+        if root.exists() and (args.force or not all(root.joinpath(name).exists() for name in STORE_FILES[kind])):
+            shutil.rmtree(root)
+        if root.exists():
+            print("up to date:", root)
+            continue
+        print("compiled", path, "->", build(path))
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
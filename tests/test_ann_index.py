@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+import ann_index
+MIN_RECALL = 0.9
+def clustered(n=5000, d=64, clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, d)).astype(np.float32)
+    embs = centers[rng.integers(0, clusters, size=n)] + rng.normal(scale=0.3, size=(n, d)).astype(np.float32)
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+@pytest.fixture(scope="module")
+def embs():
+    return clustered()
+@pytest.fixture(scope="module")
+def queries(embs):
+    return ann_index.sample_queries(embs, n=200)
+def build(backend, embs, **params):
+    pytest.importorskip({"hnsw": "hnswlib", "ivfpq": "faiss"}[backend])
+    return ann_index.load_or_build(embs, key="test", backend=backend, save=False, min_rows=0, **params)
+@pytest.mark.parametrize("backend", ["hnsw", "ivfpq"])
+def test_recall_at_10(backend, embs, queries):
+    params = {"pq_m": 16} if backend == "ivfpq" else {}
+    idx = build(backend, embs, **params)
+    assert ann_index.recall_at_k(idx, embs, queries, k=10) >= MIN_RECALL
+def test_exact_backend_is_exact(embs, queries):
+    idx = ann_index.load_or_build(embs, backend="exact", save=False)
+    assert ann_index.recall_at_k(idx, embs, queries, k=10) == 1.0
+def test_hnsw_concurrent_search_matches_sequential(embs, queries):
+    idx = build("hnsw", embs, ef_search=16)
+    ks = [5, 200] * 50
+    expected = [idx.search(queries[i], k)[1] for i, k in enumerate(ks)]
+    with ThreadPoolExecutor(8) as pool:
+        got = list(pool.map(lambda a: idx.search(queries[a[0]], a[1])[1], enumerate(ks)))
+    for k, e, g in zip(ks, expected, got):
+        assert g.shape == (1, k) and (g >= 0).all()
+        np.testing.assert_array_equal(e, g)
+    assert idx.ef_search == idx.index.ef == 16
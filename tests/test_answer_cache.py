@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import answer_cache
+def unit(*xs):
+    v = np.asarray(xs, dtype=np.float32)
+    return v / np.linalg.norm(v)
+class Fingerprint:
+    def __init__(self):
+        self.value = "v1"
+    def __call__(self):
+        return self.value
+@pytest.fixture
+def fp():
+    return Fingerprint()
+def make(fp, **kwargs):
+    kwargs.setdefault("threshold", 0.9)
+    kwargs.setdefault("ttl_s", 0)
+    return answer_cache.AnswerCache(fingerprint_fn=fp, **kwargs)
+def test_exact_hit_ignores_case_and_spacing(fp):
+    cache = make(fp)
+    cache.store("Who founded Acme?", "answer", scope=("ui", 5))
+    value, info = cache.lookup("  who FOUNDED   acme? ", scope=("ui", 5))
+    assert value == "answer" and info["hit"] == "exact"
+    assert cache.lookup("Who founded Acme?", scope=("ui", 3)) == (None, None)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+def test_semantic_hit_above_threshold(fp):
+    cache = make(fp)
+    cache.store("Who founded Acme?", "answer", q_emb=unit(1, 0, 0, 0))
+    value, info = cache.lookup("Who was the founder of Acme?", q_emb=unit(1, 0.1, 0, 0))
+    assert value == "answer" and info["hit"] == "semantic" and info["similarity"] >= 0.9
+    assert cache.lookup("Who was the founder of Acme?", q_emb=unit(1, 1, 0, 0)) == (None, None)
+    assert cache.lookup("Who was the founder of Acme?", scope=("other",), q_emb=unit(1, 0.1, 0, 0)) == (None, None)
+    assert cache.stats()["semantic_hits"] == 1
+def test_semantic_hit_rejected_when_entities_differ(fp):
+    cache = make(fp)
+    cache.store("Who founded Acme?", "acme answer", q_emb=unit(1, 0, 0, 0))
+    assert cache.lookup("Who founded Globex?", q_emb=unit(1, 0.01, 0, 0)) == (None, None)
+def test_ttl_expiry(fp):
+    cache = make(fp, ttl_s=60)
+    cache.store("Who founded Acme?", "answer", q_emb=unit(1, 0, 0, 0))
+    assert cache.lookup("Who founded Acme?")[0] == "answer"
+    for entry in cache._entries.values():
+        entry["stored"] -= 120
+    assert cache.lookup("Who founded Acme?") == (None, None)
+    assert cache.stats()["expirations"] == 1 and cache.stats()["size"] == 0
+    assert not cache._live.any() and len(cache._free) == cache.capacity
+def test_lru_eviction_and_slot_reuse(fp):
+    cache = make(fp, capacity=2)
+    cache.store("Question A?", "a", q_emb=unit(1, 0, 0, 0))
+    cache.store("Question B?", "b", q_emb=unit(0, 1, 0, 0))
+    assert cache.lookup("Question A?")[0] == "a"
+    cache.store("Question C?", "c", q_emb=unit(0, 0, 1, 0))
+    assert cache.lookup("Question B?") == (None, None)
+    assert cache.lookup("Question A?")[0] == "a" and cache.lookup("Question C?")[0] == "c"
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["size"] == 2
+    slots = sorted(e["slot"] for e in cache._entries.values())
+    assert slots == [0, 1] and cache._free == []
+    assert cache._slot_key[cache._entries[("question c?", ())]["slot"]] == ("question c?", ())
+    value, info = cache.lookup("Question C again?", q_emb=unit(0, 0, 1, 0))
+    assert value == "c" and info["hit"] == "semantic"
+    assert cache.lookup("Question B again?", q_emb=unit(0, 1, 0, 0)) == (None, None)
+def test_restore_replaces_entry_in_place(fp):
+    cache = make(fp, capacity=2)
+    cache.store("Question A?", "a1", q_emb=unit(1, 0, 0, 0))
+    cache.store("Question A?", "a2", q_emb=unit(1, 0, 0, 0))
+    assert cache.stats()["size"] == 1 and len(cache._free) == 1
+    assert cache.lookup("Question A?")[0] == "a2"
+def test_fingerprint_change_invalidates(fp):
+    cache = make(fp)
+    cache.store("Who founded Acme?", "answer", q_emb=unit(1, 0, 0, 0))
+    fp.value = "v2"
+    assert cache.lookup("Who founded Acme?", q_emb=unit(1, 0, 0, 0)) == (None, None)
+    stats = cache.stats()
+    assert stats["invalidations"] == 1 and stats["size"] == 0 and stats["fingerprint"] == "v2"
+    cache.store("Who founded Acme?", "new answer")
+    assert cache.lookup("Who founded Acme?")[0] == "new answer"
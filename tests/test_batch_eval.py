@@ -0,0 +1,24 @@
+import json
+import batch_eval
+def write_rows(path, rows):
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+def test_compact_output_keeps_last_good_row_per_id(tmp_path):
+    out = tmp_path.joinpath("results.jsonl")
+    write_rows(out, [
+        {"id": "a", "answer": "first"},
+        {"id": "b", "answer": "LLM error: HTTP 503"},
+        {"id": "c", "answer": "ok", "verify_failed": True},
+        {"id": "a", "answer": "second"},
+        {"id": "d", "answer": "ok", "llm_failed": True},
+        {"id": "d", "answer": "retried"},
+    ])
+    assert batch_eval.compact_output(out) == {"a", "d"}
+    rows = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [(r["id"], r["answer"]) for r in rows] == [("a", "second"), ("d", "retried")]
+    assert batch_eval.completed_ids(out) == {"a", "d"}
+def test_failed_rows_are_not_completed():
+    assert batch_eval._failed_row({"id": "x", "answer": "fine", "verify_failed": True})
+    assert batch_eval._failed_row({"id": "x", "answer": "LLM not configured (OPENAI_API_KEY missing)."})
+    assert not batch_eval._failed_row({"id": "x", "answer": "fine"})
+def test_missing_output_is_empty(tmp_path):
+    assert batch_eval.compact_output(tmp_path.joinpath("none.jsonl")) == set()
@@ -0,0 +1,35 @@
+import pytest
+import cascade
+RETRIEVED = [
+    {"source": "Marie Curie", "snippet": "Marie Curie won the Nobel Prize in Physics in 1903. She was born in Warsaw."},
+    {"source": "Pierre Curie", "snippet": "Pierre Curie married Marie Curie in 1895."},
+]
+def verdict(claim, idx=None, retrieved=RETRIEVED):
+    return cascade.lexical_verdict(claim, idx, retrieved, cascade._evidence(retrieved))
+def test_contained_claim_is_accepted():
+    v, shortlisted = verdict("Marie Curie won the Nobel Prize in Physics in 1903.")
+    assert v["supported"] and v["lexical_match"] == "contained"
+    assert v["top_evidence_idxs"] == [0]
+    assert not shortlisted
+def test_contained_claim_with_annotation():
+    v, _ = verdict("Pierre Curie married Marie Curie", idx=1)
+    assert v["supported"] and v["annotated_evidence_idx"] == 1
+@pytest.mark.parametrize("claim", [
+    "Marie Curie did not win the Nobel Prize in Physics in 1903.",
+    "Marie Curie didn't win the Nobel Prize in Physics in 1903.",
+    "Marie Curie never won the Nobel Prize in Physics in 1903.",
+])
+def test_negated_claim_is_not_accepted(claim):
+    v, _ = verdict(claim)
+    assert v is None or not v["supported"]
+def test_role_swapped_claim_is_shortlisted_not_accepted():
+    v, shortlisted = verdict("Marie Curie married Pierre Curie in 1895.")
+    assert v is None
+    assert shortlisted
+def test_disjoint_claim_is_rejected():
+    v, shortlisted = verdict("Bananas are grown mostly in tropical climates.")
+    assert v is not None and not v["supported"]
+    assert v["lexical_match"] == "disjoint" and v["prob_supported"] == 0.0
+    assert not shortlisted
+def test_short_claim_is_left_to_later_tiers():
+    assert verdict("Curie won") == (None, False)
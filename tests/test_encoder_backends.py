@@ -0,0 +1,70 @@
+import random
+import pytest
+import numpy as np
+import synth
+import quantized_encoder
+from model_registry import DEFAULT_MODEL
+MIN_COSINE = 0.98
+MAX_SIM_DIFF = 0.05
+MAX_FLIP_RATE = 0.02
+THRESHOLD = 0.65
+@pytest.fixture(scope="module")
+def texts():
+    rng = random.Random(0)
+    return [s["snippet"] for s in synth.make_snippets(32, rng)] + synth.make_claims(32, rng)
+@pytest.fixture(scope="module")
+def requests():
+    import encoder_backends
+    return encoder_backends.make_requests(40, 6, 5, random.Random(1))
+def verdicts(model, requests):
+    import verifier
+    from evidence_cache import get_cache
+    cache = get_cache()
+    cache.clear()
+    cache.cache_dir = None
+    results = verifier.verify_claims_many(requests, sim_threshold=THRESHOLD, embedder=model)
+    return np.array([r["sim"] for res in results for r in res]), np.array([r["supported"] for res in results for r in res])
+@pytest.fixture(scope="module")
+def torch_model():
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    return quantized_encoder.load(DEFAULT_MODEL, "torch", device="cpu")
+@pytest.fixture(scope="module")
+def reference(torch_model, texts):
+    return torch_model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+@pytest.fixture(scope="module")
+def reference_verdicts(torch_model, requests):
+    return verdicts(torch_model, requests)
+def load_backend(backend):
+    if backend == "onnx-int8":
+        pytest.importorskip("onnxruntime")
+    return quantized_encoder.load(DEFAULT_MODEL, backend)
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx-int8"])
+def test_backend_verification_parity(backend, requests, reference_verdicts):
+    sims, supported = verdicts(load_backend(backend), requests)
+    ref_sims, ref_supported = reference_verdicts
+    assert sims.shape == ref_sims.shape and sims.size > 0
+    diff = float(np.abs(sims - ref_sims).max())
+    flips = float((supported != ref_supported).mean())
+    assert diff <= MAX_SIM_DIFF, f"{backend}: max |dsim| {diff:.4f}"
+    assert flips <= MAX_FLIP_RATE, f"{backend}: verdict flip rate {flips:.3f}"
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx-int8"])
+def test_backend_cosine_agrees_with_torch(backend, texts, reference):
+    model = load_backend(backend)
+    embs = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    assert embs.shape == reference.shape
+    cos = (embs * reference).sum(axis=1)
+    assert float(cos.min()) >= MIN_COSINE, f"{backend}: min cosine {cos.min():.4f}, mean {cos.mean():.4f}"
+    pairs = reference @ reference.T
+    assert np.abs(embs @ embs.T - pairs).max() < 0.05
+def test_store_key_depends_on_backend(monkeypatch, tmp_path):
+    import embedding_store
+    import model_registry
+    corpus = tmp_path.joinpath("corpus.jsonl")
+    corpus.write_text('{"text": "x"}\n', encoding="utf-8")
+    monkeypatch.setattr(embedding_store, "FINGERPRINTS_PATH", tmp_path.joinpath("fingerprints.json"))
+    keys = {}
+    for backend in ("torch", "torch-int8", "onnx-int8"):
+        monkeypatch.setattr(model_registry, "ENCODER_BACKEND", backend)
+        keys[backend] = embedding_store.store_key(path=corpus)
+    assert len(set(keys.values())) == 3
@@ -0,0 +1,35 @@
+import os
+import pytest
+torch = pytest.importorskip("torch")
+import evidence_cache
+def files(cache):
+    return sorted(p.stem for p in cache.cache_dir.glob("*/*.pt"))
+def put(cache, text, t):
+    k = cache.key(text, "m")
+    cache.put(k, [text], torch.zeros(1, 2))
+    os.utime(cache._disk_path(k), (t, t))
+    return k
+def test_disk_store_is_capped_by_mtime(tmp_path):
+    cache = evidence_cache.EvidenceCache(cache_dir=tmp_path, disk_max=10)
+    keys = [put(cache, f"snippet {i}", 1000 + i) for i in range(10)]
+    assert len(files(cache)) == 10
+    cache.clear()
+    assert cache.get(keys[0]) is not None
+    put(cache, "snippet 10", 2000)
+    assert len(files(cache)) == 9
+    assert cache.stats()["disk_evictions"] == 2
+    assert keys[0] in files(cache)
+    assert keys[1] not in files(cache) and keys[2] not in files(cache)
+def test_existing_files_count_towards_the_cap(tmp_path):
+    first = evidence_cache.EvidenceCache(cache_dir=tmp_path, disk_max=0)
+    for i in range(5):
+        put(first, f"snippet {i}", 1000 + i)
+    second = evidence_cache.EvidenceCache(cache_dir=tmp_path, disk_max=4)
+    put(second, "snippet 5", 2000)
+    assert len(files(second)) == 4
+    assert second.stats()["disk_evictions"] == 2
+def test_rewriting_an_entry_does_not_grow_the_count(tmp_path):
+    cache = evidence_cache.EvidenceCache(cache_dir=tmp_path, disk_max=3)
+    for _ in range(5):
+        put(cache, "same", 1000)
+    assert len(files(cache)) == 1 and cache.stats()["disk_evictions"] == 0
@@ -0,0 +1,31 @@
+import difflib
+import random
+import pytest
+pytest.importorskip("numpy")
+import fuzzy_index
+def keys(n=2000, seed=0):
+    rng = random.Random(seed)
+    words = ["who", "was", "the", "first", "Curie", "Warsaw", "born", "in", "1903", "Nobel", "prize", "Ünïcode", "?"]
+    out = ["", "abc", "İstanbul K"] + [" ".join(rng.choice(words) for _ in range(rng.randint(1, 9))) for _ in range(n)]
+    return list(dict.fromkeys(out))
+def test_char_table_is_built_with_the_index():
+    ks = keys()
+    order, lengths, counts = fuzzy_index.FuzzyIndex(ks)._chars
+    for row, i in enumerate(order.tolist()):
+        assert lengths[row] == len(ks[i])
+        assert (counts[row] == fuzzy_index._char_counts(ks[i])).all()
+    assert list(lengths) == sorted(lengths)
+def test_char_table_blocks_agree():
+    idx = fuzzy_index.FuzzyIndex(keys())
+    order, lengths, counts = idx._char_table(block=7)
+    assert (order == idx._chars[0]).all() and (counts == idx._chars[2]).all()
+def test_matches_difflib():
+    ks = keys()
+    idx = fuzzy_index.FuzzyIndex(ks)
+    rng = random.Random(1)
+    for q in rng.sample(ks, 200):
+        q = q[:-1] + "x" if q else "zz"
+        expected = difflib.get_close_matches(q, ks, n=1, cutoff=0.7)
+        assert idx.get_close_match(q, cutoff=0.7) == (expected[0] if expected else None)
+def test_empty_index():
+    assert fuzzy_index.FuzzyIndex([]).get_close_match("anything") is None
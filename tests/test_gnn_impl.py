@@ -0,0 +1,83 @@
+import pytest
+torch = pytest.importorskip("torch")
+import gnn_impl
+DIM = 16
+SNIPPETS = {
+    "s1": ["Marie Curie was born in Warsaw.", "She moved to Paris in 1891."],
+    "s2": ["Pierre Curie taught in Paris."],
+    "s3": ["The Seine flows through Paris.", "It is 777 km long.", "Warsaw lies on the Vistula."],
+}
+REQUESTS = [
+    (["Marie Curie was born in Warsaw.", "Curie moved to Paris."], [{"snippet": "s1"}, {"snippet": "s2"}]),
+    (["The Vistula flows through Warsaw."], [{"snippet": "s3"}]),
+]
+def unit(t):
+    return torch.nn.functional.normalize(t, dim=-1)
+@pytest.fixture
+def evidence():
+    gen = torch.Generator().manual_seed(0)
+    return {k: (sents, unit(torch.randn(len(sents), DIM, generator=gen))) for k, sents in SNIPPETS.items()}
+@pytest.fixture
+def claim_embs():
+    return unit(torch.randn(3, DIM, generator=torch.Generator().manual_seed(1)))
+def test_build_graph_shapes(evidence, claim_embs):
+    g = gnn_impl.build_graph(REQUESTS, claim_embs, evidence)
+    n_claims, n_sents = 3, 6
+    assert g["n_claims"] == n_claims
+    assert g["x"].shape == (n_claims + n_sents, DIM)
+    assert g["node_type"].tolist() == [0] * n_claims + [1] * n_sents
+    assert g["claim_feats"].shape == (n_claims, gnn_impl.CLAIM_FEATURES)
+    assert g["best_sent"].shape == (n_claims,)
+    e = g["edge_index"]
+    assert e.shape[0] == 2 and e.shape[1] > 0 and e.shape[1] % 2 == 0
+    assert g["edge_attr"].shape == (e.shape[1], gnn_impl.EDGE_FEATURES)
+    pairs = set(zip(e[0].tolist(), e[1].tolist()))
+    assert all((b, a) in pairs for a, b in pairs)
+    sent_range = {0: range(3, 6), 1: range(3, 6), 2: range(6, 9)}
+    for a, b in pairs:
+        if a < n_claims:
+            assert b in sent_range[a]
+    for c, s in enumerate(g["best_sent"].tolist()):
+        assert s in sent_range[c]
+    assert [len(p["sentences"]) for p in g["plans"]] == [3, 3]
+    assert g["plans"][0]["snippet_of"] == [0, 0, 1]
+    sims = (claim_embs @ g["x"][n_claims:].T)
+    for c in range(n_claims):
+        r = sent_range[c]
+        assert g["claim_feats"][c, 0].item() == pytest.approx(sims[c, r.start - n_claims:r.stop - n_claims].max().item(), abs=1e-5)
+def test_untrained_wrapper_thresholds_sim(evidence, claim_embs):
+    wrapper = gnn_impl.GNNWrapper(dim=DIM).eval()
+    g = gnn_impl.build_graph(REQUESTS, claim_embs, evidence)
+    with torch.inference_mode():
+        probs = torch.sigmoid(wrapper(g))
+    sims = g["claim_feats"][:, 0]
+    assert probs.shape == (3,)
+    assert ((probs >= gnn_impl.GNN_THRESHOLD) == (sims >= 0.65)).all()
+    expected = torch.sigmoid(12.0 * (sims - 0.65))
+    assert torch.allclose(probs, expected, atol=1e-6)
+class StubEmbedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        single = isinstance(texts, str)
+        out = torch.stack([self.vectors[t] for t in ([texts] if single else texts)])
+        return out[0] if single else out
+def test_untrained_predict_many_supported_matches_sim(monkeypatch):
+    import evidence_cache
+    import sentence_index
+    monkeypatch.setattr(sentence_index, "get_index", lambda: None)
+    cache = evidence_cache.get_cache()
+    cache.clear()
+    monkeypatch.setattr(cache, "cache_dir", None)
+    e = torch.eye(DIM)
+    vectors = {
+        "Marie Curie was born in Warsaw.": e[0],
+        "She moved to Paris in 1891.": e[1],
+        "Curie was born in Warsaw.": unit(e[0] + 0.2 * e[2]),
+        "Curie played football.": unit(0.5 * e[1] + e[3]),
+    }
+    requests = [(["Curie was born in Warsaw.", "Curie played football."], [{"snippet": "Marie Curie was born in Warsaw. She moved to Paris in 1891."}])]
+    wrapper = gnn_impl.GNNWrapper(dim=DIM).eval()
+    res = wrapper.predict_many(requests, {"embedder": StubEmbedder(vectors)})[0]
+    assert [r["supported"] for r in res] == [r["sim"] >= 0.65 for r in res] == [True, False]
+    assert res[0]["best_sentence"] == "Marie Curie was born in Warsaw."
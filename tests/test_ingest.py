@@ -0,0 +1,119 @@
+import json
+import hashlib
+import numpy as np
+import pytest
+import embedding_store
+import ingest
+import model_registry
+class StubEncoder:
+    dim = 32
+    def encode(self, texts, **kwargs):
+        single = isinstance(texts, str)
+        out = []
+        for t in [texts] if single else texts:
+            v = np.zeros(self.dim, dtype=np.float32)
+            for w in t.lower().split():
+                v[int(hashlib.md5(w.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+            out.append(v / max(float(np.linalg.norm(v)), 1e-9))
+        return out[0] if single else np.stack(out)
+ENCODER = StubEncoder()
+MODES = ("hybrid", "hybrid-union", "dense", "bm25")
+def paragraph(i):
+    return f"Paragraph {i} describes the town of Town{i} on the river Alpha."
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIVE_CORPUS_DIR", str(tmp_path.joinpath("live")))
+    monkeypatch.setenv("EMBEDDING_STORE_DIR", str(tmp_path.joinpath("embeddings")))
+    monkeypatch.setattr(embedding_store, "STORE_DIR", tmp_path.joinpath("embeddings"))
+    monkeypatch.setattr(embedding_store, "FINGERPRINTS_PATH", tmp_path.joinpath("embeddings", "fingerprints.json"))
+    monkeypatch.setattr(ingest, "LIVE_DIR", tmp_path.joinpath("live"))
+    monkeypatch.setattr(ingest, "_model", lambda name: ENCODER)
+    monkeypatch.setattr(model_registry, "ENCODER_BACKEND", "torch")
+    corpus = tmp_path.joinpath("corpus.jsonl")
+    corpus.write_text("".join(json.dumps({"title": f"T{i}", "paragraphs": [{"context": paragraph(i)}]}) + "\n" for i in range(40)), encoding="utf-8")
+    ingest.init(corpus, root=ingest.LIVE_DIR)
+    return ingest.LIVE_DIR
+def sources(live, question, k=50, mode="hybrid"):
+    return {r["source"] for r in live.search(question, k, encoder=ENCODER, mode=mode)}
+def test_init_writes_versioned_manifest(root):
+    manifest = ingest.read_manifest(root)
+    assert manifest["version"] == 1 and len(manifest["segments"]) == 1
+    assert manifest["model_key"] == model_registry.model_key()
+    assert ingest.status(root)["rows"] == 40
+    with pytest.raises(RuntimeError):
+        ingest.init(root=root)
+@pytest.mark.parametrize("mode", MODES)
+def test_search_finds_ingested_rows(root, mode):
+    out = ingest.ingest([("New", "A brand new paragraph about Town99 on the river Alpha.")], root=root, model=ENCODER)
+    assert out["added"] == 1 and out["segments"] == 2
+    live = ingest.LiveCorpus(root)
+    assert live.version == 2
+    assert "New" in sources(live, "Town99 river Alpha", mode=mode)
+    assert "T7" in sources(live, "Town7 river Alpha", k=5, mode=mode)
+def test_ingest_skips_known_rows(root):
+    out = ingest.ingest([("T3", paragraph(3))], root=root, model=ENCODER)
+    assert out == {"added": 0, "restored": 0, "deleted": 0, "unchanged": 1, "segments": 1}
+    assert ingest.read_manifest(root)["version"] == 1
+@pytest.mark.parametrize("mode", MODES)
+def test_deleted_sources_vanish_and_restored_rows_return(root, mode):
+    live = ingest.LiveCorpus(root, refresh_s=0)
+    assert ingest.delete(sources=["T1", "T2"], root=root) == {"deleted": 2}
+    live.refresh(force=True)
+    assert live.live_rows() == 38
+    found = sources(live, "Town1 Town2 river Alpha", mode=mode)
+    assert not found & {"T1", "T2"} and len(found) == 38
+    out = ingest.ingest([("T1", paragraph(1))], root=root, model=ENCODER)
+    assert out["restored"] == 1 and out["added"] == 0
+    live.refresh(force=True)
+    assert "T1" in sources(live, "Town1 river Alpha", k=5, mode=mode)
+    assert "T2" not in sources(live, "Town2 river Alpha", mode=mode)
+def test_sync_tombstones_missing_rows(root):
+    out = ingest.ingest([("T0", paragraph(0))], root=root, model=ENCODER, sync=True)
+    assert out["deleted"] == 39
+    assert ingest.status(root)["tombstones"] == 39
+def test_tombstone_overfetch_is_per_segment(root):
+    ingest.ingest([(f"N{i}", f"Extra paragraph {i} about Newtown{i}.") for i in range(5)], root=root, model=ENCODER)
+    ingest.delete(sources=[f"T{i}" for i in range(10)], root=root)
+    live = ingest.LiveCorpus(root)
+    base, extra = live.segments
+    assert len(base.dead_rows(live.tombstones)) == 10
+    assert len(extra.dead_rows(live.tombstones)) == 0
+    hits = live.bm25_search("river Alpha", 5)
+    assert len(hits) == 5 and all(seg_i == 0 for _, seg_i, _ in hits)
+    assert not {live.segments[s].hash(i) for _, s, i in hits} & live.tombstones
+def test_compact_drops_tombstones_and_defers_removal(root, monkeypatch):
+    ingest.ingest([("New", "A brand new paragraph about Town99 on the river Alpha.")], root=root, model=ENCODER)
+    ingest.delete(sources=["T5"], root=root)
+    stale = ingest.LiveCorpus(root)
+    old = ingest.read_manifest(root)["segments"]
+    out = ingest.compact(root)
+    assert out["compacted"] and out["rows"] == 40 and out["dropped"] == 1 and out["removed"] == 0
+    manifest = ingest.read_manifest(root)
+    assert manifest["tombstones"] == [] and len(manifest["segments"]) == 1
+    assert [r[0] for r in manifest["retired"]] == old
+    assert all(root.joinpath(name).exists() for name in old)
+    assert "New" in sources(stale, "Town99 river Alpha")
+    fresh = ingest.LiveCorpus(root)
+    assert len(fresh) == 40 and "T5" not in sources(fresh, "Town5 river Alpha")
+    monkeypatch.setattr(ingest, "SEGMENT_GRACE_S", 0.0)
+    out = ingest.compact(root, if_needed=True)
+    assert not out["compacted"] and out["removed"] == 2
+    assert not any(root.joinpath(name).exists() for name in old)
+    assert ingest.read_manifest(root)["retired"] == []
+def test_needs_compaction_on_tombstone_count(root, monkeypatch):
+    monkeypatch.setattr(ingest, "COMPACT_MAX_TOMBSTONES", 3)
+    monkeypatch.setattr(ingest, "COMPACT_TOMBSTONE_RATIO", 1.0)
+    ingest.delete(sources=["T1", "T2", "T3"], root=root)
+    assert not ingest.status(root)["needs_compaction"]
+    ingest.delete(sources=["T4"], root=root)
+    assert ingest.status(root)["needs_compaction"]
+def test_encoder_backend_mismatch(root, monkeypatch):
+    monkeypatch.setattr(model_registry, "ENCODER_BACKEND", "onnx-int8")
+    live = ingest.LiveCorpus(root)
+    assert live.mismatch
+    rows = live.search("Town7 river Alpha", 3, encoder=ENCODER, mode="hybrid")
+    assert rows and all(r.get("dense_score") is None for r in rows)
+    with pytest.raises(RuntimeError):
+        live.search("Town7", 3, encoder=ENCODER, mode="dense")
+    with pytest.raises(RuntimeError):
+        ingest.ingest([("New", "Another paragraph.")], root=root, model=ENCODER)
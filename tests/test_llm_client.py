@@ -0,0 +1,78 @@
+import json
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+pytest.importorskip("httpx")
+import llm_stub
+import llm_client
+ITEMS = [(f"question {i}?", [{"source": f"doc{i}", "snippet": f"Document {i} says the answer is {i}. More text."}]) for i in range(12)]
+EXPECTED = [f"1. Document {i} says the answer is {i}.\nEVIDENCE: 0" for i in range(len(ITEMS))]
+@pytest.fixture
+def stub():
+    servers = []
+    def start(**kwargs):
+        server, base_url = llm_stub.start_in_thread(**kwargs)
+        servers.append(server)
+        return server, base_url
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+def ask_many(base_url, items=ITEMS, concurrency=4, max_retries=4):
+    client = llm_client.LLMClient(api_key="stub", base_url=base_url, concurrency=concurrency, max_retries=max_retries, backoff_base=0.01, backoff_max=0.05)
+    async def run():
+        try:
+            return await llm_client.ask_llm_many_async(items, client=client, use_cache=False)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_transient_statuses(stub, status):
+    server, base_url = stub(fail_first=2, fail_statuses=(status,))
+    answers = ask_many(base_url)
+    assert answers == EXPECTED
+    assert not any(llm_client.is_failure(a) for a in answers)
+    assert server.requests == 3 * len(ITEMS)
+    assert server.failures == 2 * len(ITEMS)
+def test_gives_up_after_max_retries(stub):
+    server, base_url = stub(fail_first=10, fail_statuses=(503,))
+    answers = ask_many(base_url, items=ITEMS[:2], max_retries=2)
+    assert all(llm_client.is_failure(a) and "HTTP 503" in a for a in answers)
+    assert server.requests == 2 * 3
+def test_does_not_retry_bad_request(stub):
+    server, base_url = stub(fail_first=1, fail_statuses=(400,))
+    answers = ask_many(base_url)
+    assert all(llm_client.is_failure(a) and "HTTP 400" in a for a in answers)
+    assert server.requests == len(ITEMS)
+def test_concurrency_is_bounded(stub):
+    server, base_url = stub(latency=0.05)
+    answers = ask_many(base_url, concurrency=3)
+    assert answers == EXPECTED
+    assert server.max_active == 3
+class MalformedHandler(llm_stub.StubHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = self.server.bodies[min(self.server.requests, len(self.server.bodies) - 1)]
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+@pytest.mark.parametrize("body", [json.dumps({"choices": []}).encode("utf-8"), b"<html>gateway</html>"])
+def test_malformed_completion_is_a_failure(body):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MalformedHandler)
+    server.daemon_threads = True
+    server.bodies = [body]
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        host, port = server.server_address[:2]
+        answers = ask_many(f"http://{host}:{port}/v1", items=ITEMS[:1])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert llm_client.is_failure(answers[0])
+    assert "malformed completion" in answers[0]
+    assert server.requests == 1
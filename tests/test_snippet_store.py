@@ -0,0 +1,32 @@
+import json
+import pytest
+pytest.importorskip("numpy")
+import snippet_store
+QUESTIONS = ["who was marie curie?", "where is warsaw", "z", "ünïcode question", "ışık", "a", "a b", ""]
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(snippet_store, "COMPILED_DIR", tmp_path.joinpath("compiled"))
+    path = tmp_path.joinpath("retrieval_results.json")
+    rows = [{"question": q.upper() if q == "where is warsaw" else q, "retrieved": [{"source": q, "snippet": f"about {q}"}]} for q in QUESTIONS]
+    path.write_text(json.dumps(rows), encoding="utf-8")
+    snippet_store.build_retrieval_store(path, str.lower)
+    return snippet_store.open_retrieval_store(path)
+def test_lookup_by_binary_search(store):
+    assert len(store) == len(QUESTIONS)
+    for q in QUESTIONS:
+        assert q in store
+        assert store[q] == [{"source": q, "snippet": f"about {q}"}]
+        assert store.get(q) == store[q]
+    for q in ["who was marie curie", "b", "zz", "ünïcode", 3, None]:
+        assert q not in store
+        assert store.get(q) is None
+    with pytest.raises(KeyError):
+        store["missing"]
+def test_keys_are_read_from_the_mapped_blob(store):
+    assert not hasattr(store, "_rows")
+    keys = list(store.keys())
+    assert sorted(keys) == sorted(QUESTIONS)
+    assert [k.encode("utf-8") for k in keys] == sorted(k.encode("utf-8") for k in keys)
+def test_old_layout_falls_back(store, tmp_path):
+    store.root.joinpath("keys.bin").unlink()
+    assert snippet_store.open_retrieval_store(tmp_path.joinpath("retrieval_results.json")) is None
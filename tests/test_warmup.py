@@ -0,0 +1,28 @@
+import os
+import sys
+import subprocess
+import warmup
+TEST_IMPORT_BUDGET_S = float(os.getenv("TEST_IMPORT_BUDGET_S", str(max(warmup.IMPORT_BUDGET_S, 2.0))))
+def test_measure_import_loads_no_heavy_modules():
+    seconds, heavy = warmup.measure_import()
+    assert heavy == []
+    assert seconds > 0
+def test_import_budget():
+    ok, seconds, heavy = warmup.check_import_budget(TEST_IMPORT_BUDGET_S)
+    assert ok, (seconds, heavy)
+def test_light_modules_do_not_attempt_heavy_imports():
+    code = (
+        "import sys\n"
+        f"heavy = {warmup.HEAVY_MODULES!r}\n"
+        "tried = []\n"
+        "class Guard:\n"
+        "    def find_spec(self, name, path=None, target=None):\n"
+        "        if name.split('.')[0] in heavy:\n"
+        "            tried.append(name)\n"
+        "        return None\n"
+        "sys.meta_path.insert(0, Guard())\n"
+        f"import {', '.join(warmup.LIGHT_MODULES)}\n"
+        "print(','.join(sorted(set(tried))))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=str(warmup.Path(warmup.__file__).parent), capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
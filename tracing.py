@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from dotenv import load_dotenv
+load_dotenv()
+TRACING_ENABLED = os.getenv("TRACING", "1").lower() not in ("0", "false", "no", "off")
+TRACE_LOG = os.getenv("TRACE_LOG", "0").lower() not in ("0", "false", "no", "off")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+logger = logging.getLogger(__name__)
+_current = contextvars.ContextVar("trace", default=None)
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.events = {}
+    def observe(self, name, wall, cpu, items):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "items": 0, "hist": [0] * (len(self.buckets) + 1)}
+            s["calls"] += 1
+            s["wall"] += wall
+            s["cpu"] += cpu or 0.0
+            s["items"] += items or 0
+            s["hist"][bisect.bisect_left(self.buckets, wall)] += 1
+    def count(self, name, n=1):
+        with self._lock:
+            self.events[name] = self.events.get(name, 0) + n
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.events = {}
+    def snapshot(self):
+        with self._lock:
+            return {"stages": {k: dict(v, hist=list(v["hist"])) for k, v in self.stages.items()}, "events": dict(self.events)}
+    def render(self, prefix="hd"):
+        snap = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Wall time per pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, s in sorted(snap["stages"].items()):
+            cum = 0
+            for le, n in zip(self.buckets, s["hist"]):
+                cum += n
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cum}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s["calls"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["wall"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["calls"]}')
+        for metric, key, help_text in (("stage_cpu_seconds_total", "cpu", "Thread CPU time per pipeline stage."), ("stage_items_total", "items", "Items (claims, texts, candidates) processed per stage.")):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for name, s in sorted(snap["stages"].items()):
+                lines.append(f'{prefix}_{metric}{{stage="{name}"}} {s[key]}')
+        lines.append(f"# HELP {prefix}_events_total Match types, cache hits and other pipeline events.")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, n in sorted(snap["events"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+METRICS = Metrics()
+class Trace:
+    def __init__(self, name="request", **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.counters = {}
+        self.stages = []
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.wall_s = None
+        self._lock = threading.Lock()
+        self._token = None
+    def start(self):
+        self._token = _current.set(self)
+        return self
+    def finish(self, exc=None):
+        self.wall_s = time.perf_counter() - self._t0
+        if exc is not None:
+            self.attrs["error"] = f"{type(exc).__name__}: {exc}"
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)
+            self._token = None
+        if TRACE_LOG:
+            logger.info(json.dumps(self.to_dict(), default=str))
+        return self
+    def __enter__(self):
+        return self.start()
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        return False
+    def add_stage(self, record):
+        with self._lock:
+            self.stages.append(record)
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.id,
+                "name": self.name,
+                "started": self.started,
+                "wall_s": self.wall_s if self.wall_s is not None else time.perf_counter() - self._t0,
+                "attrs": dict(self.attrs),
+                "counters": dict(self.counters),
+                "stages": [dict(s) for s in self.stages],
+            }
+class _Stage:
+    __slots__ = ("name", "trace", "items", "attrs", "cpu", "_t0", "_c0")
+    def __init__(self, name, trace, items, cpu):
+        self.name = name
+        self.trace = trace
+        self.items = items
+        self.attrs = None
+        self.cpu = cpu
+    def set(self, **attrs):
+        if "items" in attrs:
+            self.items = attrs.pop("items")
+        if attrs:
+            self.attrs = dict(self.attrs or {}, **attrs)
+        return self
+    def __enter__(self):
+        self._c0 = time.thread_time() if self.cpu else None
+        self._t0 = time.perf_counter()
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._t0
+        cpu = (time.thread_time() - self._c0) if self.cpu else None
+        METRICS.observe(self.name, wall, cpu, self.items)
+        if self.trace is not None:
+            record = {"stage": self.name, "wall_s": wall, "cpu_s": cpu}
+            if self.items is not None:
+                record["items"] = self.items
+            if self.attrs:
+                record.update(self.attrs)
+            if exc is not None:
+                record["error"] = f"{type(exc).__name__}: {exc}"
+            self.trace.add_stage(record)
+        return False
+class _NoopStage:
+    __slots__ = ()
+    def set(self, **attrs):
+        return self
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        return False
+_NOOP = _NoopStage()
+def trace(name="request", **attrs):
+    return Trace(name, **attrs)
+def current():
+    return _current.get()
+def stage(name, items=None, cpu=True):
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Stage(name, _current.get(), items, cpu)
+def annotate(**attrs):
+    t = _current.get()
+    if t is not None:
+        t.attrs.update(attrs)
+def incr(name, n=1):
+    if not TRACING_ENABLED or not n:
+        return
+    METRICS.count(name, n)
+    t = _current.get()
+    if t is not None:
+        t.incr(name, n)
+def attach(t):
+    return _current.set(t)
+def detach(token):
+    _current.reset(token)
+async def bound(t, coro):
+    token = _current.set(t)
+    try:
+        return await coro
+    finally:
+        _current.reset(token)
+def render_metrics():
+    return METRICS.render()
+_server = None
+def start_metrics_server(port=None, host="127.0.0.1"):
+    global _server
+    port = METRICS_PORT if port is None else port
+    if _server is not None or not port:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            return
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            data = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    _server = server
+    return server
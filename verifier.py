@@ -1,11 +1,13 @@
 from functools import lru_cache
+import tracing
 @lru_cache(maxsize=1)
 def get_embedder():
     try:
-        from sentence_transformers import SentenceTransformer, util
+        from sentence_transformers import util
     except Exception:
         raise RuntimeError("sentence-transformers required")
-    m = SentenceTransformer("all-MiniLM-L6-v2")
+    from model_registry import get_model
+    m = get_model()
     return m, util
 def _split_into_sentences(text):
     import re
@@ -19,87 +21,112 @@ def _encode_texts(embedder, texts, batch_size=64):
         return None
     tensors = embedder.encode(texts, convert_to_tensor=True, batch_size=batch_size, show_progress_bar=False)
     return tensors
-def verify_claims(claims, retrieved, sim_threshold=0.65, top_k=3):
+def _snippet_sentence_embeddings(embedder, items):
+    from evidence_cache import get_cache
+    from model_registry import model_key
+    import sentence_index
+    cache = get_cache()
+    sent_index = sentence_index.get_index()
+    entries = {}
+    pending = {}
+    for item in items:
+        text = item.get("snippet", "")
+        if text in entries or text in pending:
+            continue
+        if sent_index is not None and item.get("hotpot_idx") is not None:
+            entry = sent_index.lookup(item["hotpot_idx"], text)
+            if entry is not None:
+                entries[text] = entry
+                tracing.incr("evidence_sentence_index_hits")
+                continue
+        key = cache.key(text, model_key())
+        entry = cache.get(key)
+        if entry is not None:
+            entries[text] = entry
+            tracing.incr("evidence_cache_hits")
+        else:
+            pending[text] = (key, _split_into_sentences(text))
+    tracing.incr("evidence_cache_misses", len(pending))
+    if pending:
+        flat = [sent for _, sents in pending.values() for sent in sents]
+        with tracing.stage("encode_evidence", items=len(flat)):
+            embs = _encode_texts(embedder, flat)
+        pos = 0
+        for text, (key, sents) in pending.items():
+            entries[text] = cache.put(key, sents, embs[pos:pos + len(sents)])
+            pos += len(sents)
+    return entries
+def _empty_result(claim, best_snippet=None):
+    return {"claim": claim, "best_snippet": best_snippet, "best_sentence": None, "sim": 0.0, "prob_supported": 0.0, "supported": False, "top_evidence_idxs": []}
+def verify_claims_many(requests, sim_threshold=0.65, top_k=3, embedder=None):
+    requests = [(list(claims), list(retrieved)) for claims, retrieved in requests]
+    with tracing.stage("verify", items=sum(len(claims) for claims, _ in requests)) as st:
+        st.set(requests=len(requests), snippets=sum(len(retrieved) for _, retrieved in requests))
+        return _verify_claims_many(requests, sim_threshold, top_k, embedder)
+def _verify_claims_many(requests, sim_threshold, top_k, embedder):
     try:
-        embedder, util = get_embedder()
+        model, util = get_embedder()
     except Exception:
-        out = []
-        for c in claims:
-            out.append({"claim": c, "best_snippet": (retrieved[0] if retrieved else None), "best_sentence": None, "sim": 0.0, "prob_supported": 0.0, "supported": False, "top_evidence_idxs": []})
-        return out
-    snippets = [r.get("snippet","") for r in retrieved]
-    if not snippets:
-        out = []
-        for c in claims:
-            out.append({"claim": c, "best_snippet": None, "best_sentence": None, "sim": 0.0, "prob_supported": 0.0, "supported": False, "top_evidence_idxs": []})
-        return out
-    snippet_sentences = []
-    snippet_index_map = []
-    for i, s in enumerate(snippets):
-        sents = _split_into_sentences(s)
-        for sent in sents:
-            snippet_sentences.append(sent)
-            snippet_index_map.append(i)
-    if snippet_sentences:
-        snippet_embs = _encode_texts(embedder, snippet_sentences)
-    else:
-        snippet_embs = None
-    results = []
-    for claim in claims:
-        claim_text = claim if isinstance(claim, str) else str(claim)
-        claim_emb = embedder.encode(claim_text, convert_to_tensor=True)
-        best_sim = -1.0
-        best_idx = -1
-        best_sent = None
-        sims_by_snippet = {}
-        if snippet_embs is not None:
-            sims = util.cos_sim(claim_emb, snippet_embs)[0]
-            sims_list = sims.cpu().tolist()
-            for sent_idx, sim_val in enumerate(sims_list):
-                snip_idx = snippet_index_map[sent_idx]
-                prev = sims_by_snippet.get(snip_idx, [])
-                prev.append((sim_val, sent_idx))
-                sims_by_snippet[snip_idx] = prev
-            per_snippet_best = {}
-            for snip_idx, vals in sims_by_snippet.items():
-                best_pair = max(vals, key=lambda x: x[0])
-                per_snippet_best[snip_idx] = best_pair[0]
-                if per_snippet_best[snip_idx] > best_sim:
-                    best_sim = per_snippet_best[snip_idx]
-                    best_idx = snip_idx
-                    sent_idx = best_pair[1]
-                    best_sent = snippet_sentences[sent_idx]
-            sorted_items = sorted(per_snippet_best.items(), key=lambda x: x[1], reverse=True)
-            top_idxs = [int(x[0]) for x in sorted_items[:top_k]]
-        else:
-            top_idxs = []
-            best_sim = -1.0
-            best_idx = -1
-        if best_idx == -1:
-            full_embs = _encode_texts(embedder, snippets)
-            if full_embs is not None:
-                sims_full = util.cos_sim(claim_emb, full_embs)[0].cpu().tolist()
-                for i_sim, s_val in enumerate(sims_full):
-                    if s_val > best_sim:
-                        best_sim = s_val
-                        best_idx = i_sim
-                top_idxs = sorted(range(len(sims_full)), key=lambda i: sims_full[i], reverse=True)[:top_k]
-            if best_idx >= 0 and best_idx < len(snippets):
-                best_sent = None
-        best_snippet = None
-        if best_idx >= 0 and best_idx < len(retrieved):
-            best_snippet = retrieved[best_idx]
-        prob_supported = float(max(min(best_sim, 1.0), -1.0)) if best_sim is not None else 0.0
-        if prob_supported < 0:
-            prob_supported = 0.0
-        supported = prob_supported >= sim_threshold
-        results.append({
-            "claim": claim_text,
-            "best_snippet": best_snippet,
-            "best_sentence": best_sent,
-            "sim": float(prob_supported),
-            "prob_supported": float(prob_supported),
-            "supported": bool(supported),
-            "top_evidence_idxs": top_idxs
-        })
-    return results
+        return [[_empty_result(c, retrieved[0] if retrieved else None) for c in claims] for claims, retrieved in requests]
+    embedder = embedder or model
+    import torch
+    claim_texts = []
+    plans = []
+    for claims, retrieved in requests:
+        texts = [c if isinstance(c, str) else str(c) for c in claims]
+        plans.append((len(claim_texts), texts))
+        claim_texts.extend(texts)
+    evidence = _snippet_sentence_embeddings(embedder, [r for claims, retrieved in requests if claims for r in retrieved])
+    with tracing.stage("encode_claims", items=len(claim_texts)):
+        claim_embs = _encode_texts(embedder, claim_texts)
+    out = []
+    for (claims, retrieved), (start, texts) in zip(requests, plans):
+        if not texts:
+            out.append([])
+            continue
+        if not retrieved:
+            out.append([_empty_result(c) for c in claims])
+            continue
+        c_embs = claim_embs[start:start + len(texts)]
+        sentences = []
+        local_seg = []
+        parts = []
+        for i, r in enumerate(retrieved):
+            sents, embs = evidence[r.get("snippet", "")]
+            sentences.extend(sents)
+            local_seg.extend([i] * len(sents))
+            parts.append(embs)
+        s_embs = torch.cat(parts).to(c_embs.device)
+        sims = util.cos_sim(c_embs, s_embs)
+        seg = torch.tensor(local_seg, dtype=torch.long, device=sims.device).unsqueeze(0).expand(sims.shape[0], -1)
+        per_snippet = torch.full((sims.shape[0], len(retrieved)), float("-inf"), dtype=sims.dtype, device=sims.device)
+        per_snippet = per_snippet.scatter_reduce(1, seg, sims, reduce="amax", include_self=True)
+        best_sims, best_cols = sims.max(dim=1)
+        order = torch.sort(per_snippet, dim=1, descending=True, stable=True).indices[:, :top_k]
+        best_sims = best_sims.cpu().tolist()
+        best_cols = best_cols.cpu().tolist()
+        order = order.cpu().tolist()
+        results = []
+        for ci, claim_text in enumerate(texts):
+            col = int(best_cols[ci])
+            best_idx = local_seg[col]
+            prob_supported = float(max(min(best_sims[ci], 1.0), -1.0))
+            if prob_supported < 0:
+                prob_supported = 0.0
+            results.append({
+                "claim": claim_text,
+                "best_snippet": retrieved[best_idx],
+                "best_sentence": sentences[col],
+                "sim": float(prob_supported),
+                "prob_supported": float(prob_supported),
+                "supported": bool(prob_supported >= sim_threshold),
+                "top_evidence_idxs": [int(x) for x in order[ci]]
+            })
+        out.append(results)
+    return out
+def verify_claims(claims, retrieved, sim_threshold=0.65, top_k=3, embedder=None):
+    return verify_claims_many([(claims, retrieved)], sim_threshold=sim_threshold, top_k=top_k, embedder=embedder)[0]
+def warmup():
+    get_embedder()
+    import sentence_index
+    sentence_index.get_index()
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import subprocess
+from pathlib import Path
+LIGHT_MODULES = ["retriever", "verifier", "llm_client", "gnn_loader", "gnn_impl"]
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers"]
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "1.0"))
+def warmup(embeddings=True, gnn=True):
+    timings = {}
+    t0 = time.perf_counter()
+    import retriever
+    retriever.warmup(embeddings=embeddings)
+    timings["retriever"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    import verifier
+    verifier.warmup()
+    timings["verifier"] = time.perf_counter() - t0
+    if gnn:
+        t0 = time.perf_counter()
+        import gnn_loader
+        gnn_loader.warmup()
+        timings["gnn"] = time.perf_counter() - t0
+    return timings
+def measure_import(modules=None):
+    modules = modules or LIGHT_MODULES
+    code = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        f"import {', '.join(modules)}\n"
+        "dt = time.perf_counter() - t\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(dt)\n"
+        "print(','.join(heavy))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=str(Path(__file__).parent), capture_output=True, text=True, check=True)
+    lines = out.stdout.strip().splitlines()
+    seconds = float(lines[0])
+    heavy = [m for m in (lines[1].split(",") if len(lines) > 1 else []) if m]
+    return seconds, heavy
+def check_import_budget(budget=None, modules=None):
+    budget = IMPORT_BUDGET_S if budget is None else budget
+    seconds, heavy = measure_import(modules)
+    return seconds <= budget and not heavy, seconds, heavy
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Warm up models and indexes, or check the import-time budget")
+    ap.add_argument("--check-import-budget", type=float, nargs="?", const=IMPORT_BUDGET_S, default=None, metavar="SECONDS")
+    ap.add_argument("--no-embeddings", action="store_true")
+    ap.add_argument("--no-gnn", action="store_true")
+    args = ap.parse_args(argv)
+    if args.check_import_budget is not None:
+        ok, seconds, heavy = check_import_budget(args.check_import_budget)
+        print(f"import {', '.join(LIGHT_MODULES)}: {seconds:.3f}s (budget {args.check_import_budget:.3f}s)")
+        if heavy:
+            print("heavy modules imported eagerly:", ", ".join(heavy))
+        return 0 if ok else 1
+    for name, seconds in warmup(embeddings=not args.no_embeddings, gnn=not args.no_gnn).items():
+        print(f"{name}: {seconds:.2f}s")
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())